@@ -1,15 +1,16 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-import os
-from Databank.Amazon_DynamoDB import AmazonDBConnectivity as ADC
-from Databank.Amazon_S3 import S3Manager
-from pipeline.fingerprinting import fingerprint_file, fingerprint_audio_stream
-from pipeline.record import record_audio
+from Databank.Song_Metadata import SongMetadataService
+from Databank.Storage import Storage, UploadProgress, content_key
+from pipeline.fingerprinting import fingerprint_audio_stream
+from pipeline.live import LiveRecognizer
+from pipeline.service import RecognitionClient
 from equalizer.features import equalizer_features
-from Databank.User_Management import UserManager
 import bcrypt
-import tempfile
 from streamlit import session_state
-from pipeline.audioconverter import convert_to_wav
+from pipeline.audioconverter import decode_audio
+from pipeline import settings
 
 
 # Initialize the Streamlit application
@@ -25,22 +26,35 @@ class StreamlitApp:
     Handles functionalities for a Streamlit-based song recognition and streaming application.
 
     The class provides methods for uploading songs with metadata, comparing uploaded or
-    recorded songs against a database, and streaming available songs. It relies on an
-    Amazon DynamoDB-based database manager (ADC) and an Amazon S3 manager for storage/streaming.
-
-    :ivar db_manager: Manages database operations, including storing/retrieving song metadata and
-        fingerprints in separate tables, SongsFingerprints and Hashes, in DynamoDB.
-    :type db_manager: ADC
-    :ivar bucket_name: Name of the S3 bucket used for song file storage.
-    :type bucket_name: str
-    :ivar s3_manager: Manages S3 operations, such as uploading and streaming song files.
-    :type s3_manager: S3Manager
+    recorded songs against a database, and streaming available songs. Songs, fingerprints,
+    song files and users are kept in the stores of a Storage, either DynamoDB and Amazon S3
+    or a local SQLite database and directory (see Databank/Storage.py).
+
+    :ivar db_manager_data: Stores and reads song metadata.
+    :type db_manager_data: AmazonDBConnectivity | SQLiteSongStore
+    :ivar db_manager_fingerprints: Stores and matches fingerprints, in the DynamoDB Hashes table,
+        the SQLite hashes table or a local memory-mapped fingerprint index.
+    :type db_manager_fingerprints: AmazonDBConnectivity | SQLiteHashStore | FingerprintIndex
+    :ivar s3_manager: Stores song files and returns the URLs they are streamed from.
+    :type s3_manager: S3Manager | LocalFileStore
+    :ivar user_manager: Stores user accounts.
+    :type user_manager: UserManager | SQLiteUserManager
+    :ivar song_id_allocator: Hands out Song IDs for uploads from an atomic counter of the songs store.
+    :type song_id_allocator: SongIdAllocator
+    :ivar metadata: Keyed, cached access to song metadata by SongID.
+    :type metadata: SongMetadataService
+    :ivar recognition_client: Client of the recognition service, or None to recognize in the app.
+    :type recognition_client: RecognitionClient | None
     """
-    def __init__(self, aws_access_key_id, aws_secret_access_key, region_name, songs_table_name, hashes_table_name, bucket_name, user_table):
-        self.db_manager_data = ADC(aws_access_key_id, aws_secret_access_key, region_name, songs_table_name)
-        self.db_manager_fingerprints = ADC(aws_access_key_id, aws_secret_access_key, region_name, hashes_table_name)
-        self.s3_manager = S3Manager(aws_access_key_id, aws_secret_access_key, region_name, bucket_name)
-        self.user_manager = UserManager(aws_access_key_id, aws_secret_access_key, region_name, user_table)
+    def __init__(self, storage: Storage, recognition_url=None):
+        self.db_manager_data = storage.songs
+        self.db_manager_fingerprints = storage.hashes
+        self.song_id_allocator = storage.songs.song_id_allocator
+        self.metadata = SongMetadataService(self.db_manager_data)
+        # With a recognition service, comparisons run there and the app only sends clips
+        self.recognition_client = RecognitionClient(recognition_url) if recognition_url else None
+        self.s3_manager = storage.blobs
+        self.user_manager = storage.users
 
     def authenticate_user(self):
         st.header("Login")
@@ -92,97 +106,95 @@ class StreamlitApp:
                 st.error("Please upload a valid MP3 or WAV file.")
                 return
 
+            upload, stored = None, False
             try:
+                data = uploaded_file.getvalue()
+                s3_key = content_key(data, uploaded_file.name)  # Identical files share one object
+
                 # Step 3: Assign Metadata
                 song_data = {
                     "artist": artist.strip() or "Unknown",
                     "title": title.strip() or "Unknown Title",
                     "album": album.strip() or "Unknown Album",
-                    "s3_key": f"songs/{uploaded_file.name}"
+                    "s3_key": s3_key
                 }
                 st.info(
                     f"Processing: Title='{song_data['title']}', Artist='{song_data['artist']}', Album='{song_data['album']}'")
 
+                # Step 4: Upload the song file to S3 straight from memory, while it is fingerprinted
+                progress = UploadProgress(len(data))
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    upload = executor.submit(self.s3_manager.upload_bytes, data, s3_key, progress)
 
-                # Step 4: Generate Song ID
-                song_id = self.db_manager_data.get_latest_song_id() + 1
-
-                # Step 5: Generate Fingerprints
-                st.info("Generating fingerprints for the song...")
-                file_type = os.path.splitext(uploaded_file.name)[1][1:]
-                # Save the uploaded file as a temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as temp:
-                    temp.write(uploaded_file.read())
-                    input_path = temp.name
-
-                # Ensure the output path is different from the input path
-                output_path = input_path.replace("." + input_path.split('.')[-1], "_converted.wav")
-
-                # Convert MP3 (or other formats) to WAV
-                convert_to_wav(input_path, output_path)
-
-                # Generate fingerprints from the converted WAV file
-                fingerprints = fingerprint_file(output_path)
-
-                if not fingerprints:
-                    st.error("Fingerprint generation failed. Cannot proceed with uploading.")
-                    return
+                    # Step 5: Generate Fingerprints
+                    st.info("Generating fingerprints for the song...")
+                    # Decode the upload in memory (MP3 or other formats) and fingerprint the samples
+                    audio_data = decode_audio(data)
+                    fingerprints = fingerprint_audio_stream(audio_data)
+
+                    existing_match = None
+                    if fingerprints:
+                        # Step 6: Check for an existing song and store metadata and fingerprints in one pass
+                        st.info("Checking for duplicates and storing the song in the database...")
+                        stored, existing_match = self.db_manager_data.store_song(
+                            song_data, fingerprints, hashes_db=self.db_manager_fingerprints,
+                            song_id_allocator=self.song_id_allocator
+                        )
 
-                # Step 6: Check for Existing Song
-                st.info("Checking if the song already exists in the database...")
-                existing_match = self.db_manager_fingerprints.find_song_by_hashes(fingerprints)
+                    # Step 7: Wait for the upload to finish
+                    progress_bar = st.progress(0.0, text="Uploading the song file to S3...")
+                    while not upload.done():
+                        progress_bar.progress(progress.fraction, text="Uploading the song file to S3...")
+                        time.sleep(0.1)
+                    progress_bar.progress(1.0, text="Upload finished.")
+                    uploaded = upload.result()
 
-                if existing_match:
-                    st.warning(f"The song already exists in the database.")
-                    # Compare Song ID from the match and fetch metadata
-                    song_id = existing_match.get('SongID', None)  # Extract SongID from the matched result
-                    if not song_id:
-                        st.error("No SongID found in the match data. Unable to fetch metadata.")
+                if not fingerprints or existing_match or not stored:
+                    if not fingerprints:
+                        st.error("Fingerprint generation failed. Cannot proceed with uploading.")
+                    elif existing_match:
+                        st.warning(f"The song already exists in the database.")
+                        # Look up the metadata of the matched song by its SongID
+                        self.show_song_metadata(existing_match)
                     else:
-                        # Fetch all metadata using the song_id
-                        metadata = next(
-                            (item for item in self.db_manager_data.fetch_item() if item.get('SongID') == song_id),
-                            None
-                        )
-
-                        if metadata:
-                            # If metadata found, display the details
-                            title = metadata.get('title', 'Unknown Title')
-                            artist = metadata.get('artist', 'Unknown Artist')
-                            album = metadata.get('album', 'Unknown Album')
-                            st.subheader(f"**Title**: {title}")
-                            st.write(f"**Artist**: {artist}")
-                            st.write(f"**Album**: {album}")
-                        else:
-                            st.error(f"Metadata not found for SongID: {song_id}")  # Display metadata or match information
+                        st.error("Failed to store the song metadata and fingerprints. Please try again.")
                     return
+                self.metadata.invalidate(self.db_manager_data.current_song_id)  # Show the new song right away
 
-                # Step 7: Store Metadata and Fingerprints in Separate Tables in DynamoDB
-                st.info("Storing song metadata in the SongsFingerprints table...")
-                stored_metadata = self.db_manager_data.store_metadata_in_songs_table(song_id, song_data)
-
-
-                st.info("Storing song fingerprints in the Hashes table...")
-                stored_hashes = self.db_manager_fingerprints.store_fingerprints_in_hashes_table(song_id, fingerprints)
-                #if not stored_hashes:
-                #    st.error("Failed to store the fingerprints in the Hashes table. Please try again.")
-                #    return
-
-                # Step 8: Upload Song File to S3
-                st.info("Uploading the song file to S3...")
-                # Save the uploaded file locally
-                with open(uploaded_file.name, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                # Upload to S3
-                self.s3_manager.upload_file(
-                    uploaded_file.name,
-                    f"songs/{uploaded_file.name}"  # Place files in the 'songs/' folder in S3
-                )
-
+                if uploaded is None:
+                    st.error("The song was stored, but uploading the song file failed.")
+                    return
                 st.success(f"Successfully uploaded '{song_data['title']}' by '{song_data['artist']}'!")
 
             except Exception as e:
                 st.error(f"Error occurred during upload: {str(e)}")
+            finally:
+                # Only the song stored with it may keep a newly uploaded file
+                if not stored and upload is not None and upload.exception() is None and upload.result():
+                    self.s3_manager.delete_file(s3_key)
+
+    def show_song_metadata(self, match):
+        """
+        Displays title, artist and album of a matched song.
+
+        :param match: Match dictionary containing the "SongID".
+        """
+        song_id = match.get('SongID', None)  # Extract SongID from the matched result
+        if not song_id:
+            st.error("No SongID found in the match data. Unable to fetch metadata.")
+            return
+
+        metadata = self.metadata.get(song_id)
+        if metadata:
+            # If metadata found, display the details
+            title = metadata.get('title', 'Unknown Title')
+            artist = metadata.get('artist', 'Unknown Artist')
+            album = metadata.get('album', 'Unknown Album')
+            st.subheader(f"**Title**: {title}")
+            st.write(f"**Artist**: {artist}")
+            st.write(f"**Album**: {album}")
+        else:
+            st.error(f"Metadata not found for SongID: {song_id}")
 
     def compare_uploaded_song(self):
         st.header("Compare Uploaded Song")
@@ -190,55 +202,29 @@ class StreamlitApp:
         if compare_file:
             if st.button("Compare"):
                 try:
-                    # Step 5: Generate Fingerprints
-                    st.info("Generating fingerprints for the song...")
-                    file_type = os.path.splitext(compare_file.name)[1][1:]
-                    # Save the uploaded file as a temporary file
-                    with tempfile.NamedTemporaryFile(delete=False,
-                                                     suffix=f".{compare_file.name.split('.')[-1]}") as temp:
-                        temp.write(compare_file.read())
-                        input_path = temp.name
-
-                    # Ensure the output path is different from the input path
-                    output_path = input_path.replace("." + input_path.split('.')[-1], "_converted.wav")
-
-                    # Convert MP3 (or other formats) to WAV
-                    convert_to_wav(input_path, output_path)
+                    if self.recognition_client:
+                        # The service decodes, fingerprints and matches the clip
+                        st.info("Sending the song to the recognition service...")
+                        match = self.recognition_client.recognise(compare_file.getvalue())
+                    else:
+                        # Step 5: Generate Fingerprints
+                        st.info("Generating fingerprints for the song...")
+                        # Decode the upload in memory (MP3 or other formats) and fingerprint the samples
+                        audio_data = decode_audio(compare_file.getvalue())
+                        fingerprints = fingerprint_audio_stream(audio_data)
 
-                    # Generate fingerprints from the converted WAV file
-                    fingerprints = fingerprint_file(output_path)
+                        if not fingerprints:
+                            st.error("Fingerprint generation failed. Cannot proceed with uploading.")
+                            return
 
-                    if not fingerprints:
-                        st.error("Fingerprint generation failed. Cannot proceed with uploading.")
-                        return
-
-                    st.info("Check Databse for match...")
-                    match = self.db_manager_fingerprints.find_song_by_hashes(fingerprints)
+                        st.info("Check Databse for match...")
+                        match = self.db_manager_fingerprints.find_song_by_hashes(fingerprints)
 
                     if match:
                         st.success("Match found!")
 
-                        # Compare Song ID from the match and fetch metadata
-                        song_id = match.get('SongID', None)  # Extract SongID from the matched result
-                        if not song_id:
-                            st.error("No SongID found in the match data. Unable to fetch metadata.")
-                        else:
-                            # Fetch all metadata using the song_id
-                            metadata = next(
-                                (item for item in self.db_manager_data.fetch_item() if item.get('SongID') == song_id),
-                                None
-                            )
-
-                            if metadata:
-                                # If metadata found, display the details
-                                title = metadata.get('title', 'Unknown Title')
-                                artist = metadata.get('artist', 'Unknown Artist')
-                                album = metadata.get('album', 'Unknown Album')
-                                st.subheader(f"**Title**: {title}")
-                                st.write(f"**Artist**: {artist}")
-                                st.write(f"**Album**: {album}")
-                            else:
-                                st.error(f"Metadata not found for SongID: {song_id}")
+                        # Look up the metadata of the matched song by its SongID
+                        self.show_song_metadata(match)
                     else:
                         st.warning("No match found.")
                 except Exception as e:
@@ -248,40 +234,17 @@ class StreamlitApp:
         st.header("Compare Recorded Song")
         if st.button("Record and Compare"):
             try:
-                # 1. Record audio as NumPy data
-                recorded_audio_data = record_audio()
-
-                # 2. Generate fingerprints using fingerprint_audio_stream
-                compare_hashes = fingerprint_audio_stream(recorded_audio_data)
-
-                # 3. Compare hashes with the database
-                match = self.db_manager_fingerprints.find_song_by_hashes(compare_hashes)
+                # 1.-3. Record, fingerprint and compare hop by hop until a song is recognized
+                with st.spinner(f"Listening (up to {settings.LIVE_MAX_SECONDS} seconds)..."):
+                    hashes_db = self.recognition_client or self.db_manager_fingerprints
+                    match, seconds = LiveRecognizer(hashes_db).listen()
 
                 # 4. Display the result
                 if match:
-                    st.success("Match found!")
-
-                    # Compare Song ID from the match and fetch metadata
-                    song_id = match.get('SongID', None)  # Extract SongID from the matched result
-                    if not song_id:
-                        st.error("No SongID found in the match data. Unable to fetch metadata.")
-                    else:
-                        # Fetch all metadata using the song_id
-                        metadata = next(
-                            (item for item in self.db_manager_data.fetch_item() if item.get('SongID') == song_id),
-                            None
-                        )
+                    st.success(f"Match found after {seconds:.1f} seconds!")
 
-                        if metadata:
-                            # If metadata found, display the details
-                            title = metadata.get('title', 'Unknown Title')
-                            artist = metadata.get('artist', 'Unknown Artist')
-                            album = metadata.get('album', 'Unknown Album')
-                            st.subheader(f"**Title**: {title}")
-                            st.write(f"**Artist**: {artist}")
-                            st.write(f"**Album**: {album}")
-                        else:
-                            st.error(f"Metadata not found for SongID: {song_id}")
+                    # Look up the metadata of the matched song by its SongID
+                    self.show_song_metadata(match)
                 else:
                     st.warning("No match found.")
             except Exception as e:
@@ -290,16 +253,34 @@ class StreamlitApp:
     def stream_uploaded_song(self):
         st.header("Stream Uploaded Songs")
 
-        # Fetch songs from the database
+        # Start keys of the pages visited so far; the last one is the current page
+        if "stream_page_keys" not in session_state:
+            session_state["stream_page_keys"] = [None]
+
+        # Fetch one page of songs from the database
         try:
-            # Fetch songs dynamically (can be cached for improved performance)
-            songs = self.db_manager_data.fetch_item()
+            page_keys = session_state["stream_page_keys"]
+            songs, next_key = self.metadata.page(settings.STREAM_PAGE_SIZE, page_keys[-1])
+            first_index = (len(page_keys) - 1) * settings.STREAM_PAGE_SIZE
+
+            previous_column, next_column = st.columns(2)
+            if previous_column.button("Previous page", disabled=len(page_keys) == 1):
+                page_keys.pop()
+                st.rerun()
+            if next_column.button("Next page", disabled=next_key is None):
+                page_keys.append(next_key)
+                st.rerun()
 
             if songs:
-                st.info("Songs found in the database:")
+                st.info(f"Songs {first_index + 1}-{first_index + len(songs)} in the database:")
+
+                # Check the files of the page and presign their URLs up front
+                s3_keys = [song['s3_key'] for song in songs if song.get('s3_key')]
+                stored_keys = self.s3_manager.existing_objects(s3_keys)
+                song_uris = self.s3_manager.get_presigned_urls(stored_keys)
 
                 # Display a list of songs with streaming buttons
-                for index, song in enumerate(songs):
+                for index, song in enumerate(songs, start=first_index):
                     title = song.get('Title', 'Unknown Title')
                     artist = song.get('Artist', 'Unknown Artist')
                     album = song.get('Album', 'Unknown Album')
@@ -316,22 +297,18 @@ class StreamlitApp:
                     st.write(f"**Artist**: {artist}")
                     st.write(f"**Album**: {album}")
 
+                    if s3_key not in stored_keys:
+                        st.warning(f"The file of '{title}' is missing in S3 and cannot be streamed.")
+                        continue
+
                     # Button to stream the song
                     if st.button(f"Stream {title}", key=f"stream-{index}"):
-                        with st.spinner("Fetching the song..."):  # Show a spinner while streaming is initialized
-                            try:
-                                try:
-                                    song_uri = self.s3_manager.get_presigned_url(s3_key)
-                                    if not song_uri:
-                                        st.error(f"Failed to generate a streaming URL for '{title}'.")
-                                    else:
-                                        # Stream the audio using the Streamlit audio player
-                                        st.audio(song_uri, format="audio/mp3")  # Use the URI to play the audio
-                                except Exception as e:
-                                    st.error(f"Error: The song '{title}' is missing or could not be accessed in S3. Details: {e}")
-                                    st.audio(song_uri, format="audio/mp3")  # Use the URI to play the audio
-                            except Exception as e:
-                                st.error(f"Error while streaming '{title}': {e}")
+                        song_uri = song_uris.get(s3_key)
+                        if not song_uri:
+                            st.error(f"Failed to generate a streaming URL for '{title}'.")
+                        else:
+                            # Stream the audio using the Streamlit audio player
+                            st.audio(song_uri, format="audio/mp3")  # Use the URI to play the audio
             else:
                 st.warning("No songs available in the database.")
 
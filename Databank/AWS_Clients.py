@@ -0,0 +1,79 @@
+import threading
+import boto3
+from botocore.config import Config
+from pipeline import settings
+
+_sessions = {}
+_clients = {}
+_lock = threading.Lock()
+_resources = threading.local()
+
+
+def client_config():
+    """
+    Connection settings shared by every AWS client of the process.
+
+    The connection pool is large enough for the thread pools of the batched reads
+    and writes, connections are kept alive between requests, and throttled requests
+    are retried in adaptive mode, which also slows down the client while it is throttled.
+
+    :return: botocore.config.Config
+    """
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=settings.AWS_TCP_KEEPALIVE,
+        retries={"mode": "adaptive", "max_attempts": settings.AWS_MAX_ATTEMPTS},
+    )
+
+
+def get_session(aws_access_key_id, aws_secret_access_key, region_name):
+    """
+    Returns the process-wide boto3 session for the given credentials, creating it on first use.
+
+    :return: boto3.session.Session
+    """
+    key = (aws_access_key_id, aws_secret_access_key, region_name)
+    with _lock:
+        if key not in _sessions:
+            _sessions[key] = boto3.session.Session(aws_access_key_id=aws_access_key_id,
+                                                   aws_secret_access_key=aws_secret_access_key,
+                                                   region_name=region_name)
+        return _sessions[key]
+
+
+def get_client(service_name, aws_access_key_id, aws_secret_access_key, region_name):
+    """
+    Returns the process-wide client of an AWS service, creating it on first use.
+
+    Clients are thread-safe, so every manager, thread and app session of the process
+    shares one client (and its connection pool) per service and credentials.
+
+    :param service_name: Service name, e.g. "dynamodb" or "s3".
+    :return: botocore.client.BaseClient
+    """
+    key = (service_name, aws_access_key_id, aws_secret_access_key, region_name)
+    session = get_session(aws_access_key_id, aws_secret_access_key, region_name)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = session.client(service_name, config=client_config())
+        return _clients[key]
+
+
+def get_resource(service_name, aws_access_key_id, aws_secret_access_key, region_name):
+    """
+    Returns the calling thread's resource of an AWS service, creating it on first use.
+
+    boto3 resources are not thread-safe, so there is one per thread (instead of one
+    per manager), each with the shared connection settings.
+
+    :param service_name: Service name, e.g. "dynamodb".
+    :return: boto3.resources.base.ServiceResource
+    """
+    if not hasattr(_resources, "cache"):
+        _resources.cache = {}
+    key = (service_name, aws_access_key_id, aws_secret_access_key, region_name)
+    if key not in _resources.cache:
+        session = get_session(aws_access_key_id, aws_secret_access_key, region_name)
+        with _lock:
+            _resources.cache[key] = session.resource(service_name, config=client_config())
+    return _resources.cache[key]
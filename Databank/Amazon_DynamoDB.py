@@ -1,5 +1,14 @@
-import boto3
+import numpy as np
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from botocore.exceptions import BotoCoreError, ClientError
+from pipeline import settings
+from pipeline.recognise import planned_match, unique_hash_pairs
+from Databank.AWS_Clients import get_client, get_resource
+from Databank.Song_Id_Allocator import SONG_ID_COUNTER, DynamoDBSongIdAllocator
+from Databank.Storage import store_new_song
 
 class AmazonDBConnectivity:
     """
@@ -11,7 +20,8 @@ class AmazonDBConnectivity:
     DynamoDB table. Users must provide AWS credentials, the region, and the table
     name to establish a connection.
 
-    :ivar dynamodb_client: Low-level DynamoDB client used for certain operations.
+    :ivar dynamodb_client: Low-level DynamoDB client used for certain operations, shared by the
+        whole process (see AWS_Clients).
     :type dynamodb_client: botocore.client.DynamoDB
     :ivar dynamodb_resource: High-level DynamoDB resource providing table-based operations.
     :type dynamodb_resource: boto3.resources.factory.dynamodb.ServiceResource
@@ -21,21 +31,18 @@ class AmazonDBConnectivity:
     :type current_song_id: int
     """
     def __init__(self, aws_access_key_id, aws_secret_access_key, region_name, table_name):
-        self.dynamodb_client = boto3.client(
-            'dynamodb',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name
-        )
-        self.dynamodb_resource = boto3.resource(
-            'dynamodb',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name
-        )
+        self._credentials = (aws_access_key_id, aws_secret_access_key, region_name)
+        self.dynamodb_client = get_client('dynamodb', *self._credentials)
         self.table_name = table_name
         self.current_song_id = 0
+        self._key_attributes = None
+        self._key_types = {}
+        self._song_id_allocator = None
 
+    @property
+    def dynamodb_resource(self):
+        """DynamoDB resource of the calling thread (boto3 resources are not thread-safe)."""
+        return get_resource('dynamodb', *self._credentials)
 
     def test_connectivity(self):
         try:
@@ -54,14 +61,94 @@ class AmazonDBConnectivity:
 
     def fetch_item(self):
         try:
-            table = self.dynamodb_resource.Table(self.table_name)
-            response = table.scan()
-            items = response.get("Items", [])
-            return items
+            return list(self.scan_items())
         except (BotoCoreError, ClientError) as e:
             print("Failed to fetch data:", e)
             return []
 
+    def scan_pages(self, page_size=None, start_key=None):
+        """
+        Scans the table page by page, following LastEvaluatedKey until the end.
+
+        :param page_size: Maximum number of items DynamoDB evaluates per page (None for up to 1 MB).
+        :param start_key: LastEvaluatedKey of a previous page to continue from.
+        :return: Generator of tuples (items, last_evaluated_key); the key is None on the last page.
+        """
+        table = self.dynamodb_resource.Table(self.table_name)
+        scan_args = {}
+        if page_size:
+            scan_args["Limit"] = page_size
+        if start_key:
+            scan_args["ExclusiveStartKey"] = start_key
+        while True:
+            response = table.scan(**scan_args)
+            items = [item for item in response.get("Items", []) if item.get("SongID") != SONG_ID_COUNTER]
+            last_key = response.get("LastEvaluatedKey")
+            yield items, last_key
+            if last_key is None:
+                return
+            scan_args["ExclusiveStartKey"] = last_key
+
+    def scan_items(self, page_size=None):
+        """
+        Yields every item of the table, reading it page by page.
+
+        :param page_size: Maximum number of items fetched per scan request.
+        :return: Generator of items.
+        """
+        for items, _ in self.scan_pages(page_size):
+            yield from items
+
+    def get_item(self, key):
+        """
+        Reads a single item by its primary key.
+
+        :param key: Dictionary with the key attributes, e.g. {"SongID": "42"}.
+        :return: The item, or None if it does not exist.
+        """
+        try:
+            table = self.dynamodb_resource.Table(self.table_name)
+            return table.get_item(Key=key).get("Item")
+        except (BotoCoreError, ClientError) as e:
+            print(f"Failed to get item {key}: {e}")
+            return None
+
+    def batch_get_items(self, keys, max_retries=8, batch_size=100):
+        """
+        Reads many items by primary key with BatchGetItem.
+
+        Keys are sent in batches of at most 100 (the BatchGetItem limit). Keys returned
+        as UnprocessedKeys are requested again with exponential backoff.
+
+        :param keys: List of key dictionaries, e.g. [{"SongID": "42"}, ...].
+        :param max_retries: Maximum number of retries for unprocessed keys per batch.
+        :param batch_size: Number of keys per BatchGetItem request.
+        :return: List of the items found, in no particular order.
+        """
+        serializer = TypeSerializer()
+        deserializer = TypeDeserializer()
+        unique_keys = list({tuple(sorted(key.items())): key for key in keys}.values())
+        items = []
+        for start in range(0, len(unique_keys), batch_size):
+            request = {self.table_name: {"Keys": [
+                {name: serializer.serialize(value) for name, value in key.items()}
+                for key in unique_keys[start:start + batch_size]
+            ]}}
+            for attempt in range(max_retries + 1):
+                response = self.dynamodb_client.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    items.append({k: deserializer.deserialize(v) for k, v in item.items()})
+                request = response.get("UnprocessedKeys") or {}
+                if not request:
+                    break
+                if attempt < max_retries:
+                    # Exponential backoff with jitter before asking for the unprocessed keys again
+                    time.sleep(min(5.0, 0.05 * 2 ** attempt) * random.uniform(0.5, 1.0))
+            else:
+                raise RuntimeError(f"{len(request[self.table_name]['Keys'])} keys were still unprocessed "
+                                   f"after {max_retries} retries.")
+        return items
+
     def update_item(self, key, update_expression, expression_attribute_names, expression_attribute_values):
         try:
             table = self.dynamodb_resource.Table(self.table_name)
@@ -84,99 +171,242 @@ class AmazonDBConnectivity:
         except (BotoCoreError, ClientError) as e:
             print("Failed to delete data:", e)
 
-    def store_song(self, song_data, hashes):
-        try:
-            if self.song_exists(hashes):
-                return False
-
-            self.current_song_id = self.get_latest_song_id() + 1
-            song_data["SongID"] = str(self.current_song_id)
+    def store_song(self, song_data, hashes, hashes_db=None, song_id_allocator=None, min_score=settings.MIN_MATCH_SCORE):
+        """
+        Stores a song unless it is already in the database (see Storage.store_new_song).
 
-            self.insert_item(song_data)
+        The hashes are looked up in batched queries and written with batched inserts.
+        The Song ID comes from an atomic counter (see Song_Id_Allocator) instead of a table scan.
 
-            for hash_item in hashes:
-                hash_item["SongID"] = song_data["SongID"]
-                self.insert_item(hash_item)
+        :param song_data: Dictionary containing song metadata (artist, title, album, etc.).
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :param hashes_db: Object storing the fingerprints (AmazonDBConnectivity or FingerprintIndex).
+            Defaults to this table.
+        :param song_id_allocator: SongIdAllocator handing out the Song ID. Defaults to a
+            counter item in this table.
+        :param min_score: Minimum number of time-aligned matches for a song to count as a duplicate.
+        :return: Tuple (stored, match): whether the song was stored, and the match of the
+            existing song if it is a duplicate (otherwise None).
+        """
+        return store_new_song(self, song_data, hashes, self if hashes_db is None else hashes_db,
+                              song_id_allocator or self.song_id_allocator, min_score, (BotoCoreError, ClientError))
 
-            return True
-        except ClientError as e:
-            print(f"Failed to store song: {e.response['Error']['Message']}")
-            return False
+    @property
+    def song_id_allocator(self):
+        """Song ID allocator using a counter item in this table (created on first use)."""
+        if self._song_id_allocator is None:
+            self._song_id_allocator = DynamoDBSongIdAllocator(self)
+        return self._song_id_allocator
 
     def get_latest_song_id(self):
         try:
-            response = self.dynamodb_resource.Table(self.table_name).scan()
-            items = response.get("Items", [])
-            if not items:
-                return 0
-            max_song_id = max(int(item["SongID"]) for item in items)
-            return max_song_id
+            table = self.dynamodb_resource.Table(self.table_name)
+            scan_args = {"ProjectionExpression": "SongID"}
+            max_song_id = 0
+            while True:
+                response = table.scan(**scan_args)
+                for item in response.get("Items", []):
+                    if str(item.get("SongID", "")).isdigit():  # Skips the counter item
+                        max_song_id = max(max_song_id, int(item["SongID"]))
+                if "LastEvaluatedKey" not in response:
+                    return max_song_id
+                scan_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
         except ClientError as e:
             print(f"Failed to get latest song ID: {e.response['Error']['Message']}")
             return 0
 
     def song_exists(self, hashes):
         try:
-            for hash_item in hashes:
-                if "Hash" not in hash_item:
-                    print("Hash key missing in hash_item")
-                    continue
-                result = self.find_song_by_hashes([hash_item])
-                if result:
-                    return True
-            return False
+            hashes = [hash_item for hash_item in hashes if "Hash" in hash_item]
+            return self.find_song_by_hashes(hashes) is not None
         except ClientError as e:
             print(f"Failed to check if song exists: {e.response['Error']['Message']}")
             return False
 
     def store_hashes(self, hashes):
         try:
-            for hash_item in hashes:
-                self.insert_item(hash_item)
-        except ClientError as e:
-            print(f"Failed to store hashes: {e.response['Error']['Message']}")
+            return self.batch_insert_items(hashes)
+        except (BotoCoreError, ClientError, RuntimeError) as e:
+            print(f"Failed to store hashes: {e}")
+            return 0
+
+    def get_key_attributes(self):
+        """
+        Returns the names of the primary key attributes of the table.
+
+        :return: List of key attribute names (partition key first).
+        """
+        if self._key_attributes is None:
+            response = self.dynamodb_client.describe_table(TableName=self.table_name)["Table"]
+            types = {attribute["AttributeName"]: attribute["AttributeType"]
+                     for attribute in response["AttributeDefinitions"]}
+            self._key_types = {key["AttributeName"]: types[key["AttributeName"]] for key in response["KeySchema"]}
+            self._key_attributes = list(self._key_types)
+        return self._key_attributes
+
+    def to_key_type(self, name, value):
+        """
+        Converts a value to the DynamoDB type of the given key attribute.
+
+        Fingerprints are integers, but older tables declare "Hash" (and possibly
+        "Offset") as String keys, so they are stored in their decimal string form there.
+
+        :param name: Attribute name.
+        :param value: Attribute value.
+        :return: The value as str for String keys, as int for Number keys, else unchanged.
+        """
+        self.get_key_attributes()
+        key_type = self._key_types.get(name)
+        if key_type == "S":
+            return str(value)
+        if key_type == "N":
+            return int(value)
+        return value
+
+    def batch_insert_items(self, items, max_workers=4, max_retries=8, batch_size=25):
+        """
+        Inserts many items with BatchWriteItem requests of up to 25 items each.
+
+        Items the service could not process (throttling) are retried with exponential
+        backoff. Several batches are written at the same time on a thread pool. Items
+        sharing the same primary key are collapsed to the last one, because a single
+        BatchWriteItem call rejects duplicate keys.
+
+        :param items: Iterable of item dictionaries.
+        :param max_workers: Number of batches written concurrently.
+        :param max_retries: Maximum number of retries for unprocessed items of a batch.
+        :param batch_size: Number of items per request (DynamoDB allows at most 25).
+        :return: Number of items written.
+        """
+        key_attributes = self.get_key_attributes()
+        unique_items = {}
+        for item in items:
+            item = {k: self.to_key_type(k, v) for k, v in item.items()}
+            unique_items[tuple(item.get(name) for name in key_attributes)] = item
+        items = list(unique_items.values())
+        if not items:
+            return 0
+
+        serializer = TypeSerializer()
+        batches = [
+            [{"PutRequest": {"Item": {k: serializer.serialize(v) for k, v in item.items()}}}
+             for item in items[i:i + batch_size]]
+            for i in range(0, len(items), batch_size)
+        ]
+
+        def write_batch(requests):
+            for attempt in range(max_retries + 1):
+                response = self.dynamodb_client.batch_write_item(RequestItems={self.table_name: requests})
+                requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                if not requests:
+                    return
+                if attempt < max_retries:
+                    # Exponential backoff with jitter before retrying the leftovers
+                    time.sleep(min(5.0, 0.05 * 2 ** attempt) * random.uniform(0.5, 1.0))
+            raise RuntimeError(f"{len(requests)} items were still unprocessed after {max_retries} retries.")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(write_batch, batches))
+        elapsed = time.perf_counter() - start
+
+        print(f"Stored {len(items)} items in {len(batches)} batches "
+              f"({len(items) / max(elapsed, 1e-9):.0f} items/s) in the table '{self.table_name}'.")
+        return len(items)
+
+    def fetch_items_by_hashes(self, hash_values, max_workers=8):
+        """
+        Fetches all items whose "Hash" attribute matches one of the given values.
+
+        Every hash is resolved with a keyed Query on the "Hash" partition key instead
+        of scanning the table. The queries run concurrently on a thread pool, which is
+        safe because they share the thread-safe low-level client.
+
+        :param hash_values: Iterable of hash values to look up.
+        :param max_workers: Number of queries to run at the same time.
+        :return: List of matching items as plain dictionaries.
+        """
+        serializer = TypeSerializer()
+        deserializer = TypeDeserializer()
+
+        def query_hash(hash_value):
+            query_args = {
+                "TableName": self.table_name,
+                "KeyConditionExpression": "#hash = :hash",
+                "ExpressionAttributeNames": {"#hash": "Hash"},
+                "ExpressionAttributeValues": {":hash": serializer.serialize(self.to_key_type("Hash", hash_value))},
+            }
+            items = []
+            while True:
+                response = self.dynamodb_client.query(**query_args)
+                for item in response.get("Items", []):
+                    items.append({k: deserializer.deserialize(v) for k, v in item.items()})
+                if "LastEvaluatedKey" not in response:
+                    return items
+                query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
-    def find_song_by_hashes(self, hashes):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return [item for items in executor.map(query_hash, hash_values) for item in items]
+
+    def lookup(self, hash_keys):
+        """
+        Finds all stored entries of the given hash values (same interface as FingerprintIndex.lookup).
+
+        :param hash_keys: Array of distinct query hash values.
+        :return: Tuple of arrays (query_index, song_ids, offsets), sorted by query_index, where
+            query_index is the position of the matching value in ``hash_keys``.
+        """
+        positions = {int(hash_value): index for index, hash_value in enumerate(hash_keys)}
+        items = self.fetch_items_by_hashes(list(positions))
+        query_index = np.array([positions[int(item["Hash"])] for item in items], dtype=np.int64)
+        order = np.argsort(query_index, kind="stable")
+        song_ids = np.array([str(item["SongID"]) for item in items], dtype=object)
+        offsets = np.array([int(item["Offset"]) for item in items], dtype=np.int64)
+        return query_index[order], song_ids[order], offsets[order]
+
+    def match_hashes(self, hashes):
+        """
+        Looks up the distinct query hashes with keyed queries and pairs every stored
+        entry that shares a hash with the query offsets of that hash.
+
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :return: Tuple (song_ids, db_offsets, query_offsets, query_count) as used by best_match.
+        """
+        query_offsets = {}  # Hash value -> set of offsets in the query
+        for hash_value, offset in unique_hash_pairs(hashes):
+            query_offsets.setdefault(hash_value, set()).add(offset)
+
+        song_ids, db_offsets, matched_offsets = [], [], []
+        for item in self.fetch_items_by_hashes(list(query_offsets)):
+            for offset in query_offsets.get(int(item["Hash"]), ()):
+                song_ids.append(str(item["SongID"]))
+                db_offsets.append(int(item["Offset"]))
+                matched_offsets.append(offset)
+        return song_ids, db_offsets, matched_offsets, len(query_offsets)
+
+    def find_song_by_hashes(self, hashes, min_score=settings.MIN_MATCH_SCORE):
         """
         Finds a song in the DynamoDB table by matching its hashes.
 
+        Every stored entry that shares a hash with the query votes for the difference
+        between its offset and the query offset, and the song with the most
+        time-aligned votes is returned. The distinct hashes are queried in rounds of
+        growing size, and no further rounds are queried once one song is clearly ahead.
+
         :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
-        :return: Filtered item if a match is found; otherwise, None.
+        :param min_score: Minimum number of time-aligned matches required to accept a song.
+        :return: Dictionary with "SongID", "Offset", "Score" and "Confidence" if a match is found; otherwise, None.
         """
         try:
-            match_count = 0  # Counter for hash matches
-            for hash_item in hashes:
-                # If hash_item is a tuple, extract the values
-                if isinstance(hash_item, tuple):
-                    hash_value = hash_item[0]  # Extract the hash value
-                    # Offset is not needed for comparison here
-                elif isinstance(hash_item, dict):
-                    hash_value = hash_item.get("Hash")  # Extract from dictionary
-                else:
-                    print("Invalid hash_item format. Skipping...")
-                    continue
-
-                # Fetch all items in the table
-                result = self.fetch_item()
-                if result:
-                    for item in result:
-                        # Compare the hash (item being checked is always a dictionary)
-                        if item.get("Hash") == hash_value:
-                            match_count += 1
-                            # If 10 matches are found, return the first matched item
-                            if match_count == 10:
-                                # Remove unwanted keys before returning match
-                                filtered_item = {k: v for k, v in item.items() if k not in ["s3_key", "Hash"]}
-                                return filtered_item
-            return None
-        except ClientError as e:
-            print(f"Failed to find song by hashes: {e.response['Error']['Message']}")
+            match, _ = planned_match(self.lookup, hashes, min_score=min_score)
+            return match
+        except (BotoCoreError, ClientError) as e:
+            print(f"Failed to find song by hashes: {e}")
             return None
 
     def list_all_records(self):
         try:
-            response = self.dynamodb_resource.Table(self.table_name).scan()
-            return response.get("Items", [])
+            return list(self.scan_items())
         except Exception as e:
             print(f"Failed to retrieve records: {str(e)}")
 
@@ -186,34 +416,41 @@ class AmazonDBConnectivity:
 
         :param song_id: Unique Song ID.
         :param song_data: Dictionary containing song metadata (artist, title, album, etc.).
+        :return: True if the metadata was stored, False otherwise.
         """
         try:
             table = self.dynamodb_resource.Table(self.table_name)  # Dynamically use the table name
             song_data["SongID"] = str(song_id)  # Include the Song ID
             table.put_item(Item=song_data)  # Insert the item into the table
             print("Metadata stored successfully in the table.")
+            return True
         except (BotoCoreError, ClientError) as e:
             print(f"Failed to store metadata in the table '{self.table_name}': {e}")
+            return False
 
     def store_fingerprints_in_hashes_table(self, song_id, fingerprints):
         """
         Stores song fingerprints in the dynamically specified table.
 
         :param song_id: Unique Song ID associated with the fingerprints.
-        :param fingerprints: List of tuples, each containing a hash value and its offset.
+        :param fingerprints: List of tuples, each containing a packed hash value and its frame offset.
+        :return: Number of fingerprints written.
         """
         try:
-            table = self.dynamodb_resource.Table(self.table_name)  # Dynamically use the Hashes table
-            for fingerprint in fingerprints:
-                fingerprint_data = {
-                    "Hash": fingerprint[0],  # Hash value
-                    "Offset": fingerprint[1],  # Time offset
+            fingerprint_items = (
+                {
+                    "Hash": int(fingerprint[0]),  # Packed hash value
+                    "Offset": int(fingerprint[1]),  # Time offset in frames
                     "SongID": str(song_id)  # Associated Song ID
                 }
-                table.put_item(Item=fingerprint_data)  # Insert the item into the table
+                for fingerprint in fingerprints
+            )
+            stored = self.batch_insert_items(fingerprint_items)
             print(f"Fingerprints stored successfully in the table '{self.table_name}'.")
-        except (BotoCoreError, ClientError) as e:
+            return stored
+        except (BotoCoreError, ClientError, RuntimeError) as e:
             print(f"Failed to store fingerprints in the table '{self.table_name}': {e}")
+            return 0
 
 
 
@@ -1,5 +1,10 @@
-import boto3
+import io
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+from Databank.AWS_Clients import get_client
+from Databank.Song_Metadata import MetadataCache
+from pipeline import settings
 
 class S3Manager:
     """
@@ -10,20 +15,33 @@ class S3Manager:
     with AWS credentials and basic configuration details, enabling interaction
     with the specified S3 bucket.
 
-    :ivar s3: Boto3 client used to communicate with Amazon S3.
+    :ivar s3: Boto3 client used to communicate with Amazon S3, shared by the whole process.
     :type s3: botocore.client.BaseClient
     :ivar bucket_name: Name of the S3 bucket to manage.
     :type bucket_name: str
+    :ivar transfer_config: Multipart settings of uploads (part size and parts sent in parallel).
+    :type transfer_config: boto3.s3.transfer.TransferConfig
+    :ivar presigned_urls: Presigned URLs by key, served until shortly before they expire.
+    :type presigned_urls: MetadataCache
+    :ivar known_objects: Keys known to exist, set by uploads and checks and removed by deletes.
+    :type known_objects: MetadataCache
+    :ivar missing_objects: Keys found missing, kept for a short time so pages do not check them on every render.
+    :type missing_objects: MetadataCache
     """
     def __init__(self, aws_access_key_id, aws_secret_access_key, region_name, bucket_name):
         try:
-            self.s3 = boto3.client(
-                's3',
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-                region_name=region_name
-            )
+            self.s3 = get_client('s3', aws_access_key_id, aws_secret_access_key, region_name)
             self.bucket_name = bucket_name
+            self.transfer_config = TransferConfig(
+                multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+                multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+                max_concurrency=settings.S3_MAX_CONCURRENCY,
+                use_threads=True
+            )
+            self.presigned_urls = MetadataCache(
+                ttl=settings.PRESIGNED_URL_EXPIRY - settings.PRESIGNED_URL_MARGIN)
+            self.known_objects = MetadataCache(ttl=settings.S3_EXISTENCE_TTL)
+            self.missing_objects = MetadataCache(ttl=settings.S3_MISSING_TTL)
         except (NoCredentialsError, PartialCredentialsError) as e:
             print(f"Failed to connect to S3: {e}")
 
@@ -31,13 +49,85 @@ class S3Manager:
         try:
             if object_name is None:
                 object_name = file_name
-            self.s3.upload_file(file_name, self.bucket_name, object_name)
+            self.s3.upload_file(file_name, self.bucket_name, object_name, Config=self.transfer_config)
             print(f"File {file_name} uploaded to {self.bucket_name}/{object_name}")
         except ClientError as e:
             print(f"Failed to upload file: {e.response['Error']['Message']}")
         except Exception as e:
             print(f"An error occurred: {e}")
 
+    def upload_fileobj(self, fileobj, object_name, callback=None):
+        """
+        Uploads a file-like object (e.g. an uploaded file held in memory) to the bucket.
+
+        Large files are sent as a multipart upload with several parts in flight at once.
+
+        :param fileobj: Readable binary file-like object.
+        :param object_name: Key of the object in the bucket.
+        :param callback: Optional function called with the number of bytes sent, from the transfer threads.
+        :return: True if the file was uploaded, False otherwise.
+        """
+        try:
+            self.s3.upload_fileobj(fileobj, self.bucket_name, object_name, Config=self.transfer_config,
+                                   Callback=callback)
+            print(f"File uploaded to {self.bucket_name}/{object_name}")
+            self._remember(object_name, True)
+            return True
+        except ClientError as e:
+            print(f"Failed to upload file: {e.response['Error']['Message']}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        return False
+
+    def upload_bytes(self, data, object_name, callback=None):
+        """
+        Uploads file content held in memory, unless an object with this name already exists.
+
+        With a content-derived name (see Storage.content_key) an existing object has the
+        same content, so repeated uploads of a file are skipped.
+
+        :param data: File content as bytes.
+        :param object_name: Key of the object in the bucket.
+        :param callback: Optional function called with the number of bytes sent.
+        :return: True if the file was uploaded, False if it already existed, None if the upload failed.
+        """
+        try:
+            exists = self.object_exists(object_name)
+        except ClientError as e:
+            print(f"Failed to check file {object_name}: {e.response['Error']['Message']}")
+            return None
+        if exists:
+            print(f"File {self.bucket_name}/{object_name} already exists, skipping the upload")
+            if callback:
+                callback(len(data))
+            return False
+        return True if self.upload_fileobj(io.BytesIO(data), object_name, callback) else None
+
+    def object_exists(self, object_name):
+        """
+        Checks whether an object exists with a ListObjectsV2 request limited to one key.
+
+        The key itself is the first key starting with it, so a single listed key answers
+        the question. The result is recorded in known_objects or missing_objects.
+
+        :param object_name: Key of the object.
+        :return: True if the object exists.
+        :raises ClientError: If the bucket cannot be listed (e.g. access denied).
+        """
+        response = self.s3.list_objects_v2(Bucket=self.bucket_name, Prefix=object_name, MaxKeys=1)
+        exists = any(item["Key"] == object_name for item in response.get("Contents", []))
+        self._remember(object_name, exists)
+        return exists
+
+    def delete_file(self, object_name):
+        try:
+            self.s3.delete_object(Bucket=self.bucket_name, Key=object_name)
+            self.presigned_urls.invalidate(object_name)
+            self._remember(object_name, False)
+            print(f"File {self.bucket_name}/{object_name} deleted")
+        except ClientError as e:
+            print(f"Failed to delete file: {e.response['Error']['Message']}")
+
     def download_file(self, object_name, file_name=None):
         try:
             if file_name is None:
@@ -50,13 +140,79 @@ class S3Manager:
             print(f"An error occurred: {e}")
             return None
 
-    def get_presigned_url(self, s3_key, expiry=3600):
+    def get_presigned_url(self, s3_key, expiry=settings.PRESIGNED_URL_EXPIRY):
+        """
+        Returns a presigned GET URL of an object.
+
+        URLs with the default expiry are cached and reused until PRESIGNED_URL_MARGIN
+        seconds before they expire, so the same song keeps the same URL (and the
+        browser can reuse what it already loaded).
+
+        :param s3_key: Key of the object.
+        :param expiry: Lifetime of a new URL in seconds.
+        :return: The URL, or None if it could not be generated.
+        """
+        cached = expiry == settings.PRESIGNED_URL_EXPIRY
+        if cached:
+            url = self.presigned_urls.get(s3_key)
+            if url is not None:
+                return url
         try:
-            response = self.s3.generate_presigned_url('get_object', Params={
+            url = self.s3.generate_presigned_url('get_object', Params={
                 'Bucket': self.bucket_name,
                 'Key': s3_key
             }, ExpiresIn=expiry)
-            return response
+            if cached:
+                self.presigned_urls.put(s3_key, url)
+            return url
         except Exception as e:
             print(f"Error generating presigned URL: {e}")  # Log error
             return None
+
+    def get_presigned_urls(self, s3_keys):
+        """
+        Returns cached or new presigned URLs for several objects, e.g. the songs of one page.
+
+        :param s3_keys: Iterable of object keys.
+        :return: Dictionary key -> URL for the keys whose URL could be generated.
+        """
+        urls = {s3_key: self.get_presigned_url(s3_key) for s3_key in set(s3_keys)}
+        return {s3_key: url for s3_key, url in urls.items() if url}
+
+    def existing_objects(self, s3_keys):
+        """
+        Checks which objects exist, e.g. the song files of one page.
+
+        Keys that were recently uploaded or found are answered from known_objects
+        (for up to settings.S3_EXISTENCE_TTL seconds), and keys found missing from
+        missing_objects (for settings.S3_MISSING_TTL seconds). The other keys are
+        checked with one-key listings (see object_exists) sent in parallel, so the
+        cost depends on the number of keys, not on the size of the bucket.
+
+        :param s3_keys: Iterable of object keys.
+        :return: Set of the keys that exist.
+        """
+        s3_keys = set(s3_keys)
+        existing = {s3_key for s3_key in s3_keys if self.known_objects.get(s3_key)}
+        unknown = sorted(s3_key for s3_key in s3_keys - existing if not self.missing_objects.get(s3_key))
+        if unknown:
+            with ThreadPoolExecutor(max_workers=min(len(unknown), settings.S3_MAX_CONCURRENCY)) as executor:
+                for s3_key, exists in zip(unknown, executor.map(self._check_object, unknown)):
+                    if exists:
+                        existing.add(s3_key)
+        return existing
+
+    def _remember(self, object_name, exists):
+        if exists:
+            self.known_objects.put(object_name, True)
+            self.missing_objects.invalidate(object_name)
+        else:
+            self.known_objects.invalidate(object_name)
+            self.missing_objects.put(object_name, True)
+
+    def _check_object(self, object_name):
+        try:
+            return self.object_exists(object_name)
+        except ClientError as e:
+            print(f"Failed to check file {object_name}: {e.response['Error']['Message']}")
+            return False
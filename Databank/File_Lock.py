@@ -0,0 +1,48 @@
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lock_file(file):
+    """
+    Blocks until this process holds an exclusive lock on an open file.
+
+    :param file: File object opened for writing.
+    """
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def unlock_file(file):
+    """
+    Releases the lock taken with lock_file.
+
+    :param file: The locked file object.
+    """
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def exclusive_lock(path):
+    """
+    Serializes a block of code across the processes of a machine with a lock file.
+
+    :param path: Path of the lock file (created if missing, never deleted).
+    """
+    with open(path, "a+") as file:
+        lock_file(file)
+        try:
+            yield
+        finally:
+            unlock_file(file)
@@ -0,0 +1,401 @@
+import json
+import os
+import threading
+import numpy as np
+from Databank.File_Lock import exclusive_lock
+from pipeline import settings
+from pipeline.hash_format import get_format
+from pipeline.recognise import planned_match, unique_hash_pairs
+
+MAGIC = b"TSFIDX01"
+ALIGNMENT = 64  # Byte alignment of every array inside the index file
+
+
+def to_hash_keys(hash_values):
+    """
+    Converts packed hash values (integers or their string form) to uint32 index keys.
+
+    :param hash_values: Iterable of hash values.
+    :return: NumPy array of uint32 keys.
+    """
+    return np.array([int(value) for value in hash_values], dtype=np.int64).astype(np.uint32)
+
+
+def _align(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def _csr(keys, song_ids, offsets):
+    """Sorts postings by key into CSR arrays (keys, indptr, song_ids, offsets)."""
+    order = np.argsort(keys, kind="stable")
+    unique_keys, counts = np.unique(keys[order], return_counts=True)
+    indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.uint64)
+    return unique_keys, indptr, song_ids[order], offsets[order]
+
+
+def _find(keys, indptr, hash_keys):
+    """Returns the positions of the query keys found in a CSR key array, with the start and length of their postings."""
+    positions = np.searchsorted(keys, hash_keys)
+    found = positions < len(keys)
+    found[found] = keys[positions[found]] == hash_keys[found]
+    starts = indptr[positions[found]].astype(np.int64)
+    lengths = indptr[positions[found] + 1].astype(np.int64) - starts
+    return np.flatnonzero(found), starts, lengths
+
+
+def _expand(query_index, starts, lengths, song_ids, offsets):
+    # Expand every [start, start + length) range into posting positions
+    posting_index = np.arange(int(lengths.sum())) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.repeat(query_index, lengths), song_ids[posting_index], offsets[posting_index]
+
+
+class FingerprintIndex:
+    """
+    Local inverted index from hash keys to (song_id, offset) postings.
+
+    The index is stored in CSR layout: a sorted array of unique 32-bit hash keys,
+    an ``indptr`` array with the start of every key's postings, and the packed
+    posting arrays ``song_ids`` and ``offsets``. All arrays live in a single base
+    file that is memory-mapped on load, so startup is fast and several processes
+    share the same pages. It can be used instead of the DynamoDB Hashes table,
+    since it offers the same ``store_fingerprints_in_hashes_table`` and
+    ``find_song_by_hashes`` methods.
+
+    New postings are appended to a delta file next to the base file, so saving a
+    song costs time proportional to the song, not to the index. Once the delta
+    holds more than ``INDEX_DELTA_RATIO`` times the postings of the base, it is
+    merged into a new base file, which keeps the total rewrite cost linear in the
+    size of the index. Appends and merges run under an exclusive file lock, so
+    several processes can write to the same index without losing postings.
+
+    :ivar path: Path of the index file.
+    :type path: str
+    :ivar keys: Sorted unique hash keys of the base file.
+    :type keys: numpy.ndarray
+    :ivar indptr: Start position of the postings of every key (length ``len(keys) + 1``).
+    :type indptr: numpy.ndarray
+    :ivar song_ids: Song ID of every posting of the base file.
+    :type song_ids: numpy.ndarray
+    :ivar offsets: Offset of every posting of the base file.
+    :type offsets: numpy.ndarray
+    :ivar generation: Number of merges the base file has been through; names its delta file.
+    :type generation: int
+    """
+    def __init__(self, path):
+        self.path = path
+        self.keys = np.empty(0, dtype=np.uint32)
+        self.indptr = np.zeros(1, dtype=np.uint64)
+        self.song_ids = np.empty(0, dtype=np.uint32)
+        self.offsets = np.empty(0, dtype=np.uint32)
+        self.generation = 0
+        self._delta = _csr(*(np.empty(0, dtype=np.uint32) for _ in range(3)))  # Postings not in the base file
+        self._pending = []  # Postings not yet merged into the delta arrays
+        self._unsaved = []  # Postings not yet written to the delta file
+        self._delta_position = 0  # Bytes of the delta file already read
+        self._file_stamp = None
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.song_ids) + len(self._delta[2]) + sum(len(keys) for keys, _, _ in self._pending)
+
+    @property
+    def nbytes(self):
+        """Size of the index arrays in bytes."""
+        return sum(array.nbytes for array in (self.keys, self.indptr, self.song_ids, self.offsets) + self._delta)
+
+    @property
+    def delta_path(self):
+        """Path of the delta file belonging to the current base file."""
+        return f"{self.path}.{self.generation}.delta"
+
+    def load(self):
+        """
+        Memory-maps the index arrays from the base file and reads its delta file.
+        Postings that were added here but not saved yet are kept.
+        """
+        with self._lock:
+            with open(self.path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{self.path} is not a fingerprint index file.")
+                header_size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+                header = json.loads(f.read(header_size))
+                if header.get("hash_format") != get_format().version:
+                    raise ValueError(f"{self.path} uses hash format {header.get('hash_format')}, "
+                                     f"but version {get_format().version} is configured.")
+                data_start = _align(len(MAGIC) + 8 + header_size)
+
+                arrays = {}
+                for name, spec in header["arrays"].items():
+                    shape = tuple(spec["shape"])
+                    if np.prod(shape) == 0:
+                        arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+                    else:
+                        # Map the opened file, which another process may already have replaced
+                        arrays[name] = np.memmap(f, dtype=spec["dtype"], mode="r",
+                                                 offset=data_start + spec["offset"], shape=shape)
+                stat = os.fstat(f.fileno())
+
+            self.keys = arrays["keys"]
+            self.indptr = arrays["indptr"]
+            self.song_ids = arrays["song_ids"]
+            self.offsets = arrays["offsets"]
+            self.generation = header.get("generation", 0)
+            self._file_stamp = stat.st_mtime_ns, stat.st_size
+            self._delta = _csr(*(np.empty(0, dtype=np.uint32) for _ in range(3)))
+            self._pending = list(self._unsaved)
+            self._delta_position = 0
+            self._read_delta()
+
+    def reload_if_changed(self):
+        """
+        Picks up postings saved by other processes: re-maps the base file if it was
+        replaced, and reads new records of the delta file.
+        """
+        with self._lock:
+            stamp = self._stat()
+            if stamp is not None and stamp != self._file_stamp:
+                self.load()
+            elif stamp is not None:
+                self._read_delta()
+
+    def save(self):
+        """
+        Appends the postings added since the last save to the delta file, and merges
+        the delta into a new base file once it has grown large enough.
+        """
+        with self._lock, exclusive_lock(f"{self.path}.lock"):
+            self._append_unsaved()
+            if self._stat() is None or len(self._delta[2]) > settings.INDEX_DELTA_RATIO * len(self.song_ids):
+                self._write_base()
+
+    def compact(self):
+        """
+        Saves pending postings and merges the whole delta file into a new base file.
+        """
+        with self._lock, exclusive_lock(f"{self.path}.lock"):
+            self._append_unsaved()
+            if self._stat() is None or len(self._delta[2]):
+                self._write_base()
+
+    def add(self, song_id, hash_keys, offsets):
+        """
+        Adds the fingerprints of one song. The postings become searchable immediately
+        and are written to disk on the next call to :meth:`save`.
+
+        :param song_id: Numeric Song ID.
+        :param hash_keys: Array of hash keys.
+        :param offsets: Array of offsets belonging to the hash keys.
+        """
+        hash_keys = np.asarray(hash_keys, dtype=np.uint32)
+        offsets = np.asarray(offsets, dtype=np.uint32)
+        song_ids = np.full(len(hash_keys), int(song_id), dtype=np.uint32)
+        with self._lock:
+            self._pending.append((hash_keys, song_ids, offsets))
+            self._unsaved.append((hash_keys, song_ids, offsets))
+
+    def contains_song(self, song_id):
+        """
+        Checks whether postings of a song are stored, e.g. before adding it again.
+
+        Every song is written as one delta record, so a song is either stored
+        completely or not at all.
+
+        :param song_id: Numeric Song ID.
+        :return: True if the index holds postings of the song.
+        """
+        self.reload_if_changed()
+        with self._lock:
+            self._merge_pending()
+            return any(np.any(ids == int(song_id)) for ids in (self.song_ids, self._delta[2]))
+
+    def max_song_id(self):
+        """Returns the highest Song ID in the index (0 if it is empty)."""
+        with self._lock:
+            self._merge_pending()
+            return int(max([0] + [ids.max() for ids in (self.song_ids, self._delta[2]) if len(ids)]))
+
+    def lookup(self, hash_keys):
+        """
+        Finds all postings of the given hash keys.
+
+        :param hash_keys: Array of query hash keys.
+        :return: Tuple of arrays (query_index, song_ids, offsets), where query_index
+            is the position of the matching key in ``hash_keys``, in ascending order.
+        """
+        self.reload_if_changed()
+        with self._lock:
+            self._merge_pending()
+            delta_keys, delta_indptr, delta_song_ids, delta_offsets = self._delta
+        hash_keys = np.asarray(hash_keys, dtype=np.uint32)
+
+        base = _expand(*_find(self.keys, self.indptr, hash_keys), self.song_ids, self.offsets)
+        if not len(delta_keys):
+            return base
+        delta = _expand(*_find(delta_keys, delta_indptr, hash_keys), delta_song_ids, delta_offsets)
+        query_index = np.concatenate((base[0], delta[0]))
+        order = np.argsort(query_index, kind="stable")
+        return tuple(np.concatenate(arrays)[order] for arrays in zip(base, delta))
+
+    def document_frequency(self, hash_keys):
+        """
+        Returns how many postings are stored for each key, without reading the postings.
+
+        :param hash_keys: Array of query hash keys.
+        :return: int64 array with the number of postings of every key (0 if the key is unknown).
+        """
+        self.reload_if_changed()
+        with self._lock:
+            self._merge_pending()
+            delta_keys, delta_indptr = self._delta[:2]
+        hash_keys = np.asarray(hash_keys, dtype=np.uint32)
+        frequencies = np.zeros(len(hash_keys), dtype=np.int64)
+        for keys, indptr in ((self.keys, self.indptr), (delta_keys, delta_indptr)):
+            query_index, _, lengths = _find(keys, indptr, hash_keys)
+            frequencies[query_index] += lengths
+        return frequencies
+
+    def store_fingerprints_in_hashes_table(self, song_id, fingerprints):
+        """
+        Stores song fingerprints in the index file.
+
+        :param song_id: Unique Song ID associated with the fingerprints.
+        :param fingerprints: List of tuples, each containing a packed hash value and its frame offset.
+        :return: Number of fingerprints written.
+        """
+        hash_keys = to_hash_keys(fingerprint[0] for fingerprint in fingerprints)
+        offsets = np.array([int(fingerprint[1]) for fingerprint in fingerprints], dtype=np.uint32)
+        self.add(song_id, hash_keys, offsets)
+        self.save()
+        print(f"Fingerprints stored successfully in the index '{self.path}'.")
+        return len(hash_keys)
+
+    def match_hashes(self, hashes):
+        """
+        Looks up the query hashes and pairs every posting with the query offset of its hash.
+
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :return: Tuple (song_ids, db_offsets, query_offsets, query_count) as used by best_match.
+        """
+        pairs = unique_hash_pairs(hashes)
+        if not pairs:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64), 0
+        hash_values, query_offsets = zip(*pairs)
+        hash_keys = to_hash_keys(hash_values)
+        query_offsets = np.array(query_offsets, dtype=np.int64)
+
+        query_index, song_ids, db_offsets = self.lookup(hash_keys)
+        return song_ids, db_offsets, query_offsets[query_index], len(np.unique(hash_keys))
+
+    def find_song_by_hashes(self, hashes, min_score=settings.MIN_MATCH_SCORE):
+        """
+        Finds a song in the index by matching its hashes.
+
+        The query planner looks up the rarest hashes first, using the posting counts
+        of the index as document frequencies, and stops once one song is clearly ahead.
+
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :param min_score: Minimum number of time-aligned matches required to accept a song.
+        :return: Dictionary with "SongID", "Offset", "Score" and "Confidence" if a match is found; otherwise, None.
+        """
+        match, _ = planned_match(self.lookup, hashes, self.document_frequency, min_score)
+        return match
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        delta_keys, delta_indptr, delta_song_ids, delta_offsets = self._delta
+        self._delta = _csr(
+            np.concatenate([np.repeat(delta_keys, np.diff(delta_indptr).astype(np.int64))]
+                           + [keys for keys, _, _ in self._pending]),
+            np.concatenate([delta_song_ids] + [ids for _, ids, _ in self._pending]),
+            np.concatenate([delta_offsets] + [offsets for _, _, offsets in self._pending]))
+        self._pending = []
+
+    def _append_unsaved(self):
+        """Writes the unsaved postings to the delta file. Must be called under the file lock."""
+        self.reload_if_changed()
+        if self._unsaved:
+            with open(self.delta_path, "ab") as f:
+                f.truncate(self._delta_position)  # Drop a record left incomplete by a crashed writer
+                for keys, song_ids, offsets in self._unsaved:
+                    f.write(np.uint32(len(keys)).astype("<u4").tobytes())
+                    for array in (keys, song_ids, offsets):
+                        f.write(np.ascontiguousarray(array, dtype="<u4").tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+                self._delta_position = f.tell()  # Our own records are already pending
+            self._unsaved = []
+        self._merge_pending()
+
+    def _read_delta(self):
+        """Adds the complete records appended to the delta file since it was last read."""
+        try:
+            with open(self.delta_path, "rb") as f:
+                f.seek(self._delta_position)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        position = 0
+        while position + 4 <= len(data):
+            count = int(np.frombuffer(data, dtype="<u4", count=1, offset=position)[0])
+            if position + 4 + 12 * count > len(data):
+                break  # Record still being written
+            keys, song_ids, offsets = np.frombuffer(data, dtype="<u4", count=3 * count,
+                                                    offset=position + 4).astype(np.uint32).reshape(3, count)
+            self._pending.append((keys, song_ids, offsets))
+            position += 4 + 12 * count
+        self._delta_position += position
+
+    def _write_base(self):
+        """Merges base and delta postings into a new base file. Must be called under the file lock."""
+        self._merge_pending()
+        delta_keys, delta_indptr, delta_song_ids, delta_offsets = self._delta
+        keys, indptr, song_ids, offsets = _csr(
+            np.concatenate((np.repeat(self.keys, np.diff(self.indptr).astype(np.int64)),
+                            np.repeat(delta_keys, np.diff(delta_indptr).astype(np.int64)))),
+            np.concatenate((self.song_ids, delta_song_ids)),
+            np.concatenate((self.offsets, delta_offsets)))
+
+        arrays = {"keys": keys, "indptr": indptr, "song_ids": song_ids, "offsets": offsets}
+        header = {"version": 1, "hash_format": get_format().version, "generation": self.generation + 1,
+                  "arrays": {}}
+        position = 0
+        for name, array in arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                                      "offset": position}
+            position = _align(position + array.nbytes)
+        header_bytes = json.dumps(header).encode()
+        data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header_bytes)).astype("<u8").tobytes())
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + header["arrays"][name]["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+        old_delta_path = self.delta_path
+        # Windows cannot replace a mapped file, so this process serves the merged arrays until load()
+        self.keys, self.indptr, self.song_ids, self.offsets = keys, indptr, song_ids, offsets
+        self._delta = _csr(*(np.empty(0, dtype=np.uint32) for _ in range(3)))
+        try:
+            os.replace(temp_path, self.path)
+        except PermissionError as e:
+            # Another process still maps the old base file (Windows); its postings stay in the delta file
+            print(f"Could not replace {self.path}, merging on a later save: {e}")
+            os.remove(temp_path)
+            self.load()
+            return
+        if os.path.exists(old_delta_path):
+            os.remove(old_delta_path)  # Readers of the old base re-map the new one, which contains it
+        self.load()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,450 @@
+import io
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from pipeline import settings
+from pipeline.recognise import expand_postings, planned_match, unique_hash_pairs
+from Databank.Song_Id_Allocator import SongIdAllocator
+from Databank.Storage import store_new_song
+
+SQLITE_MAX_PARAMETERS = 500  # Hash values bound per IN (...) query, below every SQLite version's limit
+
+
+def connect(path):
+    """
+    Opens a SQLite database shared by the threads of the app.
+
+    The database runs in WAL mode, so readers (e.g. recognition) are not blocked
+    while another process writes.
+
+    :param path: Path of the database file.
+    :return: sqlite3.Connection
+    """
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class SQLiteStore:
+    """
+    Base class of the SQLite stores: one connection, used by one thread at a time.
+
+    :ivar path: Path of the database file.
+    :type path: str
+    :ivar table_name: Name of the table holding the store's data.
+    :type table_name: str
+    """
+    schema = ""
+
+    def __init__(self, path, table_name):
+        self.path = path
+        self.table_name = table_name
+        self.connection = connect(path)
+        self._lock = threading.RLock()
+        with self._lock:
+            self.connection.executescript(self.schema.format(table=table_name))
+
+    def execute(self, sql, parameters=()):
+        """Runs one statement and returns all result rows."""
+        with self._lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def executemany(self, sql, rows):
+        """Runs one statement for every row inside a single transaction."""
+        with self._lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(sql, rows)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+class SQLiteSongIdAllocator(SongIdAllocator):
+    """
+    Song ID allocator backed by a counter row next to the songs in the SQLite database.
+
+    The counter is read and incremented in one write transaction, so several
+    processes using the same database file always receive different IDs.
+
+    :ivar songs_db: SQLite songs store.
+    :type songs_db: SQLiteSongStore
+    """
+    def __init__(self, songs_db, block_size=1):
+        super().__init__(block_size)
+        self.songs_db = songs_db
+
+    def allocate_block(self, count):
+        table = self.songs_db.table_name
+        with self.songs_db._lock:
+            connection = self.songs_db.connection
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute(f"INSERT OR IGNORE INTO {table}_counter (name, value) "
+                                   f"SELECT 'SongID', COALESCE(MAX(song_id), 0) FROM {table}")
+                connection.execute(f"UPDATE {table}_counter SET value = value + ? WHERE name = 'SongID'", (count,))
+                last_id = connection.execute(f"SELECT value FROM {table}_counter WHERE name = 'SongID'").fetchone()[0]
+        return range(last_id - count + 1, last_id + 1)
+
+
+class SQLiteSongStore(SQLiteStore):
+    """
+    Song metadata in a local SQLite table, with the interface of the DynamoDB songs table.
+
+    Every song is one row keyed by its integer Song ID; the metadata is kept as a
+    JSON document. Items are returned as dictionaries with a string "SongID", like
+    the items of the DynamoDB table.
+
+    :ivar current_song_id: Song ID of the last stored song.
+    :type current_song_id: int
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS {table} (song_id INTEGER PRIMARY KEY, metadata TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS {table}_counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, path, table_name="songs"):
+        super().__init__(path, table_name)
+        self.current_song_id = 0
+        self._song_id_allocator = None
+
+    @staticmethod
+    def _to_item(song_id, metadata):
+        item = json.loads(metadata)
+        item["SongID"] = str(song_id)
+        return item
+
+    def get_item(self, key):
+        """
+        Reads a single song by its Song ID.
+
+        :param key: Dictionary with the key, e.g. {"SongID": "42"}.
+        :return: The item, or None if it does not exist.
+        """
+        try:
+            rows = self.execute(f"SELECT song_id, metadata FROM {self.table_name} WHERE song_id = ?",
+                                (int(key["SongID"]),))
+            return self._to_item(*rows[0]) if rows else None
+        except sqlite3.Error as e:
+            print(f"Failed to get item {key}: {e}")
+            return None
+
+    def batch_get_items(self, keys):
+        """
+        Reads many songs by Song ID.
+
+        :param keys: List of key dictionaries, e.g. [{"SongID": "42"}, ...].
+        :return: List of the items found, ordered by Song ID.
+        """
+        song_ids = sorted({int(key["SongID"]) for key in keys})
+        items = []
+        for start in range(0, len(song_ids), SQLITE_MAX_PARAMETERS):
+            batch = song_ids[start:start + SQLITE_MAX_PARAMETERS]
+            rows = self.execute(f"SELECT song_id, metadata FROM {self.table_name} "
+                                f"WHERE song_id IN ({','.join('?' * len(batch))}) ORDER BY song_id", batch)
+            items.extend(self._to_item(*row) for row in rows)
+        return items
+
+    def scan_pages(self, page_size=None, start_key=None):
+        """
+        Reads the songs page by page in Song ID order.
+
+        :param page_size: Maximum number of songs per page (None for all songs in one page).
+        :param start_key: Key returned with a previous page to continue after.
+        :return: Generator of tuples (items, last_key); the key is None on the last page.
+        """
+        last_id = int(start_key["SongID"]) if start_key else -1
+        while True:
+            rows = self.execute(f"SELECT song_id, metadata FROM {self.table_name} WHERE song_id > ? "
+                                f"ORDER BY song_id LIMIT ?", (last_id, page_size or -1))
+            items = [self._to_item(*row) for row in rows]
+            if not page_size or len(rows) < page_size:
+                yield items, None
+                return
+            last_id = rows[-1][0]
+            yield items, {"SongID": str(last_id)}
+
+    def scan_items(self, page_size=None):
+        for items, _ in self.scan_pages(page_size):
+            yield from items
+
+    def fetch_item(self):
+        try:
+            return list(self.scan_items())
+        except sqlite3.Error as e:
+            print("Failed to fetch data:", e)
+            return []
+
+    def get_latest_song_id(self):
+        try:
+            return self.execute(f"SELECT COALESCE(MAX(song_id), 0) FROM {self.table_name}")[0][0]
+        except sqlite3.Error as e:
+            print(f"Failed to get latest song ID: {e}")
+            return 0
+
+    @property
+    def song_id_allocator(self):
+        """Song ID allocator using a counter row in this database (created on first use)."""
+        if self._song_id_allocator is None:
+            self._song_id_allocator = SQLiteSongIdAllocator(self)
+        return self._song_id_allocator
+
+    def store_metadata_in_songs_table(self, song_id, song_data):
+        """
+        Stores song metadata in the songs table.
+
+        :param song_id: Unique Song ID.
+        :param song_data: Dictionary containing song metadata (artist, title, album, etc.).
+        :return: True if the metadata was stored, False otherwise.
+        """
+        try:
+            song_data["SongID"] = str(song_id)
+            metadata = {k: v for k, v in song_data.items() if k != "SongID"}
+            self.execute(f"INSERT OR REPLACE INTO {self.table_name} (song_id, metadata) VALUES (?, ?)",
+                         (int(song_id), json.dumps(metadata)))
+            print("Metadata stored successfully in the table.")
+            return True
+        except sqlite3.Error as e:
+            print(f"Failed to store metadata in the table '{self.table_name}': {e}")
+            return False
+
+    def store_song(self, song_data, hashes, hashes_db, song_id_allocator=None, min_score=settings.MIN_MATCH_SCORE):
+        """
+        Stores a song unless its fingerprints already match a stored song (see Storage.store_new_song).
+
+        :param song_data: Dictionary containing song metadata (artist, title, album, etc.).
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :param hashes_db: Object storing the fingerprints (SQLiteHashStore, FingerprintIndex, ...).
+        :param song_id_allocator: SongIdAllocator handing out the Song ID. Defaults to the
+            counter of this database.
+        :param min_score: Minimum number of time-aligned matches for a song to count as a duplicate.
+        :return: Tuple (stored, match): whether the song was stored, and the match of the
+            existing song if it is a duplicate (otherwise None).
+        """
+        return store_new_song(self, song_data, hashes, hashes_db, song_id_allocator or self.song_id_allocator,
+                              min_score, sqlite3.Error)
+
+
+class SQLiteHashStore(SQLiteStore):
+    """
+    Fingerprints in a local SQLite table, with the interface of the DynamoDB Hashes table.
+
+    The table is a ``WITHOUT ROWID`` table whose primary key starts with the hash,
+    so the postings of a hash are stored next to each other in the primary key
+    B-tree and every lookup is a single range read without a separate index.
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS {table} (
+            hash INTEGER NOT NULL,
+            song_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            PRIMARY KEY (hash, song_id, offset)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, table_name="hashes"):
+        super().__init__(path, table_name)
+
+    def _select_by_hashes(self, columns, hash_keys, suffix=""):
+        rows = []
+        for start in range(0, len(hash_keys), SQLITE_MAX_PARAMETERS):
+            batch = hash_keys[start:start + SQLITE_MAX_PARAMETERS]
+            rows.extend(self.execute(f"SELECT {columns} FROM {self.table_name} "
+                                     f"WHERE hash IN ({','.join('?' * len(batch))}){suffix}", batch))
+        return rows
+
+    def lookup(self, hash_keys):
+        """
+        Finds all stored entries of the given hash values (same interface as FingerprintIndex.lookup).
+
+        :param hash_keys: Array of distinct query hash values.
+        :return: Tuple of arrays (query_index, song_ids, offsets), sorted by query_index, where
+            query_index is the position of the matching value in ``hash_keys``.
+        """
+        positions = {int(hash_value): index for index, hash_value in enumerate(hash_keys)}
+        rows = np.array(self._select_by_hashes("hash, song_id, offset", list(positions)), dtype=np.int64)
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        query_index = np.array([positions[hash_value] for hash_value in rows[:, 0].tolist()], dtype=np.int64)
+        order = np.argsort(query_index, kind="stable")
+        return query_index[order], rows[order, 1], rows[order, 2]
+
+    def document_frequency(self, hash_keys):
+        """
+        Returns how many entries are stored for each hash value.
+
+        :param hash_keys: Array of query hash values.
+        :return: int64 array with the number of entries of every value (0 if the value is unknown).
+        """
+        hash_keys = [int(hash_value) for hash_value in hash_keys]
+        counts = dict(self._select_by_hashes("hash, COUNT(*)", hash_keys, " GROUP BY hash"))
+        return np.array([counts.get(hash_value, 0) for hash_value in hash_keys], dtype=np.int64)
+
+    def store_fingerprints_in_hashes_table(self, song_id, fingerprints):
+        """
+        Stores song fingerprints in the hashes table.
+
+        :param song_id: Unique Song ID associated with the fingerprints.
+        :param fingerprints: List of tuples, each containing a packed hash value and its frame offset.
+        :return: Number of fingerprints written.
+        """
+        try:
+            rows = [(int(fingerprint[0]), int(song_id), int(fingerprint[1])) for fingerprint in fingerprints]
+            self.executemany(f"INSERT OR IGNORE INTO {self.table_name} (hash, song_id, offset) VALUES (?, ?, ?)",
+                             rows)
+            print(f"Fingerprints stored successfully in the table '{self.table_name}'.")
+            return len(rows)
+        except sqlite3.Error as e:
+            print(f"Failed to store fingerprints in the table '{self.table_name}': {e}")
+            return 0
+
+    def match_hashes(self, hashes):
+        """
+        Looks up the query hashes and pairs every stored entry with the query offset of its hash.
+
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :return: Tuple (song_ids, db_offsets, query_offsets, query_count) as used by best_match.
+        """
+        pairs = unique_hash_pairs(hashes)
+        if not pairs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0
+        hash_values, query_offsets = (np.array(column, dtype=np.int64) for column in zip(*pairs))
+        keys = np.unique(hash_values)
+
+        query_index, song_ids, db_offsets = self.lookup(keys)
+        return (*expand_postings(keys, query_index, song_ids, db_offsets, hash_values, query_offsets), len(keys))
+
+    def find_song_by_hashes(self, hashes, min_score=settings.MIN_MATCH_SCORE):
+        """
+        Finds a song in the hashes table by matching its hashes.
+
+        The query planner looks up the rarest hashes first, using the entry counts of
+        the table as document frequencies, and stops once one song is clearly ahead.
+
+        :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+        :param min_score: Minimum number of time-aligned matches required to accept a song.
+        :return: Dictionary with "SongID", "Offset", "Score" and "Confidence" if a match is found; otherwise, None.
+        """
+        try:
+            match, _ = planned_match(self.lookup, hashes, self.document_frequency, min_score)
+            return match
+        except sqlite3.Error as e:
+            print(f"Failed to find song by hashes: {e}")
+            return None
+
+
+class LocalFileStore:
+    """
+    Song files in a local directory, with the interface of S3Manager.
+
+    Object names are paths relative to the directory. Instead of a presigned URL,
+    get_presigned_url returns the path of the file, which st.audio can play directly.
+
+    :ivar directory: Root directory of the stored files.
+    :type directory: str
+    """
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, object_name):
+        path = os.path.abspath(os.path.join(self.directory, object_name))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            raise ValueError(f"Object name {object_name!r} points outside of {self.directory}")
+        return path
+
+    def upload_file(self, file_name, object_name=None):
+        try:
+            if object_name is None:
+                object_name = os.path.basename(file_name)
+            path = self._path(object_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(file_name, path)
+            print(f"File {file_name} stored as {path}")
+        except (OSError, ValueError) as e:
+            print(f"Failed to upload file: {e}")
+
+    def upload_fileobj(self, fileobj, object_name, callback=None):
+        """
+        Stores a file-like object (e.g. an uploaded file held in memory).
+
+        The file is written under a temporary name and renamed when complete, so
+        readers never see a partial file.
+
+        :param fileobj: Readable binary file-like object.
+        :param object_name: Path of the file relative to the directory.
+        :param callback: Optional function called with the number of bytes written.
+        :return: True if the file was stored, False otherwise.
+        """
+        try:
+            path = self._path(object_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".part", "wb") as file:
+                while chunk := fileobj.read(1024 * 1024):
+                    file.write(chunk)
+                    if callback:
+                        callback(len(chunk))
+            os.replace(path + ".part", path)
+            print(f"File stored as {path}")
+            return True
+        except (OSError, ValueError) as e:
+            print(f"Failed to upload file: {e}")
+            return False
+
+    def upload_bytes(self, data, object_name, callback=None):
+        """
+        Stores file content held in memory, unless a file with this name already exists.
+
+        :param data: File content as bytes.
+        :param object_name: Path of the file relative to the directory.
+        :param callback: Optional function called with the number of bytes written.
+        :return: True if the file was stored, False if it already existed, None if storing failed.
+        """
+        if self.object_exists(object_name):
+            if callback:
+                callback(len(data))
+            return False
+        return True if self.upload_fileobj(io.BytesIO(data), object_name, callback) else None
+
+    def object_exists(self, object_name):
+        try:
+            return os.path.exists(self._path(object_name))
+        except ValueError:
+            return False
+
+    def delete_file(self, object_name):
+        try:
+            os.remove(self._path(object_name))
+            print(f"File {object_name} deleted")
+        except (OSError, ValueError) as e:
+            print(f"Failed to delete file: {e}")
+
+    def download_file(self, object_name, file_name=None):
+        try:
+            if file_name is None:
+                file_name = object_name
+            shutil.copyfile(self._path(object_name), file_name)
+            print(f"File {object_name} copied to {file_name}")
+        except (OSError, ValueError) as e:
+            print(f"Failed to download file: {e}")
+            return None
+
+    def get_presigned_url(self, s3_key, expiry=None):
+        try:
+            path = self._path(s3_key)
+            return path if os.path.exists(path) else None
+        except ValueError as e:
+            print(f"Error generating presigned URL: {e}")
+            return None
+
+    def get_presigned_urls(self, s3_keys):
+        urls = {s3_key: self.get_presigned_url(s3_key) for s3_key in set(s3_keys)}
+        return {s3_key: url for s3_key, url in urls.items() if url}
+
+    def existing_objects(self, s3_keys):
+        return {s3_key for s3_key in s3_keys if self.object_exists(s3_key)}
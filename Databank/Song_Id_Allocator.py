@@ -0,0 +1,126 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from botocore.exceptions import ClientError
+from Databank.File_Lock import lock_file, unlock_file
+
+SONG_ID_COUNTER = "__song_id_counter__"  # SongID of the item holding the last allocated Song ID
+
+
+class SongIdAllocator(ABC):
+    """
+    Hands out unique, increasing Song IDs without scanning the songs table.
+
+    IDs are reserved from a shared counter in blocks of ``block_size``. With a block
+    size of 1 every ID costs one counter update; batch ingesters use larger blocks so
+    parallel workers rarely touch the counter. IDs of a block that is never used
+    (e.g. after a crash) are skipped, so Song IDs may have gaps.
+
+    :ivar block_size: Number of IDs reserved per counter update.
+    :type block_size: int
+    """
+    def __init__(self, block_size=1):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        """
+        Returns the next free Song ID, reserving a new block when the current one is used up.
+
+        :return: Song ID.
+        """
+        with self._lock:
+            if self._next >= self._end:
+                block = self.allocate_block(self.block_size)
+                self._next, self._end = block.start, block.stop
+            song_id = self._next
+            self._next += 1
+            return song_id
+
+    @abstractmethod
+    def allocate_block(self, count):
+        """
+        Atomically reserves ``count`` consecutive Song IDs.
+
+        :param count: Number of IDs to reserve.
+        :return: range of the reserved IDs.
+        """
+
+
+class DynamoDBSongIdAllocator(SongIdAllocator):
+    """
+    Song ID allocator backed by a counter item in the DynamoDB songs table.
+
+    The counter is incremented with a conditional UpdateItem ADD, so concurrent
+    uploads always receive different IDs. On first use it is seeded once from the
+    highest existing Song ID.
+
+    :ivar songs_db: Connectivity object of the songs table.
+    :type songs_db: AmazonDBConnectivity
+    """
+    def __init__(self, songs_db, block_size=1):
+        super().__init__(block_size)
+        self.songs_db = songs_db
+
+    def allocate_block(self, count):
+        table = self.songs_db.dynamodb_resource.Table(self.songs_db.table_name)
+        for _ in range(2):
+            try:
+                response = table.update_item(
+                    Key={"SongID": SONG_ID_COUNTER},
+                    UpdateExpression="ADD LastSongID :count",
+                    ConditionExpression="attribute_exists(LastSongID)",
+                    ExpressionAttributeValues={":count": count},
+                    ReturnValues="UPDATED_NEW"
+                )
+                last_id = int(response["Attributes"]["LastSongID"])
+                return range(last_id - count + 1, last_id + 1)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+            try:
+                # Seed the counter; if another upload seeded it first, just retry the increment
+                table.put_item(
+                    Item={"SongID": SONG_ID_COUNTER, "LastSongID": self.songs_db.get_latest_song_id()},
+                    ConditionExpression="attribute_not_exists(LastSongID)"
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+        raise RuntimeError("Failed to allocate a Song ID.")
+
+
+class LocalSongIdAllocator(SongIdAllocator):
+    """
+    Song ID allocator backed by a counter file, for the offline backends.
+
+    The file holds the last allocated ID as text. It is updated under an exclusive
+    file lock, so several processes on the same machine can share it.
+
+    :ivar path: Path of the counter file.
+    :type path: str
+    :ivar seed: Callable returning the highest existing Song ID, used when the file does not exist yet.
+    :type seed: callable
+    """
+    def __init__(self, path, block_size=1, seed=lambda: 0):
+        super().__init__(block_size)
+        self.path = path
+        self.seed = seed
+
+    def allocate_block(self, count):
+        with open(self.path, "a+") as counter_file:
+            lock_file(counter_file)
+            try:
+                counter_file.seek(0)
+                content = counter_file.read().strip()
+                last_id = int(content) if content else int(self.seed())
+                counter_file.seek(0)
+                counter_file.truncate()
+                counter_file.write(str(last_id + count))
+                counter_file.flush()
+                os.fsync(counter_file.fileno())
+            finally:
+                unlock_file(counter_file)
+        return range(last_id + 1, last_id + count + 1)
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import OrderedDict
+from botocore.exceptions import BotoCoreError, ClientError
+from pipeline import settings
+
+
+class MetadataCache:
+    """
+    Thread-safe LRU cache whose entries expire after a fixed lifetime.
+
+    :ivar max_entries: Maximum number of cached entries; the least recently used entry is dropped first.
+    :type max_entries: int
+    :ivar ttl: Lifetime of an entry in seconds.
+    :type ttl: float
+    """
+    def __init__(self, max_entries=settings.METADATA_CACHE_SIZE, ttl=settings.METADATA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # Key -> (expiry time, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Removes one entry, or all entries if no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# Caches shared by every service (and therefore every Streamlit session) of the same table
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def shared_cache(name):
+    """
+    Returns the process-wide cache with the given name, creating it on first use.
+
+    :param name: Cache name, e.g. the table name.
+    :return: MetadataCache
+    """
+    with _shared_caches_lock:
+        if name not in _shared_caches:
+            _shared_caches[name] = MetadataCache()
+        return _shared_caches[name]
+
+
+class SongMetadataService:
+    """
+    Reads song metadata by SongID from the songs table, with a cache shared across sessions.
+
+    Single songs are read with a keyed get_item and several songs with BatchGetItem,
+    so no lookup scans the table. Songs and pages of the song list are cached for
+    settings.METADATA_CACHE_TTL seconds; call invalidate() after storing a song so
+    the new song shows up immediately.
+
+    :ivar songs_db: Connectivity object of the songs table.
+    :type songs_db: AmazonDBConnectivity
+    :ivar songs: Cache of song metadata by SongID.
+    :type songs: MetadataCache
+    :ivar pages: Cache of song list pages by (page size, start key).
+    :type pages: MetadataCache
+    """
+    def __init__(self, songs_db):
+        self.songs_db = songs_db
+        self.songs = shared_cache(f"{songs_db.table_name}:songs")
+        self.pages = shared_cache(f"{songs_db.table_name}:pages")
+
+    def get(self, song_id):
+        """
+        Returns the metadata of one song.
+
+        :param song_id: Song ID.
+        :return: Metadata dictionary, or None if the song does not exist.
+        """
+        song_id = str(song_id)
+        metadata = self.songs.get(song_id)
+        if metadata is None:
+            metadata = self.songs_db.get_item({"SongID": song_id})
+            if metadata is not None:
+                self.songs.put(song_id, metadata)
+        return metadata
+
+    def get_many(self, song_ids):
+        """
+        Returns the metadata of several songs, reading only the uncached ones in batches.
+
+        :param song_ids: Iterable of Song IDs.
+        :return: Dictionary SongID -> metadata for the songs that exist.
+        """
+        found, missing = {}, []
+        for song_id in map(str, song_ids):
+            metadata = self.songs.get(song_id)
+            if metadata is None:
+                missing.append(song_id)
+            else:
+                found[song_id] = metadata
+        if missing:
+            try:
+                for item in self.songs_db.batch_get_items([{"SongID": song_id} for song_id in missing]):
+                    found[str(item["SongID"])] = item
+                    self.songs.put(str(item["SongID"]), item)
+            except (BotoCoreError, ClientError, RuntimeError) as e:  # RuntimeError: keys left unprocessed
+                print(f"Failed to read song metadata: {e}")
+        return found
+
+    def page(self, page_size=settings.STREAM_PAGE_SIZE, start_key=None):
+        """
+        Returns one page of the song list.
+
+        :param page_size: Maximum number of songs on the page.
+        :param start_key: Key returned with the previous page, or None for the first page.
+        :return: Tuple (songs, next_key); next_key is None on the last page.
+        """
+        cache_key = (page_size, tuple(sorted((start_key or {}).items())))
+        cached = self.pages.get(cache_key)
+        if cached is not None:
+            return cached
+
+        songs, next_key = [], start_key
+        # A scan page can come back short (e.g. when it contained the counter item), so keep reading
+        for items, next_key in self.songs_db.scan_pages(page_size, start_key):
+            songs.extend(items)
+            if len(songs) >= page_size or next_key is None:
+                break
+        if len(songs) > page_size:
+            # Continue after the last song shown instead of after the last song read
+            songs = songs[:page_size]
+            next_key = {"SongID": str(songs[-1]["SongID"])}
+        for song in songs:
+            self.songs.put(str(song["SongID"]), song)
+        self.pages.put(cache_key, (songs, next_key))
+        return songs, next_key
+
+    def invalidate(self, song_id=None):
+        """
+        Drops cached data after the songs table changed.
+
+        :param song_id: Song ID that was added or changed, or None to drop all cached songs.
+        """
+        if song_id is None:
+            self.songs.invalidate()
+        else:
+            self.songs.invalidate(str(song_id))
+        self.pages.invalidate()
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+from Databank.Fingerprint_Index import FingerprintIndex
+from pipeline.recognise import unique_hash_pairs
+
+
+class Storage:
+    """
+    The four stores the app works with, independent of where they keep their data.
+
+    Every backend provides objects with the same methods:
+
+    - songs: song metadata (store_song, get_item, batch_get_items, scan_pages,
+      song_id_allocator, current_song_id), e.g. AmazonDBConnectivity or SQLiteSongStore.
+    - hashes: fingerprints (store_fingerprints_in_hashes_table, lookup, match_hashes,
+      find_song_by_hashes), e.g. AmazonDBConnectivity, SQLiteHashStore or FingerprintIndex.
+    - blobs: song files (upload_file, upload_fileobj, upload_bytes, object_exists, existing_objects,
+      delete_file, download_file, get_presigned_url, get_presigned_urls), e.g. S3Manager or LocalFileStore.
+    - users: user accounts (create_user, get_user, get_user_password, ...), e.g.
+      UserManager or SQLiteUserManager.
+
+    :ivar songs: Song metadata store.
+    :ivar hashes: Fingerprint store.
+    :ivar blobs: Song file store.
+    :ivar users: User account store.
+    """
+    def __init__(self, songs, hashes, blobs, users):
+        self.songs = songs
+        self.hashes = hashes
+        self.blobs = blobs
+        self.users = users
+
+
+def content_key(data, file_name, prefix="songs/"):
+    """
+    Returns the object name of a song file derived from its content.
+
+    Identical files get the same name, so uploading a file twice stores it once,
+    and different files with the same name no longer overwrite each other.
+
+    :param data: File content as bytes.
+    :param file_name: Original file name; only its extension is kept.
+    :param prefix: Folder of the object.
+    :return: Object name, e.g. "songs/<sha256>.mp3".
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    return f"{prefix}{hashlib.sha256(data).hexdigest()}{extension}"
+
+
+def store_new_song(songs_db, song_data, hashes, hashes_db, song_id_allocator, min_score, errors):
+    """
+    Stores a song unless its fingerprints match a stored song; shared by every backend's store_song.
+
+    The hashes are normalized once and matched with an offset-consistent lookup,
+    which decides whether the song is a duplicate. A new song gets its Song ID from
+    the allocator, and its fingerprints are written before its metadata row, so a
+    failed write never leaves a song that cannot be recognized.
+
+    :param songs_db: Songs store; receives the metadata row and the new ``current_song_id``.
+    :param song_data: Dictionary containing song metadata (artist, title, album, etc.).
+    :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+    :param hashes_db: Fingerprint store (find_song_by_hashes, store_fingerprints_in_hashes_table).
+    :param song_id_allocator: SongIdAllocator handing out the Song ID.
+    :param min_score: Minimum number of time-aligned matches for a song to count as a duplicate.
+    :param errors: Exception types of the backend that mean the song could not be stored.
+    :return: Tuple (stored, match): whether the song was stored, and the match of the
+        existing song if it is a duplicate (otherwise None).
+    """
+    try:
+        pairs = unique_hash_pairs(hashes)
+        match = hashes_db.find_song_by_hashes(pairs, min_score)
+        if match:
+            return False, match
+
+        songs_db.current_song_id = song_id_allocator.next_id()
+        if pairs and not hashes_db.store_fingerprints_in_hashes_table(songs_db.current_song_id, pairs):
+            return False, None
+        return songs_db.store_metadata_in_songs_table(songs_db.current_song_id, song_data), None
+    except errors as e:
+        print(f"Failed to store song: {e}")
+        return False, None
+
+
+class UploadProgress:
+    """
+    Thread-safe byte counter, used as the progress callback of an upload.
+
+    The transfer threads call it with the number of bytes sent; the UI reads ``fraction``.
+
+    :ivar total: Size of the upload in bytes.
+    :type total: int
+    :ivar transferred: Bytes sent so far.
+    :type transferred: int
+    """
+    def __init__(self, total):
+        self.total = total
+        self.transferred = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.transferred += bytes_amount
+
+    @property
+    def fraction(self):
+        return min(1.0, self.transferred / self.total) if self.total else 1.0
+
+
+def aws_storage(aws_access_key_id, aws_secret_access_key, region_name, songs_table_name, hashes_table_name,
+                bucket_name, user_table, fingerprint_index_path=None):
+    """
+    Stores everything in DynamoDB tables and an S3 bucket.
+
+    :param fingerprint_index_path: Path of a local fingerprint index to use instead of the Hashes table.
+    :return: Storage
+    """
+    from Databank.Amazon_DynamoDB import AmazonDBConnectivity
+    from Databank.Amazon_S3 import S3Manager
+    from Databank.User_Management import UserManager
+    credentials = (aws_access_key_id, aws_secret_access_key, region_name)
+    songs = AmazonDBConnectivity(*credentials, songs_table_name)
+    if fingerprint_index_path:
+        hashes = FingerprintIndex(fingerprint_index_path)
+    else:
+        hashes = AmazonDBConnectivity(*credentials, hashes_table_name)
+    return Storage(songs, hashes, S3Manager(*credentials, bucket_name), UserManager(*credentials, user_table))
+
+
+def local_storage(directory, fingerprint_index_path=None):
+    """
+    Stores everything in one directory: a SQLite database and the song files.
+
+    Needs no network access or AWS account, for development, tests, benchmarks and
+    small single-machine deployments.
+
+    :param directory: Data directory (created if missing).
+    :param fingerprint_index_path: Path of a local fingerprint index to use instead of the SQLite hashes table.
+    :return: Storage
+    """
+    from Databank.Local_Storage import LocalFileStore, SQLiteHashStore, SQLiteSongStore
+    from Databank.User_Management import SQLiteUserManager
+    os.makedirs(directory, exist_ok=True)
+    database = os.path.join(directory, "tunescout.db")
+    hashes = FingerprintIndex(fingerprint_index_path) if fingerprint_index_path else SQLiteHashStore(database)
+    return Storage(SQLiteSongStore(database), hashes, LocalFileStore(os.path.join(directory, "files")),
+                   SQLiteUserManager(database))
+
+
+STORAGE_BACKENDS = {"aws": aws_storage, "local": local_storage}
+
+
+def create_storage(backend="aws", **options):
+    """
+    Creates the stores of the given backend.
+
+    :param backend: "aws" (DynamoDB and S3) or "local" (SQLite and the filesystem).
+    :param options: Arguments of aws_storage or local_storage.
+    :return: Storage
+    """
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {sorted(STORAGE_BACKENDS)}.")
+    return STORAGE_BACKENDS[backend](**options)
@@ -1,6 +1,10 @@
-import boto3
+import json
+import sqlite3
+import threading
 import bcrypt
 from botocore.exceptions import ClientError
+from Databank.AWS_Clients import get_client, get_resource
+from Databank.Local_Storage import connect
 
 class UserManager:
     def __init__(self, aws_access_key_id, aws_secret_access_key, region_name, table_name):
@@ -10,20 +14,14 @@ class UserManager:
         :param table_name: Name of the DynamoDB table.
         :param region_name: AWS region where the table is located (default is 'us-east-1').
         """
-        self.dynamodb_client = boto3.client(
-            'dynamodb',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name
-        )
-        self.dynamodb_resource = boto3.resource(
-            'dynamodb',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name
-        )
+        self._credentials = (aws_access_key_id, aws_secret_access_key, region_name)
+        self.dynamodb_client = get_client('dynamodb', *self._credentials)
         self.table_name = table_name
-        self.table = self.dynamodb_resource.Table(table_name)
+
+    @property
+    def table(self):
+        """Users table of the calling thread's DynamoDB resource (boto3 resources are not thread-safe)."""
+        return get_resource('dynamodb', *self._credentials).Table(self.table_name)
 
     @staticmethod
     def hash_password(password):
@@ -178,4 +176,100 @@ class UserManager:
             return None  # User not found or password missing.
         except ClientError as e:
             print(f"Error retrieving password: {e.response['Error']['Message']}")
-            return None
\ No newline at end of file
+            return None
+
+
+class SQLiteUserManager(UserManager):
+    """
+    User accounts in a local SQLite table, with the interface of UserManager.
+
+    Every user is one row keyed by the UserID; the remaining attributes (including
+    the hashed password) are kept as a JSON document.
+
+    :ivar path: Path of the database file.
+    :type path: str
+    :ivar table_name: Name of the users table.
+    :type table_name: str
+    """
+    def __init__(self, path, table_name="users"):
+        self.path = path
+        self.table_name = table_name
+        self.connection = connect(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table_name} (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def _read(self, user_id):
+        with self._lock:
+            row = self.connection.execute(f"SELECT data FROM {self.table_name} WHERE user_id = ?",
+                                          (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, user_id, user_data):
+        with self._lock:
+            self.connection.execute(f"INSERT OR REPLACE INTO {self.table_name} (user_id, data) VALUES (?, ?)",
+                                    (user_id, json.dumps(user_data)))
+
+    def create_user(self, user_id, password, additional_data=None):
+        try:
+            user_data = {"UserID": user_id, "password": self.hash_password(password)}
+            user_data.update(additional_data or {})
+            with self._lock:
+                self.connection.execute(f"INSERT INTO {self.table_name} (user_id, data) VALUES (?, ?)",
+                                        (user_id, json.dumps(user_data)))
+            return user_data
+        except sqlite3.Error as e:
+            print(f"Error creating user: {e}")
+            return None
+
+    def get_user(self, user_id):
+        try:
+            user_data = self._read(user_id)
+            if user_data is None:
+                print(f"User with ID {user_id} not found.")
+                return None
+            user_data.pop("password", None)
+            return user_data
+        except sqlite3.Error as e:
+            print(f"Error retrieving user: {e}")
+            return None
+
+    def authenticate_user(self, user_id, password):
+        try:
+            user_data = self._read(user_id)
+            return bool(user_data) and self.verify_password(password, user_data["password"])
+        except sqlite3.Error as e:
+            print(f"Error authenticating user: {e}")
+            return False
+
+    def update_user(self, user_id, updates):
+        try:
+            user_data = self._read(user_id)
+            if user_data is None:
+                return None
+            if "password" in updates:
+                updates["password"] = self.hash_password(updates["password"])  # Re-hash the new password.
+            user_data.update(updates)
+            self._write(user_id, user_data)
+            return updates
+        except sqlite3.Error as e:
+            print(f"Error updating user: {e}")
+            return None
+
+    def delete_user(self, user_id):
+        try:
+            with self._lock:
+                self.connection.execute(f"DELETE FROM {self.table_name} WHERE user_id = ?", (user_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error deleting user: {e}")
+            return None
+
+    def get_user_password(self, user_id):
+        try:
+            user_data = self._read(user_id)
+            return user_data.get("password") if user_data else None
+        except sqlite3.Error as e:
+            print(f"Error retrieving password: {e}")
+            return None
@@ -0,0 +1,229 @@
+# recognition.py
+#
+# Offline benchmark of fingerprinting speed and recognition quality against the
+# local FingerprintIndex backend. A catalog is built from local audio files plus
+# synthetic tone/noise tracks, query clips are cut at random offsets and
+# distorted (noise, gain, resampling, EQ), and the script reports accuracy,
+# latency percentiles, hashes per second and index size.
+#
+#   python -m benchmarks.recognition [audio files] [--synthetic 10] [--queries 60]
+#   python -m benchmarks.recognition --min-accuracy 0.9 --max-p90-ms 150 --json results.json
+#
+# With gate options the exit code is 1 when a gate fails, so the script can guard
+# against performance and quality regressions.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from scipy.signal import resample_poly
+from pipeline import settings
+from pipeline.audioconverter import decode_audio
+from pipeline.fingerprinting import StreamingFingerprinter
+from pipeline.hash_format import get_format
+from Databank.Fingerprint_Index import FingerprintIndex
+from equalizer.filters import butter_highpass_filter, butter_lowpass_filter, equalizer
+
+
+def synthetic_track(seed, seconds):
+    """Noise with a melody of random tones and chords that change every 250 ms."""
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, 800, int(settings.SAMPLE_RATE * seconds))
+    step = settings.SAMPLE_RATE // 4
+    time_axis = np.arange(step) / settings.SAMPLE_RATE
+    for start in range(0, len(audio), step):
+        for frequency in rng.uniform(100, 8000, rng.integers(2, 6)):
+            length = len(audio[start:start + step])
+            audio[start:start + step] += rng.uniform(1000, 5000) * np.sin(2 * np.pi * frequency * time_axis[:length])
+    return np.clip(audio, -32768, 32767).astype(np.int16)
+
+
+def to_int16(audio):
+    return np.clip(np.round(audio), -32768, 32767).astype(np.int16)
+
+
+# Query distortions: name -> function(audio, rng)
+DISTORTIONS = {
+    "clean": lambda audio, rng: audio,
+    "noise 10 dB": lambda audio, rng: to_int16(
+        audio + rng.normal(0, np.std(audio.astype(np.float64)) / 10 ** (10 / 20), len(audio))),
+    "noise 0 dB": lambda audio, rng: to_int16(
+        audio + rng.normal(0, np.std(audio.astype(np.float64)), len(audio))),
+    "gain -20 dB": lambda audio, rng: to_int16(audio * 0.1),
+    "gain +12 dB (clipping)": lambda audio, rng: to_int16(audio * 4.0),
+    "resample 22.05 kHz": lambda audio, rng: to_int16(resample_poly(resample_poly(audio, 1, 2), 2, 1)),
+    "EQ low-pass 3 kHz": lambda audio, rng: to_int16(butter_lowpass_filter(audio, 3000, settings.SAMPLE_RATE)),
+    "EQ high-pass 500 Hz": lambda audio, rng: to_int16(butter_highpass_filter(audio, 500, settings.SAMPLE_RATE)),
+    "EQ band 300-3400 Hz": lambda audio, rng: to_int16(equalizer(audio, (300, 3400), settings.SAMPLE_RATE, order=3)),
+}
+
+
+def fingerprint_samples(samples):
+    """Fingerprints samples the way the ingestion workers do."""
+    fingerprinter = StreamingFingerprinter()
+    hashes, offsets = zip(fingerprinter.push(samples), fingerprinter.flush())
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+
+def load_catalog(paths, synthetic, seconds):
+    """
+    Collects the catalog tracks.
+
+    :param paths: Audio files to decode with ffmpeg (missing files or a missing ffmpeg are skipped).
+    :param synthetic: Number of synthetic tracks.
+    :param seconds: Length of every synthetic track in seconds.
+    :returns: Dictionary of track name -> int16 samples.
+    """
+    catalog = {}
+    for path in paths:
+        try:
+            with open(path, "rb") as audio_file:
+                catalog[os.path.basename(path)] = decode_audio(audio_file.read())
+        except (OSError, RuntimeError) as e:
+            print(f"[!] Skipping {path}: {e}")
+    for seed in range(synthetic):
+        catalog[f"synthetic-{seed:03d}"] = synthetic_track(seed, seconds)
+    return catalog
+
+
+def build_index(catalog, index_path):
+    """
+    Fingerprints the catalog into a new index file.
+
+    :returns: Tuple (index, dictionary of build statistics).
+    """
+    index = FingerprintIndex(index_path)
+    total_hashes, audio_seconds = 0, 0.0
+    start = time.perf_counter()
+    for song_id, samples in enumerate(catalog.values(), start=1):
+        hashes, offsets = fingerprint_samples(samples)
+        index.add(song_id, hashes, offsets)
+        total_hashes += len(hashes)
+        audio_seconds += len(samples) / settings.SAMPLE_RATE
+    fingerprint_seconds = time.perf_counter() - start
+    index.save()
+    return index, {
+        "tracks": len(catalog),
+        "audio_seconds": audio_seconds,
+        "hashes": total_hashes,
+        "hashes_per_second": total_hashes / fingerprint_seconds,
+        "realtime_factor": audio_seconds / fingerprint_seconds,
+        "index_bytes": os.path.getsize(index_path),
+    }
+
+
+def run_queries(index, catalog, queries, clip_seconds, seed):
+    """
+    Recognizes distorted clips cut at random offsets.
+
+    A query is correct when the right song is found at its true offset (within one frame).
+
+    :returns: Dictionary distortion -> {"correct": [bool, ...], "latency": [seconds, ...]}.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(catalog)
+    clip_length = int(clip_seconds * settings.SAMPLE_RATE)
+    frame_seconds = get_format().time_step
+    results = {name: {"correct": [], "latency": []} for name in DISTORTIONS}
+
+    for query in range(queries):
+        song_index = int(rng.integers(len(names)))
+        samples = catalog[names[song_index]]
+        start = int(rng.integers(0, max(1, len(samples) - clip_length)))
+        clip = samples[start:start + clip_length]
+        for name, distort in DISTORTIONS.items():
+            distorted = distort(clip, rng)
+            begin = time.perf_counter()
+            hashes, offsets = fingerprint_samples(distorted)
+            match = index.find_song_by_hashes(list(zip(hashes.tolist(), offsets.tolist())))
+            results[name]["latency"].append(time.perf_counter() - begin)
+
+            expected_offset = start / settings.SAMPLE_RATE / frame_seconds
+            results[name]["correct"].append(
+                match is not None and match["SongID"] == str(song_index + 1)
+                and abs(match["Offset"] - expected_offset) <= 1)
+    return results
+
+
+def summarize(build, results):
+    """Aggregates the per-query results into the report dictionary."""
+    report = {"build": build, "distortions": {}}
+    for name, result in results.items():
+        latency_ms = np.array(result["latency"]) * 1000
+        report["distortions"][name] = {
+            "accuracy": float(np.mean(result["correct"])),
+            "p50_ms": float(np.percentile(latency_ms, 50)),
+            "p90_ms": float(np.percentile(latency_ms, 90)),
+            "p99_ms": float(np.percentile(latency_ms, 99)),
+        }
+    latency_ms = np.concatenate([result["latency"] for result in results.values()]) * 1000
+    report["overall"] = {
+        "accuracy": float(np.mean(np.concatenate([result["correct"] for result in results.values()]))),
+        "p50_ms": float(np.percentile(latency_ms, 50)),
+        "p90_ms": float(np.percentile(latency_ms, 90)),
+        "p99_ms": float(np.percentile(latency_ms, 99)),
+    }
+    return report
+
+
+def print_report(report):
+    build = report["build"]
+    print(f"\nCatalog: {build['tracks']} tracks, {build['audio_seconds'] / 60:.1f} min of audio")
+    print(f"Fingerprinting: {build['hashes']} hashes, {build['hashes_per_second']:.0f} hashes/s, "
+          f"{build['realtime_factor']:.0f}x real time")
+    print(f"Index size: {build['index_bytes'] / 2 ** 20:.2f} MiB "
+          f"({build['index_bytes'] / max(build['hashes'], 1):.1f} bytes/hash)\n")
+    print(f"{'Distortion':<26}{'Accuracy':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for name, row in list(report["distortions"].items()) + [("overall", report["overall"])]:
+        print(f"{name:<26}{row['accuracy']:>10.1%}{row['p50_ms']:>10.1f}{row['p90_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def check_gates(report, args):
+    """Returns the list of failed regression gates."""
+    failures = []
+    if args.min_accuracy is not None and report["overall"]["accuracy"] < args.min_accuracy:
+        failures.append(f"accuracy {report['overall']['accuracy']:.1%} < {args.min_accuracy:.1%}")
+    if args.max_p90_ms is not None and report["overall"]["p90_ms"] > args.max_p90_ms:
+        failures.append(f"p90 latency {report['overall']['p90_ms']:.1f} ms > {args.max_p90_ms} ms")
+    if args.min_hashes_per_second is not None and report["build"]["hashes_per_second"] < args.min_hashes_per_second:
+        failures.append(f"{report['build']['hashes_per_second']:.0f} hashes/s < {args.min_hashes_per_second}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fingerprinting speed and recognition accuracy offline.")
+    parser.add_argument("audio", nargs="*", default=["see-you-later-203103.mp3"], help="Audio files for the catalog")
+    parser.add_argument("--synthetic", type=int, default=10, help="Number of synthetic tracks")
+    parser.add_argument("--seconds", type=float, default=120, help="Length of the synthetic tracks in seconds")
+    parser.add_argument("--queries", type=int, default=60, help="Number of query clips (each with every distortion)")
+    parser.add_argument("--clip-seconds", type=float, default=8, help="Length of the query clips in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for clip positions and noise")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--min-accuracy", type=float, help="Fail if the overall accuracy is lower")
+    parser.add_argument("--max-p90-ms", type=float, help="Fail if the overall p90 query latency is higher")
+    parser.add_argument("--min-hashes-per-second", type=float, help="Fail if fingerprinting is slower")
+    args = parser.parse_args()
+
+    catalog = load_catalog(args.audio, args.synthetic, args.seconds)
+    if not catalog:
+        parser.error("The catalog is empty.")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index, build = build_index(catalog, os.path.join(temp_dir, "benchmark.idx"))
+        report = summarize(build, run_queries(index, catalog, args.queries, args.clip_seconds, args.seed))
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file, indent=2)
+
+    failures = check_gates(report, args)
+    for failure in failures:
+        print(f"[!] Regression gate failed: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
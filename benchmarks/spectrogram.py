@@ -0,0 +1,43 @@
+# spectrogram.py
+#
+# Compares the cached SpectrogramEngine with a fresh scipy.signal.spectrogram call,
+# the way a worker computes one spectrogram per file during batch ingestion.
+#
+#   python -m benchmarks.spectrogram [audio file]
+
+import argparse
+import numpy as np
+from scipy.signal import spectrogram
+from pipeline import settings
+from pipeline.audioconverter import decode_audio
+from pipeline.spectrogram import get_spectrogram_engine
+from benchmarks.pairing import best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spectrogram computation.")
+    parser.add_argument("audio", nargs="?", default="see-you-later-203103.mp3", help="Audio file to transform")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs (best is reported)")
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as audio_file:
+        audio = decode_audio(audio_file.read())
+    nperseg = int(settings.SAMPLE_RATE * settings.FFT_WINDOW_SIZE)
+    print(f"Audio: {len(audio) / settings.SAMPLE_RATE:.1f} s, nperseg: {nperseg}")
+
+    # The current path: int16 samples promoted to float64 and a new window and buffers on every call
+    scipy_time, (_, _, reference) = best_time(
+        lambda: spectrogram(audio, settings.SAMPLE_RATE, nperseg=nperseg), args.repeat)
+    print(f"scipy.signal.spectrogram (float64): {scipy_time * 1000:8.1f} ms")
+
+    for dtype in ("float64", "float32"):
+        engine = get_spectrogram_engine(nperseg, dtype=dtype)
+        engine.compute(audio)  # Warm up: allocate the buffers once, as a worker does on its first file
+        engine_time, (_, _, Sxx) = best_time(lambda: engine.compute(audio), args.repeat)
+        error = np.max(np.abs(Sxx - reference)) / np.max(reference)
+        print(f"SpectrogramEngine ({dtype}):        {engine_time * 1000:8.1f} ms "
+              f"({scipy_time / engine_time:.1f}x faster, max. relative error {error:.1e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# engine.py
+#
+# Equalizes WAV files block by block. Run it to apply a preset to many files:
+#
+#   python -m equalizer.engine --preset "Bass Boost" --output-dir equalized track1.wav track2.wav
+
+import argparse
+import io
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.signal import sosfilt
+from equalizer.filters import FilterBank, load_preset
+
+BLOCK_FRAMES = 65536  # Frames processed at once when streaming a file
+PREVIEW_SECONDS = 30  # Length of the audio preview on the equalizer page
+
+
+class EqualizerEngine:
+    """
+    Multi-band equalizer that processes audio block by block.
+
+    The output is ``x + sum((gain - 1) * band(x))``: every band filter extracts its
+    part of the signal, which is scaled by the band's gain. With all gains at 0 dB
+    the signal passes unchanged, and bands at 0 dB are skipped. Band filters are
+    the cached second-order sections of a FilterBank, and their state is carried from block to block,
+    so a long file gives the same result as filtering it in one piece while only one
+    block is held in memory. Every band filters all channels in a single call.
+
+    :ivar fs: Sampling rate in Hz.
+    :type fs: int
+    :ivar channels: Number of interleaved channels.
+    :type channels: int
+    :ivar gains_db: Gain of every band in dB.
+    :type gains_db: dict
+    """
+    def __init__(self, fs, gains_db, channels=1, filter_bank=None):
+        self.fs = fs
+        self.channels = channels
+        self.gains_db = dict(gains_db)
+        sections = (filter_bank or FilterBank()).sections(fs, self.gains_db)
+        self._sos = [sos for sos, _ in sections]
+        self._weights = [weight for _, weight in sections]
+        self.reset()
+
+    def reset(self):
+        """Clears the filter state, e.g. before processing another file."""
+        self._zi = [np.zeros((len(sos), self.channels, 2)) for sos in self._sos]
+
+    def process(self, block):
+        """
+        Equalizes the next block of the signal.
+
+        :param block: Array of samples, frames × channels (or 1D for mono).
+        :return: float64 array of the same shape.
+        """
+        samples = np.ascontiguousarray(np.reshape(block, (-1, self.channels)).T, dtype=np.float64)  # Channels × frames
+        output = samples.copy()
+        for index, (sos, weight) in enumerate(zip(self._sos, self._weights)):
+            band, self._zi[index] = sosfilt(sos, samples, axis=-1, zi=self._zi[index])
+            output += weight * band
+        return output.T.reshape(np.shape(block))
+
+
+def equalize_wav(source, destination, gains_db, block_frames=BLOCK_FRAMES, filter_bank=None, max_seconds=None,
+                 cancel=None):
+    """
+    Equalizes a 16-bit PCM WAV file block by block, with constant memory.
+
+    :param source: Path or binary file-like object of the input WAV.
+    :param destination: Path or writable binary file-like object of the output WAV.
+    :param gains_db: Gain of every band in dB, e.g. {"bass": 6, "treble": -3}.
+    :param block_frames: Number of frames processed at once.
+    :param filter_bank: FilterBank with the bands (None for the default bands).
+    :param max_seconds: Only equalize the beginning of the file, up to this many seconds.
+    :param cancel: Optional threading.Event; once it is set, processing stops after the current block.
+    :return: Number of frames written.
+    """
+    with wave.open(source, "rb") as wav_in:
+        params = wav_in.getparams()
+        if params.sampwidth != 2:
+            raise ValueError(f"Only 16-bit WAV files are supported, got {8 * params.sampwidth}-bit.")
+        engine = EqualizerEngine(params.framerate, gains_db, params.nchannels, filter_bank)
+        remaining = params.nframes
+        if max_seconds is not None:
+            remaining = min(remaining, int(max_seconds * params.framerate))
+        written = 0
+        with wave.open(destination, "wb") as wav_out:
+            wav_out.setnchannels(params.nchannels)
+            wav_out.setsampwidth(2)
+            wav_out.setframerate(params.framerate)
+            while remaining > 0 and not (cancel and cancel.is_set()):
+                raw = wav_in.readframes(min(block_frames, remaining))
+                if not raw:
+                    break
+                block = np.frombuffer(raw, dtype="<i2").reshape(-1, params.nchannels)
+                equalized = np.clip(np.rint(engine.process(block)), -32768, 32767).astype("<i2")
+                wav_out.writeframes(equalized.tobytes())
+                remaining -= len(block)
+                written += len(block)
+    return written
+
+
+def render_wav(data, gains_db, max_seconds=None, cancel=None, filter_bank=None):
+    """
+    Equalizes WAV content held in memory into a new in-memory WAV file.
+
+    :param data: Content of a 16-bit WAV file as bytes.
+    :param gains_db: Gain of every band in dB.
+    :param max_seconds: Only render the beginning, e.g. PREVIEW_SECONDS for a preview (None for all).
+    :param cancel: Optional threading.Event that stops the render when it is superseded.
+    :return: The equalized WAV as bytes, or None if the render was cancelled.
+    """
+    output = io.BytesIO()
+    equalize_wav(io.BytesIO(data), output, gains_db, filter_bank=filter_bank, max_seconds=max_seconds,
+                 cancel=cancel)
+    if cancel and cancel.is_set():
+        return None
+    return output.getvalue()
+
+
+def apply_preset(files, output_dir, preset, max_workers=4, filter_bank=None):
+    """
+    Equalizes many WAV files with the same preset, several at a time.
+
+    The preset is checked before any file is processed; a file that cannot be
+    equalized is reported and skipped without stopping the others.
+
+    :param files: Paths of 16-bit WAV files.
+    :param output_dir: Directory of the equalized files (same file names).
+    :param preset: Name of a built-in preset, path of a saved preset, or a dictionary of gains in dB.
+    :param max_workers: Number of files processed at the same time.
+    :param filter_bank: FilterBank with the bands (None for the default bands).
+    :return: Dictionary input path -> output path of the files that were equalized.
+    :raises ValueError: If the preset has unknown bands or invalid gains.
+    """
+    filter_bank = filter_bank or FilterBank()
+    gains_db = filter_bank.validate(load_preset(preset) if isinstance(preset, str) else preset)
+    os.makedirs(output_dir, exist_ok=True)
+
+    def process(path):
+        output_path = os.path.join(output_dir, os.path.basename(path))
+        try:
+            equalize_wav(path, output_path, gains_db, filter_bank=filter_bank)
+            return path, output_path
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Failed to equalize {path}: {e}")
+            return path, None
+
+    # sosfilt releases the GIL, so threads equalize files in parallel
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return {path: output_path for path, output_path in executor.map(process, files) if output_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply an equalizer preset to WAV files.")
+    parser.add_argument("files", nargs="+", help="16-bit WAV files to equalize")
+    parser.add_argument("--preset", required=True, help="Name of a built-in preset or path of a saved preset")
+    parser.add_argument("--output-dir", required=True, help="Directory of the equalized files")
+    parser.add_argument("--workers", type=int, default=4, help="Number of files processed at the same time")
+    args = parser.parse_args()
+
+    try:
+        written = apply_preset(args.files, args.output_dir, args.preset, max_workers=args.workers)
+    except (OSError, ValueError) as e:
+        parser.error(f"Cannot use preset {args.preset!r}: {e}")
+    print(f"Equalized {len(written)} of {len(args.files)} files into {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
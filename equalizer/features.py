@@ -1,8 +1,37 @@
-import wave
+import hashlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tempfile
 from matplotlib import pyplot as plt
 import streamlit as st
+from equalizer.engine import PREVIEW_SECONDS, render_wav
+from equalizer.filters import PRESETS
+from equalizer.preview import render_preview
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_preview(file_hash, gains, spectrum, _data):
+    """
+    Renders the preview of an uploaded file once per (file hash, EQ settings).
+
+    Moving a slider back to an earlier value, or any rerun that keeps the settings,
+    reuses the cached preview. The file content itself is not hashed by Streamlit
+    (leading underscore); ``file_hash`` identifies it.
+    """
+    return render_preview(io.BytesIO(_data), dict(gains), spectrum=spectrum)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_preview_audio(file_hash, gains, _data):
+    """Renders the first PREVIEW_SECONDS of an uploaded file in memory, once per (file hash, EQ settings)."""
+    return render_wav(_data, dict(gains), max_seconds=PREVIEW_SECONDS)
+
+
+@st.cache_resource
+def render_executor():
+    """Threads rendering full-length files for download, shared by all sessions."""
+    return ThreadPoolExecutor(max_workers=2)
 
 
 def equalizer_features():
@@ -14,60 +43,66 @@ def equalizer_features():
 
     if uploaded_file:
         st.subheader("Equalizer Settings")
-        bass_gain = st.slider("Bass Gain (dB)", -10, 10, 0)
-        midrange_gain = st.slider("Midrange Gain (dB)", -10, 10, 0)
-        treble_gain = st.slider("Treble Gain (dB)", -10, 10, 0)
+        preset = PRESETS[st.selectbox("Preset", list(PRESETS))]
+        bass_gain = st.slider("Bass Gain (dB)", -10, 10, preset["bass"])
+        midrange_gain = st.slider("Midrange Gain (dB)", -10, 10, preset["midrange"])
+        treble_gain = st.slider("Treble Gain (dB)", -10, 10, preset["treble"])
+
+        show_spectrum = st.checkbox("Show spectrum")
 
         try:
-            with wave.open(uploaded_file, "rb") as wav_file:
-                # Extract basic parameters and frames
-                params = wav_file.getparams()
-                raw_data = wav_file.readframes(params.nframes)
-
-                # Convert raw data into int16
-                audio_signal = np.frombuffer(raw_data, dtype=np.int16)
-
-                # If multiple channels exist, reduce to mono
-                if params.nchannels > 1:
-                    audio_signal = audio_signal[::params.nchannels]
-
-                # Correctly compute the sampling rate and signal duration
-                frame_rate = params.framerate
-                duration = params.nframes / float(frame_rate)
-                time = np.linspace(0, duration, len(audio_signal))
-
-                # Modify audio signal (apply basic amplifications for visualization)
-                equalized_signal = (
-                        audio_signal * (1 + bass_gain / 100) +
-                        audio_signal * (1 + midrange_gain / 100) +
-                        audio_signal * (1 + treble_gain / 100)
-                )
-                equalized_signal = np.clip(equalized_signal, -32768, 32767)
-
-                st.subheader("Equalized Signal Visualization")
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.plot(time, equalized_signal, label="Equalized Signal")
-                ax.set_xlabel("Time (s)")
-                ax.set_ylabel("Amplitude")
-                ax.legend(loc="upper right")
+            gains_db = {"bass": bass_gain, "midrange": midrange_gain, "treble": treble_gain}
+            data = uploaded_file.getvalue()
+            file_hash, gains = hashlib.sha256(data).hexdigest(), tuple(sorted(gains_db.items()))
+            preview = cached_preview(file_hash, gains, show_spectrum, data)
+
+            st.subheader("Equalized Signal Visualization")
+            fig, ax = plt.subplots(figsize=(10, 4))
+            # One min/max pair per pixel column instead of every sample
+            ax.fill_between(preview["times"], preview["min"][:, 0], preview["max"][:, 0],
+                            linewidth=0.5, label="Equalized Signal")
+            ax.set_xlim(0, preview["duration"])
+            ax.set_xlabel("Time (s)")
+            ax.set_ylabel("Amplitude")
+            ax.legend(loc="upper right")
+            st.pyplot(fig)
+            plt.close(fig)
+
+            if "freqs" in preview:
+                fig, ax = plt.subplots(figsize=(10, 3))
+                ax.semilogx(preview["freqs"], 10 * np.log10(preview["power"] + 1e-12))
+                ax.set_xlabel("Frequency (Hz)")
+                ax.set_ylabel("Power (dB)")
                 st.pyplot(fig)
+                plt.close(fig)
+
+            # Listen to the beginning of the processed audio, rendered in memory
+            render_key = (file_hash, gains)
+            st.audio(cached_preview_audio(file_hash, gains, data), format="audio/wav")
+            st.caption(f"Preview of the first {PREVIEW_SECONDS} seconds.")
 
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-                    with wave.open(temp_file.name, "wb") as out_wav:
-                        # Write the output signal into WAV format
-                        out_wav.setnchannels(1)  # Mono
-                        out_wav.setsampwidth(2)  # 16-bit depth
-                        out_wav.setframerate(frame_rate)
-                        out_wav.writeframes(equalized_signal.astype(np.int16).tobytes())
-
-                    # Listen to and download the processed audio
-                    st.audio(temp_file.name, format="audio/wav")
-                    st.download_button(
-                        label="Download Equalized Audio",
-                        data=open(temp_file.name, "rb").read(),
-                        file_name="equalized.wav",
-                        mime="audio/wav"
-                    )
+            # Render the whole file only for the download; a render for other settings is cancelled
+            render = st.session_state.get("equalizer_render")
+            if render and render["key"] != render_key:
+                render["future"].cancel()  # Not started yet
+                render["cancel"].set()  # Already running
+                render = st.session_state["equalizer_render"] = None
+            if render is None and st.button("Prepare Download"):
+                cancel = threading.Event()
+                render = st.session_state["equalizer_render"] = {
+                    "key": render_key,
+                    "cancel": cancel,
+                    "future": render_executor().submit(render_wav, data, gains_db, cancel=cancel),
+                }
+            if render:
+                with st.spinner("Equalizing the whole file..."):
+                    equalized = render["future"].result()
+                st.download_button(
+                    label="Download Equalized Audio",
+                    data=equalized,
+                    file_name="equalized.wav",
+                    mime="audio/wav"
+                )
 
         except Exception as e:
             st.error(f"Error processing the audio file: {e}")
@@ -1,4 +1,44 @@
-from scipy.signal import butter, lfilter
+import json
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+# Bands of the equalizer: name -> (filter type, cutoff frequency in Hz or (low, high))
+BANDS = {
+    "bass": ("low", 250.0),
+    "midrange": ("band", (250.0, 4000.0)),
+    "treble": ("high", 4000.0),
+}
+FILTER_ORDER = 4  # Butterworth order of every band filter
+
+# Built-in presets: name -> gain of every band in dB
+PRESETS = {
+    "Flat": {"bass": 0, "midrange": 0, "treble": 0},
+    "Bass Boost": {"bass": 6, "midrange": 0, "treble": 0},
+    "Treble Boost": {"bass": 0, "midrange": 0, "treble": 6},
+    "Vocal": {"bass": -3, "midrange": 4, "treble": 1},
+    "Loudness": {"bass": 5, "midrange": -2, "treble": 4},
+}
+
+
+@lru_cache(maxsize=256)
+def design_sos(btype, cutoff, fs, order=5):
+    """
+    Designs a Butterworth filter as second-order sections, once per set of parameters.
+
+    Second-order sections stay numerically stable for high orders and low cutoffs,
+    where the transfer function (b, a) form loses precision.
+
+    :param btype: Filter type: 'low', 'high' or 'band'.
+    :param cutoff: Cutoff frequency in Hz, or a tuple (low, high) for 'band'.
+    :param fs: Sampling rate in Hz.
+    :param order: Order of the filter.
+    :return: Array of second-order sections (sections × 6), shared by every caller; do not modify it.
+    """
+    nyquist = 0.5 * fs  # Nyquist frequency
+    normal_cutoff = np.asarray(cutoff, dtype=float) / nyquist  # Normalized cutoff frequencies
+    return butter(order, normal_cutoff, btype=btype, analog=False, output='sos')
+
 
 def butter_lowpass_filter(data, cutoff, fs, order=5, gain=1.0):
     """
@@ -11,10 +51,8 @@ def butter_lowpass_filter(data, cutoff, fs, order=5, gain=1.0):
     :param gain: Gain to apply to the filtered signal
     :return: Filtered audio signal with applied gain
     """
-    nyquist = 0.5 * fs  # Nyquist frequency
-    normal_cutoff = cutoff / nyquist  # Normalized cutoff frequency
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)  # Design the filter
-    filtered_data = lfilter(b, a, data)  # Apply the filter to the data
+    sos = design_sos('low', float(cutoff), fs, order)  # Design the filter (cached)
+    filtered_data = sosfilt(sos, data)  # Apply the filter to the data
     return filtered_data * gain  # Apply bass gain
 
 def butter_highpass_filter(data, cutoff, fs, order=5, gain=1.0):
@@ -28,10 +66,8 @@ def butter_highpass_filter(data, cutoff, fs, order=5, gain=1.0):
     :param gain: Gain to apply to the filtered signal
     :return: Filtered audio signal with applied gain
     """
-    nyquist = 0.5 * fs  # Nyquist frequency
-    normal_cutoff = cutoff / nyquist  # Normalized cutoff frequency
-    b, a = butter(order, normal_cutoff, btype='high', analog=False)  # Design the filter
-    filtered_data = lfilter(b, a, data)  # Apply the filter to the data
+    sos = design_sos('high', float(cutoff), fs, order)  # Design the filter (cached)
+    filtered_data = sosfilt(sos, data)  # Apply the filter to the data
     return filtered_data * gain  # Apply treble gain
 
 def equalizer(data, freq_range, fs, order=5, gain=1.0):
@@ -46,9 +82,84 @@ def equalizer(data, freq_range, fs, order=5, gain=1.0):
     :return: Filtered audio signal with applied gain
     """
     low, high = freq_range  # Define band range
-    nyquist = 0.5 * fs  # Nyquist frequency
-    low_normal = low / nyquist  # Normalized low cutoff frequency
-    high_normal = high / nyquist  # Normalized high cutoff frequency
-    b, a = butter(order, [low_normal, high_normal], btype='band', analog=False)  # Design the band-pass filter
-    filtered_data = lfilter(b, a, data)  # Apply the filter to the data
+    sos = design_sos('band', (float(low), float(high)), fs, order)  # Design the band-pass filter (cached)
+    filtered_data = sosfilt(sos, data)  # Apply the filter to the data
     return filtered_data * gain  # Apply midrange gain
+
+
+def db_to_gain(gain_db):
+    return 10.0 ** (gain_db / 20.0)
+
+
+class FilterBank:
+    """
+    Set of equalizer bands whose filter designs are computed once and reused.
+
+    Designs come from design_sos, which caches them by (type, cutoffs, fs, order)
+    for the whole process, so re-rendering after a slider change and equalizing a
+    whole catalog with one preset never redesign a filter.
+
+    :ivar bands: Band name -> (filter type, cutoff in Hz or (low, high)).
+    :type bands: dict
+    :ivar order: Butterworth order of every band filter.
+    :type order: int
+    """
+    def __init__(self, bands=None, order=FILTER_ORDER):
+        self.bands = dict(BANDS if bands is None else bands)
+        self.order = order
+
+    def validate(self, gains_db):
+        """
+        Checks that every gain belongs to a band of this filter bank.
+
+        :param gains_db: Gain of every band in dB.
+        :return: Dictionary band name -> gain in dB as float.
+        :raises ValueError: If a band is unknown or a gain is not a number.
+        """
+        unknown = sorted(set(gains_db) - set(self.bands))
+        if unknown:
+            raise ValueError(f"Unknown equalizer bands {unknown}, expected some of {sorted(self.bands)}.")
+        try:
+            return {name: float(gain_db) for name, gain_db in gains_db.items()}
+        except (TypeError, ValueError):
+            raise ValueError(f"Band gains must be numbers in dB, got {gains_db}.") from None
+
+    def sections(self, fs, gains_db):
+        """
+        Returns the filters of the bands whose gain is not 0 dB.
+
+        :param fs: Sampling rate in Hz.
+        :param gains_db: Gain of every band in dB.
+        :return: List of tuples (sos, weight); a band contributes ``weight * band(x)`` to the output.
+        :raises ValueError: If a band is unknown (see validate).
+        """
+        return [(design_sos(*self.bands[name], fs, self.order), db_to_gain(gain_db) - 1.0)
+                for name, gain_db in self.validate(gains_db).items() if gain_db]
+
+
+def save_preset(path, gains_db):
+    """
+    Saves the gains of the bands as a JSON preset file.
+
+    :param path: Path of the preset file.
+    :param gains_db: Gain of every band in dB.
+    """
+    with open(path, "w") as preset_file:
+        json.dump({"gains_db": gains_db}, preset_file, indent=2)
+
+
+def load_preset(preset):
+    """
+    Returns the band gains of a built-in preset or of a saved preset file.
+
+    :param preset: Name in PRESETS or path of a file written by save_preset.
+    :return: Dictionary band name -> gain in dB.
+    :raises ValueError: If the file is not a preset file.
+    """
+    if preset in PRESETS:
+        return dict(PRESETS[preset])
+    with open(preset) as preset_file:
+        saved = json.load(preset_file)
+    if not isinstance(saved, dict) or not isinstance(saved.get("gains_db"), dict):
+        raise ValueError(f"{preset} is not a preset file.")
+    return dict(saved["gains_db"])
@@ -0,0 +1,90 @@
+import wave
+import numpy as np
+from scipy.signal import welch
+from equalizer.engine import BLOCK_FRAMES, EqualizerEngine
+
+PREVIEW_WIDTH = 1000  # Number of min/max buckets of the waveform (about one per pixel)
+SPECTRUM_BINS = 256  # Number of log-spaced frequency bins of the spectrum
+SPECTRUM_NPERSEG = 4096  # Welch segment length of the spectrum
+
+
+def peak_envelope(samples, bucket):
+    """
+    Reduces a signal to the minimum and maximum of every bucket of samples.
+
+    Unlike plotting every n-th sample, every peak stays visible.
+
+    :param samples: Array of samples, frames × channels.
+    :param bucket: Number of frames per bucket.
+    :return: Tuple of arrays (minimums, maximums), buckets × channels.
+    """
+    starts = np.arange(0, len(samples), bucket)
+    return np.minimum.reduceat(samples, starts, axis=0), np.maximum.reduceat(samples, starts, axis=0)
+
+
+def log_bins(freqs, power, bins=SPECTRUM_BINS):
+    """
+    Averages a power spectrum into log-spaced frequency bins.
+
+    :param freqs: Frequencies of the spectrum in Hz (ascending, starting at 0).
+    :param power: Power of every frequency.
+    :param bins: Number of bins.
+    :return: Tuple of arrays (bin center frequencies, mean power); empty bins are dropped.
+    """
+    edges = np.geomspace(max(freqs[1], 1.0), freqs[-1], bins + 1)
+    index = np.clip(np.searchsorted(edges, freqs[1:], side="right") - 1, 0, bins - 1)
+    counts = np.bincount(index, minlength=bins)
+    sums = np.bincount(index, weights=power[1:], minlength=bins)
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    filled = counts > 0
+    return centers[filled], sums[filled] / counts[filled]
+
+
+def render_preview(source, gains_db, width=PREVIEW_WIDTH, spectrum=False, filter_bank=None):
+    """
+    Computes a small preview of the equalized signal of a WAV file.
+
+    The file is equalized block by block, and every block is reduced to the min/max
+    envelope of its buckets right away, so the preview has ``width`` points however
+    long the file is, and memory stays constant.
+
+    :param source: Path or binary file-like object of a 16-bit WAV file.
+    :param gains_db: Gain of every band in dB.
+    :param width: Number of buckets of the waveform.
+    :param spectrum: Also compute the averaged power spectrum of the equalized signal.
+    :param filter_bank: FilterBank with the bands (None for the default bands).
+    :return: Dictionary with "times" (bucket starts in seconds), "min" and "max"
+        (buckets × channels), "duration" and, if requested, "freqs" and "power".
+    """
+    with wave.open(source, "rb") as wav_file:
+        params = wav_file.getparams()
+        if params.sampwidth != 2:
+            raise ValueError(f"Only 16-bit WAV files are supported, got {8 * params.sampwidth}-bit.")
+        engine = EqualizerEngine(params.framerate, gains_db, params.nchannels, filter_bank)
+        bucket = max(1, -(-params.nframes // width))
+        block_frames = max(1, BLOCK_FRAMES // bucket) * bucket  # Blocks hold whole buckets
+
+        minimums, maximums, power, segments = [], [], 0.0, 0
+        while True:
+            raw = wav_file.readframes(block_frames)
+            if not raw:
+                break
+            block = engine.process(np.frombuffer(raw, dtype="<i2").reshape(-1, params.nchannels))
+            np.clip(block, -32768, 32767, out=block)  # As in the written file
+            block_min, block_max = peak_envelope(block, bucket)
+            minimums.append(block_min)
+            maximums.append(block_max)
+            if spectrum and len(block) >= SPECTRUM_NPERSEG:
+                freqs, block_power = welch(block.mean(axis=1), params.framerate, nperseg=SPECTRUM_NPERSEG)
+                weight = len(block) // SPECTRUM_NPERSEG
+                power, segments = power + weight * block_power, segments + weight
+
+    preview = {
+        "times": np.arange(sum(len(block) for block in minimums)) * bucket / params.framerate,
+        "min": np.concatenate(minimums) if minimums else np.empty((0, params.nchannels)),
+        "max": np.concatenate(maximums) if maximums else np.empty((0, params.nchannels)),
+        "duration": params.nframes / params.framerate,
+    }
+    if spectrum and segments:
+        preview["freqs"], preview["power"] = log_bins(freqs, power / segments)
+    return preview
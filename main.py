@@ -1,4 +1,6 @@
+import streamlit as st
 from App.app import StreamlitApp
+from Databank.Storage import create_storage
 from dynaconf import settings
 import os
 # Load the configuration settings
@@ -9,8 +11,29 @@ table_name_fingerprints = os.getenv('AWS_TABLE_NAME_SONGDATA')
 table_name_data = os.getenv('AWS_TABLE_NAME_HASHES')
 bucket_name = os.getenv('AWS_BUCKET_NAME')
 user_table_name = os.getenv('AWS_USER_TABLE_NAME')
+fingerprint_index_path = os.getenv('TUNESCOUT_INDEX_PATH')  # Optional local fingerprint index
+recognition_url = os.getenv('TUNESCOUT_RECOGNITION_URL')  # Optional recognition service (pipeline/service.py)
+storage_backend = os.getenv('TUNESCOUT_STORAGE', 'aws')  # "aws" (DynamoDB and S3) or "local" (SQLite and files)
+data_directory = os.getenv('TUNESCOUT_DATA_DIR', 'data')  # Directory of the local storage
 
-# Initialize and run the Streamlit app
-app = StreamlitApp(aws_access_key, aws_secret_key, aws_region, table_name_fingerprints, table_name_data, bucket_name, user_table_name)
-app.run()
 
+
+@st.cache_resource
+def load_app():
+    """
+    Creates the app once per process; Streamlit reruns and sessions reuse it with its
+    stores, AWS clients and connection pools.
+    """
+    # Create the stores of the selected backend
+    if storage_backend == 'local':
+        storage = create_storage('local', directory=data_directory, fingerprint_index_path=fingerprint_index_path)
+    else:
+        storage = create_storage('aws', aws_access_key_id=aws_access_key, aws_secret_access_key=aws_secret_key,
+                                 region_name=aws_region, songs_table_name=table_name_fingerprints,
+                                 hashes_table_name=table_name_data, bucket_name=bucket_name,
+                                 user_table=user_table_name, fingerprint_index_path=fingerprint_index_path)
+    return StreamlitApp(storage, recognition_url)
+
+
+# Initialize and run the Streamlit app
+load_app().run()
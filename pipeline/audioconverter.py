@@ -1,6 +1,7 @@
 # audioconverter.py
 
 import subprocess
+import numpy as np
 from pipeline import settings
 
 
@@ -22,4 +23,62 @@ def convert_to_wav(input_path, output_path):
         raise RuntimeError(f"ffmpeg error: {result.stderr.decode()}")
 
 
+def pcm_command(input_path="pipe:0"):
+    """
+    Builds an ffmpeg command that writes raw 16-bit mono PCM at the configured sample rate to stdout.
+
+    :param input_path: Input file path, or "pipe:0" to read from stdin.
+    :returns: Command as a list of arguments.
+    """
+    stdin_option = [] if input_path == "pipe:0" else ["-nostdin"]  # Never wait for input on stdin
+    return [
+        "ffmpeg", "-v", "error", *stdin_option, "-i", input_path,
+        "-f", "s16le", "-acodec", "pcm_s16le",  # Raw little-endian 16-bit samples
+        "-ac", "1",  # Mono
+        "-ar", str(settings.SAMPLE_RATE),  # Adjust sample rate
+        "pipe:1"
+    ]
+
+
+def decode_audio(data):
+    """
+    Decodes audio bytes (MP3, WAV, ...) in memory, without temporary files.
 
+    The bytes are piped into ffmpeg's stdin and the raw PCM output is read from its
+    stdout straight into a NumPy buffer. Container formats that need a seekable
+    input (e.g. some MP4/M4A files) cannot be decoded from a pipe.
+
+    :param data: Encoded audio as bytes.
+    :returns: NumPy int16 array of mono samples at settings.SAMPLE_RATE.
+    """
+    result = subprocess.run(pcm_command(), input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {result.stderr.decode()}")
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def decode_audio_blocks(input_path, block_seconds=settings.STREAM_BLOCK_SECONDS):
+    """
+    Decodes an audio file block by block, so long files never have to fit in memory.
+
+    :param input_path: Path to the input file.
+    :param block_seconds: Length of the yielded blocks in seconds.
+    :returns: Generator of NumPy int16 arrays of mono samples at settings.SAMPLE_RATE.
+    """
+    block_bytes = 2 * int(block_seconds * settings.SAMPLE_RATE)
+    process = subprocess.Popen(pcm_command(input_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg error: {stderr.decode()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
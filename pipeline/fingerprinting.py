@@ -1,28 +1,32 @@
-import uuid
 import numpy as np
 from scipy.io import wavfile
 from scipy.signal import spectrogram
 from scipy.ndimage import maximum_filter
 from pipeline import settings  # Global settings for processing
+from pipeline.hash_format import get_format
+from pipeline.spectrogram import get_spectrogram_engine
 
 
 # ========================
 # Helper Functions
 # ========================
 
-def compute_spectrogram(audio):
+def compute_spectrogram(audio, dtype=settings.SPECTROGRAM_DTYPE, reuse_buffers=False):
     """
        Computes a spectrogram from audio data using global settings.
        :param audio: NumPy array of audio data (1D array).
+       :param dtype: Floating point type of the computation, "float64" or "float32"
+           (faster and half the memory, with slightly less precise peak values).
+       :param reuse_buffers: Use the thread's cached SpectrogramEngine. Faster, but the
+           returned Sxx is overwritten by the next call with the same settings.
        :returns: Frequencies (f), timestamps (t), spectrogram data (Sxx)
        """
     nperseg = int(settings.SAMPLE_RATE * settings.FFT_WINDOW_SIZE)
     nperseg = min(len(audio), nperseg)  # Ensure nperseg does not exceed audio length
 
-    # Debugging
-    print(f"Audio length: {len(audio)}, nperseg: {nperseg}")
-
-    return spectrogram(audio, settings.SAMPLE_RATE, nperseg=nperseg)
+    if reuse_buffers:
+        return get_spectrogram_engine(nperseg, dtype=dtype).compute(audio)
+    return spectrogram(np.asarray(audio, dtype=dtype), settings.SAMPLE_RATE, nperseg=nperseg)
 
 
 def load_audio_file(filename):
@@ -51,60 +55,73 @@ def load_audio_file(filename):
 def convert_to_tf_pairs(peaks, t, f):
     """
     Converts frequency and time indices into actual frequency-time values.
-    :param peaks: List of peaks as (y, x) indices.
+    :param peaks: Tuple of arrays (y, x) with the frequency and time indices of the peaks.
     :param t: Timestamps from the spectrogram.
     :param f: Frequencies from the spectrogram.
     :returns: Array of (frequency, time) pairs.
     """
-    return np.array([(f[i[0]], t[i[1]]) for i in peaks])
+    y_peaks, x_peaks = peaks
+    return np.column_stack((f[y_peaks], t[x_peaks]))
 
 
 def generate_hash(p1, p2):
     """
-    Generates a hash from two frequency-time points.
+    Generates a packed uint32 hash from two frequency-time points.
     :param p1: Starting point as (frequency, time).
     :param p2: Target point as (frequency, time).
-    :returns: Hash combining the two points.
+    :returns: Hash combining the two points (see pipeline.hash_format).
     """
-    return hash((p1[0], p2[0], p2[1] - p1[1]))
+    return int(get_format().encode(p1[0], p2[0], p2[1] - p1[1]))
 
 
 # ========================
 # Core Functions
 # ========================
 
-def extract_spectrogram(filename):
+def extract_spectrogram(filename, reuse_buffers=False):
     """
     Converts an audio file to a spectrogram.
     :param filename: Path to the audio file.
+    :param reuse_buffers: Compute it with the thread's cached SpectrogramEngine (see compute_spectrogram).
     :returns: Frequencies (f), timestamps (t), spectrogram data (Sxx)
     """
     audio_data = load_audio_file(filename)
-    return compute_spectrogram(audio_data)
+    return compute_spectrogram(audio_data, reuse_buffers=reuse_buffers)
 
 
-def find_spectrogram_peaks(Sxx):
+def find_spectrogram_peaks(Sxx, columns=None, min_db=settings.PEAK_MIN_DB):
     """
     Identifies frequency peaks in the spectrogram using a maximum filter.
     Peaks are chosen as the loudest points within a region.
 
     :param Sxx: Spectrogram data matrix.
-    :returns: List of peaks as (y, x) indices.
+    :param columns: Optional (start, stop) range of time columns to return peaks for.
+        The remaining columns only serve as context for the maximum filter.
+    :param min_db: Optional minimum log-magnitude (10 * log10 of the spectrogram power)
+        of a peak, to ignore near-silent regions. None keeps every non-zero peak.
+    :returns: Tuple of arrays (y, x) with the peak indices, loudest first.
     """
+    start, stop = (0, Sxx.shape[1]) if columns is None else columns
     data_max = maximum_filter(Sxx, size=settings.PEAK_BOX_SIZE, mode='constant', cval=0.0)
-    peak_mask = (Sxx == data_max)
+    # Silent regions equal their zero-padded maximum, so zero values are never peaks
+    peak_mask = (Sxx == data_max) & (Sxx > (0 if min_db is None else 10 ** (min_db / 10)))
+    peak_mask[:, :start] = False
+    peak_mask[:, stop:] = False
     y_peaks, x_peaks = peak_mask.nonzero()
 
-    # Sort peaks by intensity
-    peak_values = Sxx[y_peaks, x_peaks]
-    sorted_indices = peak_values.argsort()[::-1]
-    peaks = [(y_peaks[idx], x_peaks[idx]) for idx in sorted_indices]
-
     # Limit number of peaks based on efficiency
-    total_area = Sxx.shape[0] * Sxx.shape[1]
+    total_area = Sxx.shape[0] * (stop - start)
     peak_limit = int((total_area / (settings.PEAK_BOX_SIZE ** 2)) * settings.POINT_EFFICIENCY)
 
-    return peaks[:peak_limit]
+    # Select the loudest peaks without sorting all of them, then sort only those by intensity
+    peak_values = Sxx[y_peaks, x_peaks]
+    if len(peak_values) > peak_limit > 0:
+        selected = np.argpartition(peak_values, -peak_limit)[-peak_limit:]
+    else:
+        selected = np.arange(min(len(peak_values), max(peak_limit, 0)))
+    selected = selected[np.argsort(peak_values[selected], kind="stable")[::-1]]
+
+    return y_peaks[selected], x_peaks[selected]
 
 
 def compute_target_zone(anchor, points, width, height, offset):
@@ -128,28 +145,83 @@ def compute_target_zone(anchor, points, width, height, offset):
             yield point
 
 
-def generate_hashes(points, filename):
+def pair_peaks(anchors, targets=None, fan_out=settings.TARGET_FAN_OUT):
     """
-    Generates hashes from frequency-time peak pairs.
-    Uses the filename to create a unique song ID.
+    Pairs every anchor point with the points inside its target zone.
 
-    :param points: List of frequency-time points.
-    :param filename: Path to the file (used for generating a song ID).
-    :returns: List of hashes in the form (hash, time offset, song_id).
+    The targets are sorted by time once, so the time window of each anchor is found
+    with a binary search instead of scanning all points. The frequency bounds are
+    then applied to all candidate pairs at once with an array mask.
+
+    :param anchors: Array of anchor points as (frequency, time) rows.
+    :param targets: Array of target points as (frequency, time) rows (defaults to the anchors).
+    :param fan_out: Maximum number of targets per anchor (closest in time first), or None for no limit.
+    :returns: Arrays (anchor_index, target_index) with one entry per pair.
+    """
+    anchors = np.asarray(anchors, dtype=np.float64).reshape(-1, 2)
+    targets = anchors if targets is None else np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+
+    # Time window of every anchor in the time-sorted targets
+    order = np.argsort(targets[:, 1], kind="stable")
+    target_times = targets[order, 1]
+    x_min = anchors[:, 1] + settings.TARGET_START
+    x_max = x_min + settings.TARGET_T
+    lower = np.searchsorted(target_times, x_min, side="left")
+    upper = np.searchsorted(target_times, x_max, side="right")
+    counts = upper - lower
+
+    # Expand the windows into candidate pairs, grouped by anchor and ordered by time
+    anchor_index = np.repeat(np.arange(len(anchors)), counts)
+    window_start = np.repeat(lower - (np.cumsum(counts) - counts), counts)
+    target_index = order[np.arange(counts.sum()) + window_start]
+
+    # Keep only the candidates inside the frequency range of the target zone
+    y_min = anchors[anchor_index, 0] - (settings.TARGET_F * 0.5)
+    y_max = y_min + settings.TARGET_F
+    target_freqs = targets[target_index, 0]
+    in_zone = (y_min <= target_freqs) & (target_freqs <= y_max)
+    anchor_index, target_index = anchor_index[in_zone], target_index[in_zone]
+
+    if fan_out is not None and len(anchor_index):
+        # Rank of every pair within its anchor's group
+        group_starts = np.flatnonzero(np.r_[True, anchor_index[1:] != anchor_index[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(anchor_index)])
+        rank = np.arange(len(anchor_index)) - np.repeat(group_starts, group_sizes)
+        anchor_index, target_index = anchor_index[rank < fan_out], target_index[rank < fan_out]
+
+    return anchor_index, target_index
+
+
+def generate_hash_arrays(points, fan_out=settings.TARGET_FAN_OUT, targets=None):
     """
-    hashes = []
-    song_id = str(uuid.uuid5(uuid.NAMESPACE_OID, filename).int)  # Unique song ID
+    Generates packed hashes and anchor offsets from frequency-time peak pairs as NumPy arrays.
 
-    for anchor in points:
-        for target in compute_target_zone(
-                anchor, points, settings.TARGET_T, settings.TARGET_F, settings.TARGET_START):
-            hashes.append((
-                str(generate_hash(anchor, target)),
-                str(int(anchor[1])),
-                song_id
-            ))
+    :param points: Array of frequency-time points used as anchors.
+    :param fan_out: Maximum number of targets per anchor, or None for no limit.
+    :param targets: Array of frequency-time points to pair with (defaults to the anchors).
+    :returns: uint32 arrays (hashes, offsets) with one entry per peak pair, offsets in frames.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    targets = points if targets is None else np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+    anchor_index, target_index = pair_peaks(points, targets, fan_out=fan_out)
+    anchors, targets = points[anchor_index], targets[target_index]
 
-    return hashes
+    hash_format = get_format()
+    hashes = hash_format.encode(anchors[:, 0], targets[:, 0], targets[:, 1] - anchors[:, 1])
+    offsets = hash_format.encode_offsets(anchors[:, 1])
+    return hashes, offsets
+
+
+def generate_hashes(points, fan_out=settings.TARGET_FAN_OUT):
+    """
+    Generates hashes from frequency-time peak pairs.
+
+    :param points: List of frequency-time points.
+    :param fan_out: Maximum number of targets per anchor, or None for no limit.
+    :returns: List of hashes in the form (hash, frame offset), both integers.
+    """
+    hashes, offsets = generate_hash_arrays(points, fan_out)
+    return list(zip(hashes.tolist(), offsets.tolist()))
 
 
 # ========================
@@ -162,10 +234,10 @@ def fingerprint_file(filename):
     :param filename: Path to the audio file.
     :returns: List of hashes.
     """
-    f, t, Sxx = extract_spectrogram(filename)
+    f, t, Sxx = extract_spectrogram(filename, reuse_buffers=True)
     peaks = find_spectrogram_peaks(Sxx)
     peak_points = convert_to_tf_pairs(peaks, t, f)
-    hashes = generate_hashes(peak_points, filename)
+    hashes = generate_hashes(peak_points)
 
     print(f"\n[✓] Fingerprinting completed for: {filename}")
     print(f"    - Total hashes: {len(hashes)}")
@@ -179,13 +251,152 @@ def fingerprint_audio_stream(frames):
     :param frames: Audio frames as a NumPy array.
     :returns: List of hashes.
     """
-    f, t, Sxx = compute_spectrogram(frames)
+    f, t, Sxx = compute_spectrogram(frames, reuse_buffers=True)
     peaks = find_spectrogram_peaks(Sxx)
     peak_points = convert_to_tf_pairs(peaks, t, f)
-    hashes = generate_hashes(peak_points, "streamed_audio")
+    hashes = generate_hashes(peak_points)
 
     print(f"\n[✓] Fingerprinting for audio stream completed.")
     print(f"    - Total hashes generated: {len(hashes)}")
     print(f"    - Example hashes: {hashes[:5]} ... (showing 5 of {len(hashes)})\n")  # Print first 5 fingerprints
 
     return hashes
+
+
+# ========================
+# Streaming Fingerprinting
+# ========================
+
+class StreamingFingerprinter:
+    """
+    Fingerprints audio incrementally, block by block, with bounded memory.
+
+    Samples are pushed in arbitrary chunks. Whenever enough samples for a block of
+    spectrogram frames have arrived, the block is transformed together with a halo
+    of ``PEAK_BOX_SIZE // 2`` frames on each side, so the maximum filter sees the
+    same neighbourhood as it would on the full track. Peaks are kept until every
+    target they can be paired with is known, and hashes are returned with offsets
+    relative to the start of the stream.
+
+    The spectrogram frames are identical to a full-track spectrogram. The only
+    difference is that the peak limit (POINT_EFFICIENCY) is applied per block
+    instead of over the whole track.
+
+    :ivar block_frames: Number of spectrogram frames processed per block.
+    :type block_frames: int
+    :ivar fan_out: Maximum number of targets per anchor, or None for no limit.
+    :type fan_out: int | None
+    :ivar lookahead: Number of frames after a block that must be known before it is
+        processed. Below ``PEAK_BOX_SIZE // 2`` hashes arrive sooner, but peaks at the
+        end of a block may differ from the full-track result.
+    :type lookahead: int
+    """
+    def __init__(self, block_seconds=settings.STREAM_BLOCK_SECONDS, fan_out=settings.TARGET_FAN_OUT, lookahead=None):
+        self.nperseg = int(settings.SAMPLE_RATE * settings.FFT_WINDOW_SIZE)
+        self.hop = self.nperseg - self.nperseg // 8  # Default overlap of scipy.signal.spectrogram
+        self.halo = settings.PEAK_BOX_SIZE // 2
+        self.lookahead = self.halo if lookahead is None else lookahead
+        self.block_frames = max(1, int(block_seconds * settings.SAMPLE_RATE) // self.hop)
+        self.fan_out = fan_out
+
+        self._buffer = np.empty(0, dtype=settings.SPECTROGRAM_DTYPE)
+        self._buffer_start = 0  # Stream position of the first buffered sample
+        self._next_frame = 0  # First frame whose peaks have not been extracted yet
+        self._peaks = np.empty((0, 2))  # Peaks that still wait for targets, sorted by time
+
+    def push(self, samples):
+        """
+        Adds audio samples to the stream.
+
+        :param samples: 1D NumPy array of mono audio samples.
+        :returns: uint32 arrays (hashes, offsets) of all hashes that became complete.
+        """
+        self._buffer = np.concatenate((self._buffer, np.asarray(samples, dtype=self._buffer.dtype)))
+        results = []
+        while self._frames_available() >= self._next_frame + self.block_frames + self.lookahead:
+            results.append(self._process(self._next_frame + self.block_frames, final=False))
+        return self._concatenate(results)
+
+    def flush(self):
+        """
+        Processes the remaining samples at the end of the stream.
+
+        :returns: uint32 arrays (hashes, offsets) of the remaining hashes.
+        """
+        frames = self._frames_available()
+        if frames > self._next_frame:
+            return self._process(frames, final=True)
+        return self._emit(np.inf)
+
+    def _frames_available(self):
+        total_samples = self._buffer_start + len(self._buffer)
+        if total_samples < self.nperseg:
+            return 0
+        return (total_samples - self.nperseg) // self.hop + 1
+
+    def _process(self, core_end, final):
+        first_frame = max(0, self._next_frame - self.halo)
+        last_frame = min(self._frames_available(), core_end + self.lookahead)
+        start = first_frame * self.hop - self._buffer_start
+        stop = (last_frame - 1) * self.hop + self.nperseg - self._buffer_start
+
+        f, t, Sxx = compute_spectrogram(self._buffer[start:stop], reuse_buffers=True)
+        peaks = find_spectrogram_peaks(Sxx, columns=(self._next_frame - first_frame, core_end - first_frame))
+        points = convert_to_tf_pairs(peaks, t + first_frame * self.hop / settings.SAMPLE_RATE, f).reshape(-1, 2)
+
+        self._peaks = np.concatenate((self._peaks, points[np.argsort(points[:, 1], kind="stable")]))
+        self._next_frame = core_end
+
+        # Drop samples that no later block needs, including its left halo
+        keep_from = max(0, core_end - self.halo) * self.hop - self._buffer_start
+        self._buffer = self._buffer[keep_from:]
+        self._buffer_start += keep_from
+
+        if final:
+            return self._emit(np.inf)
+        # Frames from core_end on are unknown, so only earlier anchors have all their targets
+        known_until = (self.nperseg / 2 + core_end * self.hop) / settings.SAMPLE_RATE
+        return self._emit(known_until)
+
+    def _emit(self, known_until):
+        ready = self._peaks[:, 1] + settings.TARGET_START + settings.TARGET_T < known_until
+        hashes = generate_hash_arrays(self._peaks[ready], self.fan_out, targets=self._peaks)
+        self._peaks = self._peaks[~ready]
+        return hashes
+
+    @staticmethod
+    def _concatenate(results):
+        if not results:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+        return (np.concatenate([hashes for hashes, _ in results]),
+                np.concatenate([offsets for _, offsets in results]))
+
+
+def fingerprint_file_stream(filename, block_seconds=settings.STREAM_BLOCK_SECONDS):
+    """
+    Fingerprints a WAV file block by block without loading it completely.
+    The file is memory-mapped, so peak memory does not depend on its duration.
+
+    :param filename: Path to the WAV file.
+    :param block_seconds: Length of the audio blocks in seconds.
+    :returns: Generator of uint32 arrays (hashes, offsets), offsets relative to the start of the file.
+    """
+    sample_rate, audio_data = wavfile.read(filename, mmap=True)
+    if sample_rate != settings.SAMPLE_RATE:
+        raise ValueError(
+            f"File has sampling rate {sample_rate}, but {settings.SAMPLE_RATE} was expected."
+        )
+
+    fingerprinter = StreamingFingerprinter(block_seconds)
+    block_size = int(block_seconds * sample_rate)
+    for start in range(0, len(audio_data), block_size):
+        block = np.asarray(audio_data[start:start + block_size], dtype=np.float64)
+        if block.ndim == 2:
+            block = block.mean(axis=1)  # Convert stereo to mono
+        hashes, offsets = fingerprinter.push(block)
+        if len(hashes):
+            yield hashes, offsets
+
+    hashes, offsets = fingerprinter.flush()
+    if len(hashes):
+        yield hashes, offsets
@@ -0,0 +1,105 @@
+# hash_format.py
+
+import numpy as np
+from pipeline import settings
+
+
+class FingerprintFormat:
+    """
+    Bit layout of a packed fingerprint hash.
+
+    A hash packs the quantized frequency of the anchor, the quantized frequency of
+    the target and the quantized time delta between them into one uint32:
+
+        [ anchor frequency bin | target frequency bin | time delta ]
+
+    Offsets are stored separately as uint32 frame numbers. Hashes of different
+    versions are not comparable, so every change of the layout or the quantization
+    steps needs a new version.
+
+    :ivar version: Format version number.
+    :type version: int
+    :ivar freq_bits: Number of bits per frequency bin.
+    :type freq_bits: int
+    :ivar delta_bits: Number of bits of the time delta.
+    :type delta_bits: int
+    :ivar freq_step: Width of one frequency bin in Hz.
+    :type freq_step: float
+    :ivar time_step: Length of one time frame in seconds.
+    :type time_step: float
+    """
+    def __init__(self, version, freq_bits, delta_bits, freq_step, time_step):
+        if 2 * freq_bits + delta_bits != 32:
+            raise ValueError("A fingerprint format must use exactly 32 bits.")
+        self.version = version
+        self.freq_bits = freq_bits
+        self.delta_bits = delta_bits
+        self.freq_step = freq_step
+        self.time_step = time_step
+
+    def encode(self, anchor_freqs, target_freqs, time_deltas):
+        """
+        Packs frequencies (Hz) and time deltas (seconds) into uint32 hashes.
+
+        :param anchor_freqs: Frequencies of the anchor points.
+        :param target_freqs: Frequencies of the target points.
+        :param time_deltas: Time between anchor and target points.
+        :returns: NumPy array of uint32 hashes.
+        """
+        freq_max = (1 << self.freq_bits) - 1
+        anchor_bins = np.clip(np.floor(np.asarray(anchor_freqs) / self.freq_step), 0, freq_max).astype(np.uint32)
+        target_bins = np.clip(np.floor(np.asarray(target_freqs) / self.freq_step), 0, freq_max).astype(np.uint32)
+        deltas = np.clip(np.rint(np.asarray(time_deltas) / self.time_step), 0, (1 << self.delta_bits) - 1)
+        return (anchor_bins << (self.freq_bits + self.delta_bits)) | (target_bins << self.delta_bits) | deltas.astype(np.uint32)
+
+    def decode(self, hashes):
+        """
+        Unpacks uint32 hashes into frequencies (Hz, lower bin edge) and time deltas (seconds).
+
+        :param hashes: Array of packed hashes.
+        :returns: Arrays (anchor_freqs, target_freqs, time_deltas).
+        """
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        freq_mask = (1 << self.freq_bits) - 1
+        anchor_bins = (hashes >> (self.freq_bits + self.delta_bits)) & freq_mask
+        target_bins = (hashes >> self.delta_bits) & freq_mask
+        deltas = hashes & ((1 << self.delta_bits) - 1)
+        return anchor_bins * self.freq_step, target_bins * self.freq_step, deltas * self.time_step
+
+    def encode_offsets(self, times):
+        """
+        Converts times (seconds) to uint32 frame offsets.
+
+        :param times: Times in seconds.
+        :returns: NumPy array of uint32 frame offsets.
+        """
+        return np.rint(np.asarray(times) / self.time_step).astype(np.uint32)
+
+    def decode_offsets(self, offsets):
+        """
+        Converts uint32 frame offsets back to times in seconds.
+
+        :param offsets: Frame offsets.
+        :returns: NumPy array of times in seconds.
+        """
+        return np.asarray(offsets, dtype=np.float64) * self.time_step
+
+
+FORMATS = {
+    # 12-bit frequency bins (~5.4 Hz, close to the 5 Hz spectrogram resolution) and
+    # 8-bit time deltas in spectrogram frames (200 ms window, 1/8 overlap at 44.1 kHz)
+    1: FingerprintFormat(1, freq_bits=12, delta_bits=8, freq_step=22050 / 4096, time_step=7718 / 44100),
+}
+
+
+def get_format(version=None):
+    """
+    Returns the fingerprint format of the given version.
+
+    :param version: Format version, defaults to settings.HASH_FORMAT_VERSION.
+    :returns: FingerprintFormat instance.
+    """
+    version = settings.HASH_FORMAT_VERSION if version is None else version
+    if version not in FORMATS:
+        raise ValueError(f"Unknown fingerprint format version: {version}")
+    return FORMATS[version]
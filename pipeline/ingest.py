@@ -0,0 +1,284 @@
+# ingest.py
+#
+# Batch ingestion of an audio catalog.
+#
+#   python -m pipeline.ingest music/ --index fingerprints.idx
+#   python -m pipeline.ingest manifest.txt --dynamodb --upload
+#
+# Tracks are decoded and fingerprinted on a process pool of settings.NUM_WORKERS
+# workers. A single writer in the main process stores the results in batches and
+# records finished tracks in a state file, so an interrupted run can be restarted.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from Databank.Storage import content_key
+from pipeline import settings
+from pipeline.audioconverter import decode_audio_blocks
+from pipeline.fingerprinting import StreamingFingerprinter
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac")
+
+
+def find_tracks(source):
+    """
+    Lists the audio files to ingest.
+
+    :param source: Directory (searched recursively) or manifest file with one path per line.
+    :returns: Sorted list of file paths.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names if name.lower().endswith(AUDIO_EXTENSIONS)
+        )
+    with open(source, encoding="utf-8") as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+
+
+def fingerprint_track(path):
+    """
+    Decodes one track with ffmpeg and fingerprints it block by block. Runs in a worker process.
+
+    :param path: Path to the audio file.
+    :returns: Tuple (path, hashes, offsets, duration in seconds, error message or None).
+    """
+    try:
+        fingerprinter = StreamingFingerprinter()
+        blocks, samples = [], 0
+        for audio_block in decode_audio_blocks(path):
+            blocks.append(fingerprinter.push(audio_block))
+            samples += len(audio_block)
+        blocks.append(fingerprinter.flush())
+        hashes = np.concatenate([block[0] for block in blocks])
+        offsets = np.concatenate([block[1] for block in blocks])
+        return path, hashes, offsets, samples / settings.SAMPLE_RATE, None
+    except Exception as e:
+        return path, None, None, 0.0, str(e)
+
+
+def song_metadata(path, s3_key):
+    """Default metadata for a catalog track, derived from its file name."""
+    return {
+        "artist": "Unknown",
+        "title": os.path.splitext(os.path.basename(path))[0],
+        "album": "Unknown Album",
+        "s3_key": s3_key,
+    }
+
+
+class IndexWriter:
+    """
+    Writes fingerprints to a local FingerprintIndex and saves it on every flush.
+    """
+    def __init__(self, index_path):
+        from Databank.Fingerprint_Index import FingerprintIndex
+        from Databank.Song_Id_Allocator import LocalSongIdAllocator
+        self.index = FingerprintIndex(index_path)
+        self.song_id_allocator = LocalSongIdAllocator(
+            index_path + ".ids", block_size=settings.SONG_ID_BLOCK_SIZE,
+            seed=self.index.max_song_id
+        )
+        self.pending_hashes = 0
+
+    def next_song_id(self):
+        return self.song_id_allocator.next_id()
+
+    def has_song(self, song_id):
+        return self.index.contains_song(song_id)
+
+    def add(self, song_id, path, hashes, offsets):
+        self.index.add(song_id, hashes, offsets)
+        self.pending_hashes += len(hashes)
+
+    def flush(self):
+        self.index.save()
+        self.pending_hashes = 0
+
+
+class DynamoDBWriter:
+    """
+    Writes song metadata and fingerprints to the DynamoDB tables configured in the
+    environment (see main.py), optionally uploading the audio files to S3.
+
+    Metadata rows are buffered together with their fingerprints and written in the
+    same flush, fingerprints first, so a song only shows up in the songs table once
+    it can be recognized.
+    """
+    def __init__(self, upload=False):
+        from Databank.Amazon_DynamoDB import AmazonDBConnectivity
+        from Databank.Amazon_S3 import S3Manager
+        from Databank.Song_Id_Allocator import DynamoDBSongIdAllocator
+        credentials = (os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY"), os.getenv("AWS_REGION"))
+        self.songs = AmazonDBConnectivity(*credentials, os.getenv("AWS_TABLE_NAME_SONGDATA"))
+        self.hashes = AmazonDBConnectivity(*credentials, os.getenv("AWS_TABLE_NAME_HASHES"))
+        self.s3_manager = S3Manager(*credentials, os.getenv("AWS_BUCKET_NAME")) if upload else None
+        # Reserve IDs in blocks so concurrent ingesters and uploads never hand out the same ID
+        self.song_id_allocator = DynamoDBSongIdAllocator(self.songs, block_size=settings.SONG_ID_BLOCK_SIZE)
+        self.pending_songs = []
+        self.pending_items = []
+        self.pending_hashes = 0
+
+    def next_song_id(self):
+        return self.song_id_allocator.next_id()
+
+    def has_song(self, song_id):
+        # The metadata row is written after all fingerprints of the song
+        return self.songs.get_item({"SongID": str(song_id)}) is not None
+
+    def add(self, song_id, path, hashes, offsets):
+        with open(path, "rb") as audio_file:
+            data = audio_file.read()
+        metadata = song_metadata(path, content_key(data, path))  # Same object names as app uploads
+        if self.s3_manager:
+            self.s3_manager.upload_bytes(data, metadata["s3_key"])
+        self.pending_songs.append(dict(metadata, SongID=str(song_id)))
+        self.pending_items.extend(
+            {"Hash": hash_value, "Offset": offset, "SongID": str(song_id)}
+            for hash_value, offset in zip(hashes.tolist(), offsets.tolist())
+        )
+        self.pending_hashes = len(self.pending_items)
+
+    def flush(self):
+        self.hashes.batch_insert_items(self.pending_items, max_workers=8)
+        self.songs.batch_insert_items(self.pending_songs)
+        self.pending_songs = []
+        self.pending_items = []
+        self.pending_hashes = 0
+
+
+def load_state(state_path):
+    """
+    Reads the state file of a previous run.
+
+    Every checkpoint records its tracks as "pending" before the writer is flushed and
+    as "done" afterwards. Tracks still pending were interrupted during or right after
+    a flush. On resume, those the writer already holds completely (see has_song) are
+    only marked as done; the others are ingested again under the same Song ID.
+
+    :param state_path: JSON-lines state file.
+    :returns: Tuple (set of finished tracks, dictionary track -> Song ID of interrupted tracks).
+    """
+    done, pending = set(), {}
+    if not os.path.exists(state_path):
+        return done, pending
+    with open(state_path, encoding="utf-8") as state_file:
+        for line in state_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("status", "done") == "done":
+                done.add(record["path"])
+                pending.pop(record["path"], None)
+            else:
+                pending[record["path"]] = record["song_id"]
+    return done, pending
+
+
+def ingest(tracks, writer, state_path, num_workers=settings.NUM_WORKERS, flush_hashes=200_000):
+    """
+    Fingerprints tracks on a process pool and stores them through a single writer.
+
+    :param tracks: List of audio file paths.
+    :param writer: IndexWriter or DynamoDBWriter.
+    :param state_path: JSON-lines file recording stored tracks (used to resume, see load_state).
+    :param num_workers: Number of worker processes.
+    :param flush_hashes: Number of buffered hashes after which the writer is flushed.
+    :returns: Dictionary with the run summary.
+    """
+    done, interrupted = load_state(state_path)
+    todo = [path for path in tracks if path not in done]
+    # Interrupted tracks whose flush completed are only recorded as done, never added twice
+    completed = []
+    for path in todo:
+        if path in interrupted and writer.has_song(interrupted[path]):
+            completed.append({"path": path, "song_id": interrupted.pop(path)})
+    completed_paths = {track["path"] for track in completed}
+    todo = [path for path in todo if path not in completed_paths]
+    print(f"{len(tracks)} tracks, {len(tracks) - len(todo)} already ingested, {len(todo)} to go "
+          f"({len(interrupted.keys() & set(todo))} to repair).")
+
+    unrecorded = completed  # Tracks stored by the writer but not yet recorded as done
+    summary = {"tracks": 0, "failed": 0, "hashes": 0, "audio_seconds": 0.0}
+    start = time.perf_counter()
+
+    def record(state_file, status):
+        for track in unrecorded:
+            state_file.write(json.dumps(dict(track, status=status)) + "\n")
+        state_file.flush()
+        os.fsync(state_file.fileno())
+
+    def checkpoint(state_file):
+        record(state_file, "pending")  # Repaired on resume if the flush is interrupted
+        writer.flush()
+        record(state_file, "done")
+        unrecorded.clear()
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor, \
+            open(state_path, "a", encoding="utf-8") as state_file:
+        record(state_file, "done")
+        unrecorded.clear()
+        queue = iter(todo)
+        running = set()
+        while True:
+            # Keep a bounded number of tracks in flight so results never pile up
+            while len(running) < 2 * num_workers:
+                path = next(queue, None)
+                if path is None:
+                    break
+                running.add(executor.submit(fingerprint_track, path))
+            if not running:
+                break
+
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, hashes, offsets, duration, error = future.result()
+                if error:
+                    summary["failed"] += 1
+                    print(f"[!] {path}: {error}")
+                    continue
+
+                song_id = interrupted.pop(path, None) or writer.next_song_id()
+                writer.add(song_id, path, hashes, offsets)
+                unrecorded.append({"path": path, "song_id": song_id, "hashes": len(hashes)})
+                summary["tracks"] += 1
+                summary["hashes"] += len(hashes)
+                summary["audio_seconds"] += duration
+
+                elapsed = time.perf_counter() - start
+                print(f"[{summary['tracks'] + summary['failed']}/{len(todo)}] {path}: {len(hashes)} hashes "
+                      f"({summary['tracks'] / elapsed:.2f} tracks/s, {summary['hashes'] / elapsed:.0f} hashes/s)")
+
+            if writer.pending_hashes >= flush_hashes:
+                checkpoint(state_file)
+        checkpoint(state_file)
+
+    summary["seconds"] = time.perf_counter() - start
+    print(f"\n[✓] Ingested {summary['tracks']} tracks ({summary['failed']} failed) in {summary['seconds']:.1f} s")
+    print(f"    - Hashes: {summary['hashes']} ({summary['hashes'] / max(summary['seconds'], 1e-9):.0f} hashes/s)")
+    print(f"    - Audio: {summary['audio_seconds'] / 3600:.2f} h "
+          f"({summary['audio_seconds'] / max(summary['seconds'], 1e-9):.0f}x real time)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint and store a catalog of audio files.")
+    parser.add_argument("source", help="Directory of audio files or manifest with one path per line")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--index", help="Path of the local fingerprint index file")
+    target.add_argument("--dynamodb", action="store_true", help="Store in the DynamoDB tables from the environment")
+    parser.add_argument("--upload", action="store_true", help="Also upload the audio files to S3 (DynamoDB only)")
+    parser.add_argument("--state", default="ingest_state.jsonl", help="Resume file listing finished tracks")
+    parser.add_argument("--workers", type=int, default=settings.NUM_WORKERS, help="Number of worker processes")
+    args = parser.parse_args()
+
+    writer = IndexWriter(args.index) if args.index else DynamoDBWriter(upload=args.upload)
+    ingest(find_tracks(args.source), writer, args.state, num_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
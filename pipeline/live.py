@@ -0,0 +1,210 @@
+# live.py
+#
+# Recognition while recording. Audio arrives from a sounddevice.InputStream
+# callback in blocks of settings.CHUNK samples and is collected in a ring buffer.
+# Every hop the new samples are fingerprinted incrementally, only the new hashes
+# are looked up, and their votes are added to those of the earlier hops. The
+# recording stops as soon as one song is clearly ahead.
+#
+#   python -m pipeline.live --index fingerprints.idx [--wav clip.wav]
+
+import argparse
+import threading
+import time
+import numpy as np
+from scipy.io import wavfile
+from pipeline import settings
+from pipeline.fingerprinting import StreamingFingerprinter
+from pipeline.recognise import best_match, is_decisive, score_candidates
+
+
+class RingBuffer:
+    """
+    Fixed-size sample buffer written by the audio callback and read by the recognizer.
+
+    If the reader falls behind by more than the capacity, the oldest unread samples
+    are dropped, so the callback never blocks or allocates.
+
+    :ivar capacity: Number of samples the buffer holds.
+    :type capacity: int
+    """
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._written = 0  # Total number of samples written
+        self._read = 0  # Total number of samples read
+        self._lock = threading.Lock()
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        with self._lock:
+            start = self._written % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[:len(samples) - first] = samples[first:]
+            self._written += len(samples)
+
+    def read(self):
+        """
+        Returns all samples written since the last read.
+
+        :returns: 1D NumPy array (empty if nothing new arrived).
+        """
+        with self._lock:
+            self._read = max(self._read, self._written - self.capacity)  # Skip overwritten samples
+            indices = np.arange(self._read, self._written) % self.capacity
+            self._read = self._written
+            return self._data[indices]
+
+
+def microphone_stream(callback):
+    """
+    Opens the default input device as a stream of settings.CHUNK mono int16 blocks.
+
+    :param callback: sounddevice callback (indata, frames, time, status).
+    :returns: sounddevice.InputStream (use it as a context manager).
+    """
+    import sounddevice as sd  # Only needed when recording from a real device
+    return sd.InputStream(samplerate=settings.SAMPLE_RATE, channels=1, dtype="int16",
+                          blocksize=settings.CHUNK, callback=callback)
+
+
+class WavFileStream:
+    """
+    Stand-in for sounddevice.InputStream that plays a WAV file into the callback.
+
+    Blocks of settings.CHUNK samples are delivered from a background thread, in real
+    time unless ``speed`` is changed (0 delivers as fast as possible).
+
+    :ivar filename: Path to the WAV file (mono or stereo, settings.SAMPLE_RATE).
+    :type filename: str
+    """
+    def __init__(self, filename, callback, speed=1.0):
+        sample_rate, self.audio = wavfile.read(filename)
+        if sample_rate != settings.SAMPLE_RATE:
+            raise ValueError(f"File has sampling rate {sample_rate}, but {settings.SAMPLE_RATE} was expected.")
+        if self.audio.ndim == 2:
+            self.audio = self.audio.mean(axis=1).astype(np.int16)  # Convert stereo to mono
+        self.filename = filename
+        self.callback = callback
+        self.speed = speed
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._play, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _play(self):
+        start = time.monotonic()
+        for position in range(0, len(self.audio), settings.CHUNK):
+            if self._stop.is_set():
+                return
+            if self.speed:
+                delay = start + position / settings.SAMPLE_RATE / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            block = self.audio[position:position + settings.CHUNK]
+            self.callback(block.reshape(-1, 1), len(block), None, None)
+
+
+class LiveRecognizer:
+    """
+    Recognizes a song from audio that is still being recorded.
+
+    Samples are fingerprinted with a StreamingFingerprinter that processes one hop at
+    a time and only waits ``LIVE_LOOKAHEAD_FRAMES`` frames for peak context. The
+    hashes of each hop are looked up once, and the votes of all hops are scored
+    together. A song is accepted once it is clearly ahead (see is_decisive), so chance
+    votes for a song from noise or silence never stop the recording.
+
+    :ivar hashes_db: Fingerprint store providing match_hashes (AmazonDBConnectivity or FingerprintIndex).
+    :type hashes_db: AmazonDBConnectivity | FingerprintIndex
+    :ivar min_score: Minimum number of time-aligned votes to accept a song.
+    :type min_score: int
+    :ivar min_confidence: Minimum share of the query hashes that must vote for the song.
+    :type min_confidence: float
+    :ivar stop_score: Number of time-aligned votes the song needs before it is accepted.
+    :type stop_score: int
+    """
+    def __init__(self, hashes_db, hop_seconds=settings.LIVE_HOP_SECONDS, min_score=settings.MIN_MATCH_SCORE,
+                 min_confidence=settings.LIVE_MIN_CONFIDENCE, stop_score=settings.PLANNER_STOP_SCORE):
+        self.hashes_db = hashes_db
+        self.hop_seconds = hop_seconds
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+        self.stop_score = stop_score
+        self.fingerprinter = StreamingFingerprinter(hop_seconds, lookahead=settings.LIVE_LOOKAHEAD_FRAMES)
+        self.samples = 0
+        self.match = None  # Best candidate so far
+        self._votes = ([], [], [])  # Song IDs, database offsets and query offsets of all hops
+        self._query_count = 0
+
+    def process(self, samples):
+        """
+        Adds recorded samples and updates the best candidate.
+
+        :param samples: 1D NumPy array of new samples.
+        :returns: The match once it passes the thresholds and is clearly ahead, otherwise None.
+        """
+        self.samples += len(samples)
+        hashes, offsets = self.fingerprinter.push(samples)
+        if not len(hashes):
+            return None
+        song_ids, db_offsets, query_offsets, query_count = self.hashes_db.match_hashes(
+            list(zip(hashes.tolist(), offsets.tolist())))
+        for votes, new_votes in zip(self._votes, (song_ids, db_offsets, query_offsets)):
+            votes.append(np.asarray(new_votes))
+        self._query_count += query_count
+        votes = [np.concatenate(votes) for votes in self._votes]
+        self.match = best_match(*votes, self._query_count, self.min_score)
+        if self.match and self.match["Confidence"] >= self.min_confidence:
+            songs, _, counts = score_candidates(*votes)
+            if is_decisive(songs, counts, self.stop_score):
+                return self.match
+        return None
+
+    def listen(self, open_stream=microphone_stream, max_seconds=settings.LIVE_MAX_SECONDS):
+        """
+        Records until a song is recognized or ``max_seconds`` have passed.
+
+        :param open_stream: Function taking the audio callback and returning a stream
+            context manager, e.g. microphone_stream or a WavFileStream factory.
+        :param max_seconds: Maximum recording time in seconds.
+        :returns: Tuple (match or None, recorded seconds).
+        """
+        ring = RingBuffer(int(settings.SAMPLE_RATE * settings.LIVE_BUFFER_SECONDS))
+
+        def callback(indata, frames, time_info, status):
+            ring.write(indata[:, 0])
+
+        deadline = time.monotonic() + max_seconds
+        match = None
+        with open_stream(callback):
+            while match is None and time.monotonic() < deadline:
+                time.sleep(self.hop_seconds)
+                match = self.process(ring.read())
+        return match, self.samples / settings.SAMPLE_RATE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognize a song while it is being recorded.")
+    parser.add_argument("--index", required=True, help="Path of the local fingerprint index file")
+    parser.add_argument("--wav", help="Play this WAV file instead of recording from the microphone")
+    args = parser.parse_args()
+
+    from Databank.Fingerprint_Index import FingerprintIndex
+    recognizer = LiveRecognizer(FingerprintIndex(args.index))
+    open_stream = (lambda callback: WavFileStream(args.wav, callback)) if args.wav else microphone_stream
+    start = time.monotonic()
+    match, seconds = recognizer.listen(open_stream)
+    print(f"{'Match: ' + str(match) if match else 'No match'} after {seconds:.1f} s of audio "
+          f"({time.monotonic() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
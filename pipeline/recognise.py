@@ -0,0 +1,167 @@
+# recognise.py
+
+import numpy as np
+from pipeline import settings
+
+
+def unique_hash_pairs(hashes):
+    """
+    Normalizes query hashes to a list of distinct (hash, offset) integer pairs.
+
+    :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+    :returns: List of unique (hash, offset) tuples, in first-seen order.
+    """
+    pairs = {}
+    for hash_item in hashes:
+        if isinstance(hash_item, tuple):
+            pair = (int(hash_item[0]), int(hash_item[1]))
+        elif isinstance(hash_item, dict) and "Hash" in hash_item:
+            pair = (int(hash_item["Hash"]), int(hash_item.get("Offset", 0)))
+        else:
+            print("Invalid hash_item format. Skipping...")
+            continue
+        pairs[pair] = None
+    return list(pairs)
+
+
+def score_candidates(song_ids, db_offsets, query_offsets):
+    """
+    Builds an offset histogram for every candidate song.
+
+    Each matched hash votes for the difference between its offset in the stored
+    song and its offset in the query clip. Hashes of the correct song agree on
+    this difference, while random hash collisions spread over many bins.
+
+    :param song_ids: Song ID of every matched database entry.
+    :param db_offsets: Offset of every matched database entry.
+    :param query_offsets: Query offset belonging to every matched database entry.
+    :returns: Song IDs, offset differences and vote counts, sorted by vote count (highest first).
+    """
+    song_ids = np.asarray(song_ids)
+    if len(song_ids) == 0:
+        return song_ids, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    deltas = np.asarray(db_offsets, dtype=np.int64) - np.asarray(query_offsets, dtype=np.int64)
+    songs, song_index = np.unique(song_ids, return_inverse=True)
+
+    # Count votes per (song, offset difference) bin
+    bins, counts = np.unique(np.column_stack((song_index, deltas)), axis=0, return_counts=True)
+    order = np.argsort(counts, kind="stable")[::-1]
+    return songs[bins[order, 0]], bins[order, 1], counts[order]
+
+
+def best_match(song_ids, db_offsets, query_offsets, query_count, min_score=settings.MIN_MATCH_SCORE):
+    """
+    Selects the song with the largest number of time-aligned hash matches.
+
+    :param song_ids: Song ID of every matched database entry.
+    :param db_offsets: Offset of every matched database entry.
+    :param query_offsets: Query offset belonging to every matched database entry.
+    :param query_count: Number of distinct hashes in the query.
+    :param min_score: Minimum number of aligned votes needed to accept a match.
+    :returns: Dictionary with "SongID", "Offset", "Score" and "Confidence", or None if no song is good enough.
+    """
+    songs, deltas, counts = score_candidates(song_ids, db_offsets, query_offsets)
+    if len(counts) == 0 or counts[0] < min_score:
+        return None
+
+    return {
+        "SongID": str(songs[0]),
+        "Offset": int(deltas[0]),  # Position of the query inside the song
+        "Score": int(counts[0]),
+        "Confidence": min(1.0, float(counts[0]) / max(query_count, 1)),
+    }
+
+
+def expand_postings(keys, query_index, song_ids, db_offsets, pair_keys, pair_offsets):
+    """
+    Pairs every query (hash, offset) pair with the postings of its hash.
+
+    :param keys: Sorted distinct hash keys that were looked up.
+    :param query_index: Position in ``keys`` of every posting, in ascending order (as returned by lookup).
+    :param song_ids: Song ID of every posting.
+    :param db_offsets: Offset of every posting.
+    :param pair_keys: Hash key of every query pair (each must be in ``keys``).
+    :param pair_offsets: Query offset of every query pair.
+    :returns: Arrays (song_ids, db_offsets, query_offsets) with one vote per posting and pair.
+    """
+    counts = np.bincount(np.asarray(query_index, dtype=np.int64), minlength=len(keys))
+    starts_by_key = np.cumsum(counts) - counts
+    positions = np.searchsorted(keys, pair_keys)
+    starts, lengths = starts_by_key[positions], counts[positions]
+    # Expand every [start, start + length) range into posting positions
+    posting_index = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return song_ids[posting_index], db_offsets[posting_index], np.repeat(np.asarray(pair_offsets), lengths)
+
+
+def is_decisive(songs, counts, stop_score=settings.PLANNER_STOP_SCORE, margin=settings.PLANNER_MARGIN):
+    """
+    Decides whether the leading candidate can no longer be overtaken in practice.
+
+    :param songs: Song IDs of the offset bins, sorted by vote count (from score_candidates).
+    :param counts: Vote counts of the offset bins, highest first.
+    :param stop_score: Number of aligned votes the leader needs.
+    :param margin: Factor by which the leader must beat the best other song.
+    :returns: True if the search can stop.
+    """
+    if len(counts) == 0 or counts[0] < stop_score:
+        return False
+    others = counts[songs != songs[0]]
+    return counts[0] >= margin * (others[0] if len(others) else 0)
+
+
+def planned_match(lookup, hashes, document_frequency=None, min_score=settings.MIN_MATCH_SCORE,
+                  batch_size=settings.PLANNER_BATCH_SIZE):
+    """
+    Matches query hashes with as few lookups as possible.
+
+    The distinct query hashes are ranked by rarity (document frequency, i.e. the
+    number of stored postings of a hash) and looked up in rounds of growing size,
+    rarest first. Hashes that are not stored at all are skipped. After every round
+    the votes are scored, and the search stops as soon as one song is decisively
+    ahead (see is_decisive), so the long postings lists of common hashes are
+    rarely read. The search only stops once the leader also reaches ``min_score``,
+    so stopping early never rejects a song that the remaining hashes would accept.
+
+    Confidence is relative to all distinct query hashes. When the search stops
+    early, Score counts the votes collected up to that point and is a lower bound
+    of the score of a full lookup.
+
+    :param lookup: Function taking sorted distinct hash keys and returning (query_index, song_ids, offsets).
+    :param hashes: List of tuples (Hash, Offset) or dictionaries with keys "Hash" and "Offset".
+    :param document_frequency: Optional function returning the number of postings of each given key.
+        Without it the hashes are looked up in query order.
+    :param min_score: Minimum number of time-aligned matches required to accept a song.
+    :param batch_size: Number of hashes in the first round; every further round doubles it.
+    :returns: Tuple (match or None, number of distinct hashes looked up).
+    """
+    pairs = np.array(unique_hash_pairs(hashes), dtype=np.int64).reshape(-1, 2)
+    distinct = np.unique(pairs[:, 0])
+    query_count = len(distinct)
+    stop_score = max(settings.PLANNER_STOP_SCORE, min_score)
+    if document_frequency is not None:
+        frequencies = np.asarray(document_frequency(distinct))
+        order = np.argsort(frequencies, kind="stable")
+        distinct = distinct[order][frequencies[order] > 0]
+    else:
+        _, first_seen = np.unique(pairs[:, 0], return_index=True)
+        distinct = pairs[np.sort(first_seen), 0]
+
+    votes = ([], [], [])
+    looked_up = 0
+    while looked_up < len(distinct):
+        round_keys = np.sort(distinct[looked_up:looked_up + max(batch_size, looked_up)])
+        looked_up += len(round_keys)
+        round_pairs = pairs[np.isin(pairs[:, 0], round_keys)]
+        query_index, song_ids, db_offsets = lookup(round_keys)
+        for collected, new in zip(votes, expand_postings(
+                round_keys, query_index, song_ids, db_offsets, round_pairs[:, 0], round_pairs[:, 1])):
+            collected.append(new)
+
+        songs, _, counts = score_candidates(*(np.concatenate(collected) for collected in votes))
+        if is_decisive(songs, counts, stop_score):
+            break
+
+    if not looked_up:
+        return None, 0
+    return best_match(*(np.concatenate(collected) for collected in votes), query_count, min_score), looked_up
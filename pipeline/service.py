@@ -0,0 +1,304 @@
+# service.py
+#
+# Standalone recognition service, so recognition scales separately from the UI.
+#
+#   python -m pipeline.service --index fingerprints.idx [--port 8765] [--workers 4]
+#   python -m pipeline.service --dynamodb
+#
+# Endpoints (HTTP/1.1, one request per connection):
+#   POST /recognise  body: encoded audio clip (MP3, WAV, ...) -> {"match": {...} | null}
+#   POST /match      body: little-endian uint32 pairs (hash, offset) -> raw votes
+#   GET  /health     -> {"status": "ok", "pending": n}
+#
+# Clips are decoded and fingerprinted on a process pool. Hash lookups of
+# concurrent requests are collected for settings.SERVICE_BATCH_WINDOW seconds and
+# answered with a single index lookup. Requests beyond SERVICE_MAX_PENDING get
+# 503, and requests that exceed their deadline (header X-Timeout in seconds,
+# default SERVICE_TIMEOUT) get 504.
+
+import argparse
+import asyncio
+import json
+import os
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+import numpy as np
+from pipeline import settings
+from pipeline.audioconverter import decode_audio
+from pipeline.fingerprinting import StreamingFingerprinter
+from pipeline.recognise import best_match, expand_postings
+
+
+def fingerprint_clip(data):
+    """
+    Decodes and fingerprints an audio clip. Runs in a worker process.
+
+    :param data: Encoded audio as bytes.
+    :returns: uint32 arrays (hashes, offsets).
+    """
+    fingerprinter = StreamingFingerprinter()
+    hashes, offsets = zip(fingerprinter.push(decode_audio(data)), fingerprinter.flush())
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+
+class LookupBatcher:
+    """
+    Coalesces the hash lookups of concurrent requests into batched index lookups.
+
+    Each request waits in a queue. The batch loop takes everything that arrives
+    within ``window`` seconds (up to ``max_hashes`` hashes), looks up the union of
+    their distinct hashes once, and hands every request its own votes.
+
+    :ivar hashes_db: Fingerprint store with a lookup(hash_keys) method (FingerprintIndex or AmazonDBConnectivity).
+    :type hashes_db: FingerprintIndex | AmazonDBConnectivity
+    """
+    def __init__(self, hashes_db, window=settings.SERVICE_BATCH_WINDOW, max_hashes=settings.SERVICE_BATCH_HASHES):
+        self.hashes_db = hashes_db
+        self.window = window
+        self.max_hashes = max_hashes
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)  # Lookups run one batch at a time
+
+    async def match(self, hashes, offsets):
+        """
+        Looks up the hashes of one request as part of the next batch.
+
+        :param hashes: uint32 array of query hashes.
+        :param offsets: Query offsets belonging to the hashes.
+        :returns: Tuple (song_ids, db_offsets, query_offsets, query_count) as used by best_match.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((np.asarray(hashes, dtype=np.uint32), np.asarray(offsets, dtype=np.int64), future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            total = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while total < self.max_hashes and loop.time() < deadline:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                    total += len(batch[-1][0])
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [request for request in batch if not request[2].done()]  # Skip requests past their deadline
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.lookup_batch, [(hashes, offsets) for hashes, offsets, _ in batch])
+                self.batches += 1
+                for (_, _, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def lookup_batch(self, requests):
+        """
+        Answers several requests with one lookup of their distinct hashes.
+
+        :param requests: List of (hashes, offsets) arrays.
+        :returns: List of (song_ids, db_offsets, query_offsets, query_count), one per request.
+        """
+        keys = np.unique(np.concatenate([hashes for hashes, _ in requests]))
+        query_index, song_ids, db_offsets = self.hashes_db.lookup(keys)
+
+        results = []
+        for hashes, offsets in requests:
+            pairs = np.unique(np.column_stack((hashes.astype(np.int64), offsets)), axis=0)
+            votes = expand_postings(keys, query_index, song_ids, db_offsets, pairs[:, 0], pairs[:, 1])
+            results.append((*votes, len(np.unique(hashes))))
+        return results
+
+
+class RecognitionService:
+    """
+    Asyncio HTTP server answering recognition requests.
+
+    :ivar batcher: Coalesces the index lookups of concurrent requests.
+    :type batcher: LookupBatcher
+    :ivar max_pending: Number of requests handled at the same time; more are rejected with 503.
+    :type max_pending: int
+    :ivar timeout: Default deadline of a request in seconds.
+    :type timeout: float
+    """
+    def __init__(self, hashes_db, num_workers=settings.NUM_WORKERS, max_pending=settings.SERVICE_MAX_PENDING,
+                 timeout=settings.SERVICE_TIMEOUT, min_score=settings.MIN_MATCH_SCORE):
+        self.batcher = LookupBatcher(hashes_db)
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.min_score = min_score
+        self.pending = 0
+        self.port = None
+        self.executor = None
+
+    async def serve(self, host="127.0.0.1", port=settings.SERVICE_PORT, ready=None):
+        """
+        Runs the server until it is cancelled.
+
+        :param ready: Optional event (threading.Event or asyncio.Event) set once the server accepts connections.
+        """
+        self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        batch_loop = asyncio.create_task(self.batcher.run())
+        try:
+            server = await asyncio.start_server(self.handle, host, port)
+            self.port = server.sockets[0].getsockname()[1]  # Actual port when 0 was requested
+            async with server:
+                print(f"Recognition service listening on http://{host}:{self.port}")
+                if ready:
+                    ready.set()
+                await server.serve_forever()
+        finally:
+            batch_loop.cancel()
+            await asyncio.gather(batch_loop, return_exceptions=True)
+            self.executor.shutdown(cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, headers, body = await self.read_request(reader)
+            if self.pending >= self.max_pending:
+                status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many pending requests"}
+            else:
+                self.pending += 1
+                try:
+                    timeout = float(headers.get("x-timeout", self.timeout))
+                    status, payload = await asyncio.wait_for(self.route(method, path, body), timeout)
+                except asyncio.TimeoutError:
+                    status, payload = HTTPStatus.GATEWAY_TIMEOUT, {"error": "Deadline exceeded"}
+                finally:
+                    self.pending -= 1
+        except ValueError as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+        try:
+            await self.write_response(writer, status, payload)
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok", "pending": self.pending}
+        if method == "POST" and path == "/recognise":
+            loop = asyncio.get_running_loop()
+            hashes, offsets = await loop.run_in_executor(self.executor, fingerprint_clip, body)
+            votes = await self.batcher.match(hashes, offsets)
+            return HTTPStatus.OK, {"match": best_match(*votes, self.min_score)}
+        if method == "POST" and path == "/match":
+            if len(body) % 8:
+                raise ValueError("Body must contain uint32 (hash, offset) pairs.")
+            pairs = np.frombuffer(body, dtype="<u4").reshape(-1, 2)
+            song_ids, db_offsets, query_offsets, query_count = await self.batcher.match(pairs[:, 0], pairs[:, 1])
+            return HTTPStatus.OK, {"song_ids": [str(song_id) for song_id in song_ids],
+                                   "db_offsets": db_offsets.tolist(), "query_offsets": query_offsets.tolist(),
+                                   "query_count": query_count}
+        return HTTPStatus.NOT_FOUND, {"error": f"No route for {method} {path}"}
+
+    @staticmethod
+    async def read_request(reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise ValueError("Malformed request line.")
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > settings.SERVICE_MAX_BODY:
+            raise ValueError(f"Body larger than {settings.SERVICE_MAX_BODY} bytes.")
+        return method, path, headers, await reader.readexactly(length)
+
+    @staticmethod
+    async def write_response(writer, status, payload):
+        body = json.dumps(payload).encode()
+        retry = "Retry-After: 1\r\n" if status == HTTPStatus.SERVICE_UNAVAILABLE else ""
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n{retry}Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+
+class RecognitionClient:
+    """
+    Client of the recognition service, used by the Streamlit app instead of local matching.
+
+    It also provides match_hashes, so it can serve as the fingerprint store of a LiveRecognizer.
+
+    :ivar url: Base URL of the service, e.g. http://localhost:8765.
+    :type url: str
+    """
+    def __init__(self, url, timeout=settings.SERVICE_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def recognise(self, data):
+        """
+        Recognizes an encoded audio clip.
+
+        :param data: Encoded audio as bytes (MP3, WAV, ...).
+        :returns: Match dictionary, or None if no song matched.
+        """
+        return self._post("/recognise", data)["match"]
+
+    def match_hashes(self, hashes):
+        """
+        Looks up (hash, offset) pairs on the service.
+
+        :param hashes: List of (hash, offset) tuples.
+        :returns: Tuple (song_ids, db_offsets, query_offsets, query_count) as used by best_match.
+        """
+        body = np.asarray(hashes, dtype="<u4").reshape(-1, 2).tobytes()
+        votes = self._post("/match", body)
+        return (np.array(votes["song_ids"], dtype=object), np.array(votes["db_offsets"], dtype=np.int64),
+                np.array(votes["query_offsets"], dtype=np.int64), votes["query_count"])
+
+    def _post(self, path, body):
+        request = urllib.request.Request(self.url + path, data=body, method="POST",
+                                         headers={"X-Timeout": str(self.timeout)})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout + 5) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Recognition service error {e.code}: {e.read().decode(errors='replace')}") from e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the recognition service.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--index", help="Path of the local fingerprint index file")
+    source.add_argument("--sqlite", help="Path of a local SQLite database with a hashes table")
+    source.add_argument("--dynamodb", action="store_true", help="Use the DynamoDB Hashes table from the environment")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=settings.SERVICE_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of fingerprinting processes")
+    args = parser.parse_args()
+
+    if args.index:
+        from Databank.Fingerprint_Index import FingerprintIndex
+        hashes_db = FingerprintIndex(args.index)
+    elif args.sqlite:
+        from Databank.Local_Storage import SQLiteHashStore
+        hashes_db = SQLiteHashStore(args.sqlite)
+    else:
+        from Databank.Amazon_DynamoDB import AmazonDBConnectivity
+        hashes_db = AmazonDBConnectivity(os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY"),
+                                         os.getenv("AWS_REGION"), os.getenv("AWS_TABLE_NAME_HASHES"))
+    asyncio.run(RecognitionService(hashes_db, num_workers=args.workers).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,15 @@ FFT_WINDOW_SIZE = 0.2  # 20 ms
 # Size of the box for peak detection (frequency × time box)
 PEAK_BOX_SIZE = 30
 
+# Minimum log-magnitude of a peak in dB of spectrogram power (None = keep all non-silent peaks)
+PEAK_MIN_DB = None
+
+# Floating point type of the spectrogram ("float64" or "float32")
+SPECTROGRAM_DTYPE = "float64"
+
+# Largest spectrogram output buffer (in bytes) a thread keeps for reuse; longer inputs get a new array
+SPECTROGRAM_MAX_RETAINED_BYTES = 16 * 1024 * 1024
+
 # Proportion of theoretical peaks to keep (for performance vs accuracy)
 POINT_EFFICIENCY = 0.8
 
@@ -16,9 +25,78 @@ POINT_EFFICIENCY = 0.8
 TARGET_F = 4000  # Frequency height
 TARGET_T = 1.8  # Time width
 TARGET_START = 0.05  # Target start delay (in seconds)
+TARGET_FAN_OUT = None  # Maximum number of targets paired with one anchor (None = no limit)
+
+# Block length in seconds for streaming fingerprinting of long files
+STREAM_BLOCK_SECONDS = 30
+
+# Version of the packed hash format (see pipeline/hash_format.py)
+HASH_FORMAT_VERSION = 1
 
 # CHUNK (Frames per Buffer)
 CHUNK = 1024  # Default buffer size
 
 # Number of workers to use when processing audio
 NUM_WORKERS = 24
+
+# Minimum number of time-aligned hash matches required to accept a song
+MIN_MATCH_SCORE = 10
+
+# Live recognition: seconds of audio per hop, frames of peak context awaited after a hop,
+# minimum share of query hashes voting for the match, maximum recording time and ring buffer size.
+# Recorded clips of a stored song get 4-6 % of their hashes aligned from the third second on,
+# so half of that leaves room for noisy recordings. The match must also be decisive (PLANNER_*).
+LIVE_HOP_SECONDS = 0.5
+LIVE_LOOKAHEAD_FRAMES = 4
+LIVE_MIN_CONFIDENCE = 0.02
+LIVE_MAX_SECONDS = 15
+LIVE_BUFFER_SECONDS = 10
+
+# Query planner: hashes in the first lookup round (doubling afterwards), aligned votes needed
+# to stop early, and factor by which the leading song must beat the runner-up
+PLANNER_BATCH_SIZE = 64
+PLANNER_STOP_SCORE = 20
+PLANNER_MARGIN = 2.0
+
+# Local fingerprint index: new postings are appended to a delta file, which is merged into
+# the base file once it holds more than this share of the base file's postings
+INDEX_DELTA_RATIO = 0.25
+
+# Number of Song IDs a batch ingester reserves from the shared counter at once
+SONG_ID_BLOCK_SIZE = 100
+
+# Song metadata cache (shared by all app sessions): maximum entries and lifetime in seconds
+METADATA_CACHE_SIZE = 1024
+METADATA_CACHE_TTL = 300
+
+# Number of songs shown per page on the Stream page
+STREAM_PAGE_SIZE = 10
+
+# Recognition service: port, maximum concurrent requests (more get 503), default deadline
+# in seconds (504 when exceeded), largest accepted clip in bytes, and how long (seconds)
+# and up to how many hashes concurrent queries are collected into one index lookup
+SERVICE_PORT = 8765
+SERVICE_MAX_PENDING = 64
+SERVICE_TIMEOUT = 10.0
+SERVICE_MAX_BODY = 50 * 1024 * 1024
+SERVICE_BATCH_WINDOW = 0.005
+SERVICE_BATCH_HASHES = 200_000
+
+# AWS clients (shared by the whole process): connection pool size per client, TCP keep-alive,
+# and maximum attempts per request in adaptive retry mode
+AWS_MAX_POOL_CONNECTIONS = 50
+AWS_TCP_KEEPALIVE = True
+AWS_MAX_ATTEMPTS = 10
+
+# S3 uploads: size from which files are uploaded in parts, part size, and parts uploaded at once
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+S3_MAX_CONCURRENCY = 8
+
+# Presigned song URLs: lifetime in seconds, and how long before expiry a cached URL is replaced;
+# seconds a song file found in the bucket is assumed to exist, and seconds one found missing is
+# assumed to be missing, without checking again
+PRESIGNED_URL_EXPIRY = 3600
+PRESIGNED_URL_MARGIN = 300
+S3_EXISTENCE_TTL = 300
+S3_MISSING_TTL = 30
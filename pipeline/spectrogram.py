@@ -0,0 +1,118 @@
+# spectrogram.py
+
+import threading
+import numpy as np
+from scipy.signal import get_window
+from pipeline import settings
+
+
+class SpectrogramEngine:
+    """
+    Computes spectrograms for one fixed set of parameters, reusing everything between calls.
+
+    The result equals ``scipy.signal.spectrogram`` with its defaults (Tukey window with
+    alpha 0.25, constant detrending, one-sided density scaling). The window, scaling
+    factor and frequency axis are computed once, the FFT length never changes (so
+    NumPy's FFT plan cache is always hit), and frames are transformed in
+    preallocated buffers. The output buffer grows to the longest input seen, up to
+    ``settings.SPECTROGRAM_MAX_RETAINED_BYTES``; spectrograms of longer inputs get a
+    new array that is freed with the result, so long-lived threads do not keep
+    the memory of one long song.
+
+    The returned spectrogram may be a view of the engine's output buffer. It stays valid
+    only until the next call, so copy it if it must be kept. Use one engine per
+    thread (see get_spectrogram_engine).
+
+    :ivar nperseg: Window length in samples.
+    :type nperseg: int
+    :ivar hop: Distance between the starts of two frames in samples.
+    :type hop: int
+    :ivar dtype: Floating point type of the computation.
+    :type dtype: numpy.dtype
+    """
+    def __init__(self, nperseg, noverlap=None, fs=settings.SAMPLE_RATE, dtype=settings.SPECTROGRAM_DTYPE,
+                 block_frames=256):
+        self.nperseg = nperseg
+        self.hop = nperseg - (nperseg // 8 if noverlap is None else noverlap)
+        self.fs = fs
+        self.dtype = np.dtype(dtype)
+        self.block_frames = block_frames
+
+        window = get_window(("tukey", 0.25), nperseg)
+        self.window = window.astype(self.dtype)
+        self.freqs = np.fft.rfftfreq(nperseg, 1 / fs)
+
+        # Density scaling; every bin except DC (and Nyquist for even lengths) counts twice
+        scale = np.full(len(self.freqs), 2.0 / (fs * np.sum(window ** 2)))
+        scale[0] /= 2
+        if nperseg % 2 == 0:
+            scale[-1] /= 2
+        self.scale = scale.astype(self.dtype)
+
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+        self._frames = np.empty((block_frames, nperseg), dtype=self.dtype)
+        self._spectrum = np.empty((block_frames, len(self.freqs)), dtype=complex_dtype)
+        self._imag = np.empty((block_frames, len(self.freqs)), dtype=self.dtype)
+        self._output = np.empty((0, len(self.freqs)), dtype=self.dtype)  # Frames × frequencies
+
+    def frame_count(self, num_samples):
+        """Number of spectrogram frames for the given number of samples."""
+        return 0 if num_samples < self.nperseg else (num_samples - self.nperseg) // self.hop + 1
+
+    def compute(self, audio):
+        """
+        Computes the spectrogram of a signal.
+
+        :param audio: 1D NumPy array of audio samples (any numeric type).
+        :returns: Frequencies (f), timestamps (t), spectrogram data (Sxx, frequencies × frames)
+        """
+        audio = np.asarray(audio)
+        num_frames = self.frame_count(len(audio))
+        if num_frames * len(self.freqs) * self.dtype.itemsize > settings.SPECTROGRAM_MAX_RETAINED_BYTES:
+            output = np.empty((num_frames, len(self.freqs)), dtype=self.dtype)  # Too large to keep
+        else:
+            if len(self._output) < num_frames:
+                self._output = np.empty((num_frames, len(self.freqs)), dtype=self.dtype)
+            output = self._output[:num_frames]
+        segments = np.lib.stride_tricks.sliding_window_view(audio, self.nperseg)[::self.hop]
+
+        # Transform the frames in blocks, so the buffers stay small for long signals
+        for start in range(0, num_frames, self.block_frames):
+            count = min(self.block_frames, num_frames - start)
+            frames, spectrum, imag = self._frames[:count], self._spectrum[:count], self._imag[:count]
+            np.copyto(frames, segments[start:start + count], casting="unsafe")
+            frames -= frames.mean(axis=1, keepdims=True)  # Constant detrending
+            frames *= self.window
+            np.fft.rfft(frames, axis=1, out=spectrum)
+
+            power = output[start:start + count]
+            np.square(spectrum.real, out=power)
+            np.square(spectrum.imag, out=imag)
+            power += imag
+            power *= self.scale
+
+        times = (self.nperseg / 2 + self.hop * np.arange(num_frames)) / self.fs
+        return self.freqs, times, output.T
+
+
+_engines = threading.local()
+
+
+def get_spectrogram_engine(nperseg, noverlap=None, fs=settings.SAMPLE_RATE, dtype=settings.SPECTROGRAM_DTYPE):
+    """
+    Returns the calling thread's engine for the given parameters, creating it on first use.
+
+    Workers that fingerprint many files get the same engine (and buffers) for every file.
+
+    :param nperseg: Window length in samples.
+    :param noverlap: Overlap between frames in samples (None for nperseg // 8).
+    :param fs: Sample rate in Hz.
+    :param dtype: Floating point type of the computation.
+    :returns: SpectrogramEngine
+    """
+    if not hasattr(_engines, "cache"):
+        _engines.cache = {}
+    key = (nperseg, noverlap, fs, np.dtype(dtype).str)
+    if key not in _engines.cache:
+        _engines.cache[key] = SpectrogramEngine(nperseg, noverlap, fs, dtype)
+    return _engines.cache[key]
@@ -0,0 +1,13 @@
+from benchmarks.recognition import build_index, load_catalog, run_queries, summarize
+
+
+def test_recognition_benchmark_runs_offline(tmp_path):
+    """The benchmark builds a synthetic catalog and recognizes clean clips."""
+    catalog = load_catalog([], synthetic=2, seconds=30)
+    index, build = build_index(catalog, str(tmp_path / "benchmark.idx"))
+
+    report = summarize(build, run_queries(index, catalog, queries=3, clip_seconds=8, seed=0))
+
+    assert build["tracks"] == 2 and build["index_bytes"] > 0 and build["hashes_per_second"] > 0
+    assert report["distortions"]["clean"]["accuracy"] == 1.0
+    assert report["overall"]["p50_ms"] <= report["overall"]["p99_ms"]
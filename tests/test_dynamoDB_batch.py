@@ -0,0 +1,172 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from Databank.Amazon_DynamoDB import AmazonDBConnectivity
+from Databank.Song_Id_Allocator import DynamoDBSongIdAllocator
+from Databank.Song_Metadata import SongMetadataService
+from pipeline import settings
+
+REGION = "eu-central-1"
+TABLE_NAME = "HashesTest"
+
+
+@pytest.fixture
+def hashes_db(monkeypatch):
+    """Create a mocked Hashes table and a connectivity object pointing at it."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        boto3.client("dynamodb", region_name=REGION).create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "Hash", "KeyType": "HASH"},
+                {"AttributeName": "Offset", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "Hash", "AttributeType": "S"},
+                {"AttributeName": "Offset", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield AmazonDBConnectivity("testing", "testing", REGION, TABLE_NAME)
+
+
+def count_items(db):
+    return db.dynamodb_client.scan(TableName=TABLE_NAME, Select="COUNT")["Count"]
+
+
+def test_store_fingerprints_in_batches(hashes_db):
+    """All fingerprints end up in the table and duplicates are collapsed."""
+    fingerprints = [(str(i), str(i % 10)) for i in range(1000)] + [("0", "0")]
+
+    stored = hashes_db.store_fingerprints_in_hashes_table(7, fingerprints)
+
+    assert stored == 1000
+    assert count_items(hashes_db) == 1000
+
+
+def test_unprocessed_items_are_retried(hashes_db, monkeypatch):
+    """Items returned as unprocessed are written again on the next attempt."""
+    write = hashes_db.dynamodb_client.batch_write_item
+    calls = []
+
+    def throttled_write(RequestItems):
+        calls.append(RequestItems)
+        requests = RequestItems[TABLE_NAME]
+        if len(calls) == 1:
+            # Accept only the first item, report the rest as unprocessed
+            write(RequestItems={TABLE_NAME: requests[:1]})
+            return {"UnprocessedItems": {TABLE_NAME: requests[1:]}}
+        return write(RequestItems=RequestItems)
+
+    monkeypatch.setattr(hashes_db.dynamodb_client, "batch_write_item", throttled_write)
+
+    stored = hashes_db.batch_insert_items(
+        [{"Hash": str(i), "Offset": "0", "SongID": "1"} for i in range(20)], max_workers=1
+    )
+
+    assert stored == 20
+    assert len(calls) == 2
+    assert count_items(hashes_db) == 20
+
+
+def test_store_song_single_pass(hashes_db):
+    """A new song gets the next counter ID, and a clip of it is reported as a duplicate."""
+    boto3.client("dynamodb", region_name=REGION).create_table(
+        TableName="SongsTest",
+        KeySchema=[{"AttributeName": "SongID", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "SongID", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    songs_db = AmazonDBConnectivity("testing", "testing", REGION, "SongsTest")
+    songs_db.store_metadata_in_songs_table(41, {"title": "Existing"})
+    fingerprints = [(hash_value * 7, hash_value) for hash_value in range(100)]
+
+    stored, match = songs_db.store_song({"title": "New"}, fingerprints, hashes_db=hashes_db)
+    assert stored and match is None
+    assert songs_db.current_song_id == 42
+
+    clip = [(hash_value, offset - 30) for hash_value, offset in fingerprints[30:60]]
+    stored, match = songs_db.store_song({"title": "New again"}, clip, hashes_db=hashes_db)
+    assert not stored
+    assert match["SongID"] == "42"
+    assert match["Offset"] == 30
+    assert sorted(item["SongID"] for item in songs_db.fetch_item()) == ["41", "42"]
+
+
+def test_store_song_without_fingerprints_leaves_no_row(hashes_db, monkeypatch):
+    """When the fingerprints cannot be written, no song row is left behind."""
+    boto3.client("dynamodb", region_name=REGION).create_table(
+        TableName="SongsTest",
+        KeySchema=[{"AttributeName": "SongID", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "SongID", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    songs_db = AmazonDBConnectivity("testing", "testing", REGION, "SongsTest")
+    monkeypatch.setattr(hashes_db, "store_fingerprints_in_hashes_table", lambda song_id, fingerprints: 0)
+
+    stored, match = songs_db.store_song({"title": "New"}, [(7, 1), (14, 2)], hashes_db=hashes_db)
+
+    assert not stored and match is None
+    assert songs_db.fetch_item() == []
+
+
+def test_song_id_allocator_reserves_blocks(hashes_db):
+    """The counter is seeded from the existing songs and advanced by whole blocks."""
+    boto3.client("dynamodb", region_name=REGION).create_table(
+        TableName="SongsTest",
+        KeySchema=[{"AttributeName": "SongID", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "SongID", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    songs_db = AmazonDBConnectivity("testing", "testing", REGION, "SongsTest")
+    songs_db.store_metadata_in_songs_table(9, {"title": "Existing"})
+
+    ingester = DynamoDBSongIdAllocator(songs_db, block_size=10)
+    assert [ingester.next_id() for _ in range(3)] == [10, 11, 12]
+    assert songs_db.song_id_allocator.next_id() == 20
+    assert ingester.allocate_block(5) == range(21, 26)
+
+
+def test_metadata_service_reads_by_key_and_pages(hashes_db):
+    """Songs are read by SongID, cached, and listed page by page without the counter item."""
+    boto3.client("dynamodb", region_name=REGION).create_table(
+        TableName="SongsTest",
+        KeySchema=[{"AttributeName": "SongID", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "SongID", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    songs_db = AmazonDBConnectivity("testing", "testing", REGION, "SongsTest")
+    for song_id in range(1, 26):
+        songs_db.store_metadata_in_songs_table(song_id, {"title": f"Song {song_id}"})
+    songs_db.song_id_allocator.next_id()  # Creates the counter item
+    metadata = SongMetadataService(songs_db)
+    metadata.invalidate()
+
+    assert metadata.get(7)["title"] == "Song 7"
+    assert metadata.get(99) is None
+    assert set(metadata.get_many(["3", "4", "99"])) == {"3", "4"}
+
+    songs_db.store_metadata_in_songs_table(7, {"title": "Renamed"})
+    assert metadata.get(7)["title"] == "Song 7"  # Served from the cache
+    metadata.invalidate(7)
+    assert metadata.get(7)["title"] == "Renamed"
+
+    listed, start_key = [], None
+    while True:
+        songs, start_key = metadata.page(10, start_key)
+        listed.extend(song["SongID"] for song in songs)
+        if start_key is None:
+            break
+    assert sorted(listed, key=int) == [str(song_id) for song_id in range(1, 26)]
+
+
+def test_managers_share_one_client(hashes_db):
+    """Connectivity objects with the same credentials reuse one tuned client."""
+    other = AmazonDBConnectivity("testing", "testing", REGION, "SongsTest")
+    assert other.dynamodb_client is hashes_db.dynamodb_client
+    assert other.dynamodb_resource is hashes_db.dynamodb_resource
+    config = hashes_db.dynamodb_client.meta.config
+    assert config.retries["mode"] == "adaptive"
+    assert config.max_pool_connections == settings.AWS_MAX_POOL_CONNECTIONS
@@ -0,0 +1,102 @@
+import io
+import threading
+import wave
+
+import numpy as np
+import pytest
+from scipy.signal import sosfilt
+
+from equalizer.engine import EqualizerEngine, apply_preset, equalize_wav, render_wav
+from equalizer.filters import db_to_gain, design_sos, save_preset
+from equalizer.preview import render_preview
+
+
+def wav_bytes(samples, fs=44100):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(fs)
+        wav_file.writeframes(samples.astype("<i2").tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+def read_wav(buffer):
+    buffer.seek(0)
+    with wave.open(buffer, "rb") as wav_file:
+        raw = wav_file.readframes(wav_file.getnframes())
+        return np.frombuffer(raw, dtype="<i2").reshape(-1, wav_file.getnchannels())
+
+
+def test_blocks_match_whole_signal():
+    """Streaming a stereo file in small blocks gives the same result as filtering it at once."""
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal((20000, 2)) * 3000).astype(np.int16)
+    output = io.BytesIO()
+    assert equalize_wav(wav_bytes(samples), output, {"bass": 6, "treble": -6}, block_frames=1234) == 20000
+
+    expected = samples.T.astype(np.float64)
+    expected = (expected
+                + (db_to_gain(6) - 1) * sosfilt(design_sos("low", 250.0, 44100, 4), expected, axis=-1)
+                + (db_to_gain(-6) - 1) * sosfilt(design_sos("high", 4000.0, 44100, 4), expected, axis=-1))
+    assert np.array_equal(read_wav(output), np.clip(np.rint(expected.T), -32768, 32767).astype(np.int16))
+
+
+def test_flat_settings_pass_the_signal_through():
+    """With every band at 0 dB the samples are unchanged, and designs are cached."""
+    samples = np.arange(-500, 500, dtype=np.int16).reshape(-1, 2)
+    engine = EqualizerEngine(44100, {"bass": 0, "midrange": 0, "treble": 0}, channels=2)
+    assert np.array_equal(engine.process(samples), samples)
+    assert design_sos("band", (250.0, 4000.0), 44100, 4) is design_sos("band", (250.0, 4000.0), 44100, 4)
+
+
+def test_apply_saved_preset_to_files(tmp_path):
+    """A saved preset is applied to every file of a batch like a single equalize_wav call."""
+    rng = np.random.default_rng(1)
+    files = []
+    for number in range(3):
+        path = tmp_path / f"track{number}.wav"
+        path.write_bytes(wav_bytes((rng.standard_normal((5000, 2)) * 2000).astype(np.int16)).getvalue())
+        files.append(str(path))
+    preset_path = str(tmp_path / "preset.json")
+    save_preset(preset_path, {"bass": 4, "midrange": -2, "treble": 0})
+
+    written = apply_preset(files + [str(tmp_path / "missing.wav")], str(tmp_path / "out"), preset_path)
+    assert sorted(written) == files
+
+    with pytest.raises(ValueError, match="Unknown equalizer bands"):
+        apply_preset(files, str(tmp_path / "out"), {"bass": 3, "sub": 6})
+
+    expected = io.BytesIO()
+    equalize_wav(files[1], expected, {"bass": 4, "midrange": -2})
+    with open(written[files[1]], "rb") as output:
+        assert np.array_equal(read_wav(io.BytesIO(output.read())), read_wav(expected))
+
+
+def test_preview_envelope_keeps_peaks():
+    """The preview has one min/max pair per bucket and keeps single-sample peaks."""
+    samples = np.zeros((100000, 2), dtype=np.int16)
+    samples[54321, 0] = 30000
+    samples[77777, 1] = -30000
+    preview = render_preview(wav_bytes(samples), {}, width=500, spectrum=True)
+
+    assert preview["min"].shape == (500, 2) and len(preview["times"]) == 500
+    assert preview["max"][:, 0].max() == 30000 and preview["min"][:, 1].min() == -30000
+    assert preview["max"][54321 // 200, 0] == 30000
+    assert len(preview["freqs"]) == len(preview["power"]) > 0
+
+
+def test_render_wav_preview_and_cancel():
+    """The preview renders only its first seconds in memory, and a cancelled render returns None."""
+    samples = (np.random.default_rng(2).standard_normal((44100 * 3, 2)) * 2000).astype(np.int16)
+    data = wav_bytes(samples).getvalue()
+
+    preview = render_wav(data, {"treble": 3}, max_seconds=1.5)
+    full = render_wav(data, {"treble": 3})
+    assert len(read_wav(io.BytesIO(preview))) == 66150
+    assert np.array_equal(read_wav(io.BytesIO(preview)), read_wav(io.BytesIO(full))[:66150])
+
+    cancel = threading.Event()
+    cancel.set()
+    assert render_wav(data, {"treble": 3}, cancel=cancel) is None
@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+import pytest
+
+from Databank.Fingerprint_Index import FingerprintIndex
+from pipeline import settings
+from pipeline.recognise import planned_match
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "fingerprints.idx")
+
+
+def random_song(rng, size=2000):
+    keys = rng.integers(0, 2 ** 32, size, dtype=np.uint64).astype(np.uint32)
+    offsets = np.arange(size, dtype=np.uint32)
+    return keys, offsets
+
+
+def test_save_and_memory_map(index_path):
+    """A saved index is memory-mapped on load and finds the same postings."""
+    rng = np.random.default_rng(0)
+    index = FingerprintIndex(index_path)
+    songs = {song_id: random_song(rng) for song_id in range(1, 4)}
+    for song_id, (keys, offsets) in songs.items():
+        index.add(song_id, keys, offsets)
+    index.save()
+
+    loaded = FingerprintIndex(index_path)
+    assert isinstance(loaded.song_ids, np.memmap)
+    assert len(loaded) == 6000
+    assert np.all(np.diff(loaded.keys.astype(np.int64)) > 0)
+
+    keys, offsets = songs[2]
+    query_index, song_ids, db_offsets = loaded.lookup(keys[:50])
+    hits = song_ids == 2
+    assert np.array_equal(db_offsets[hits], offsets[:50][query_index[hits]])
+
+
+def test_find_song_by_hashes(index_path):
+    """A clip cut from a stored song is matched with the right offset."""
+    rng = np.random.default_rng(1)
+    index = FingerprintIndex(index_path)
+    for song_id in range(1, 6):
+        keys, offsets = random_song(rng)
+        index.store_fingerprints_in_hashes_table(song_id, list(zip(keys.tolist(), offsets.tolist())))
+        if song_id == 4:
+            clip = [(str(key), str(offset - 500)) for key, offset in zip(keys[500:700], offsets[500:700])]
+
+    match = FingerprintIndex(index_path).find_song_by_hashes(clip)
+
+    assert match["SongID"] == "4"
+    assert match["Offset"] == 500
+    assert settings.PLANNER_STOP_SCORE <= match["Score"] <= 200  # The planner stops once the song is clear
+
+
+def test_other_instance_sees_new_songs(index_path):
+    """Instances sharing a file pick up songs saved by another instance."""
+    reader = FingerprintIndex(index_path)
+    writer = FingerprintIndex(index_path)
+    writer.store_fingerprints_in_hashes_table(9, [(12345, 3), (678, 4)])
+
+    assert reader.find_song_by_hashes([(12345, 0), (678, 1)], min_score=2)["SongID"] == "9"
+
+
+def test_planner_skips_common_hashes(index_path):
+    """On a catalog full of shared hashes, the rare hashes decide the match with few lookups."""
+    rng = np.random.default_rng(2)
+    index = FingerprintIndex(index_path)
+    common = rng.integers(0, 2 ** 32, 200, dtype=np.uint64).astype(np.uint32)
+    for song_id in range(1, 201):
+        keys, offsets = random_song(rng, 500)
+        keys[::2] = rng.choice(common, 250)  # Half of every song consists of popular hashes
+        index.add(song_id, keys, offsets)
+        if song_id == 42:
+            clip = list(zip(keys.tolist(), (offsets.astype(np.int64) - 100).tolist())) * 2  # With duplicates
+
+    fetched = []
+
+    def counting_lookup(hash_keys):
+        result = index.lookup(hash_keys)
+        fetched.append(len(result[0]))
+        return result
+
+    match, looked_up = planned_match(counting_lookup, clip, index.document_frequency)
+    _, all_song_ids, _ = index.lookup(np.unique([key for key, _ in clip]))
+
+    assert match["SongID"] == "42" and match["Offset"] == 100
+    assert looked_up < 250
+    assert sum(fetched) * 10 < len(all_song_ids)
+
+
+def test_planner_respects_min_score_above_stop_score(index_path):
+    """A min_score above the stop score keeps the planner looking up hashes until it is reached."""
+    rng = np.random.default_rng(3)
+    index = FingerprintIndex(index_path)
+    keys, offsets = random_song(rng, 200)
+    index.add(1, keys, offsets)
+    clip = list(zip(keys.tolist(), offsets.tolist()))
+
+    match, looked_up = planned_match(index.lookup, clip, index.document_frequency, min_score=30, batch_size=25)
+
+    assert match["SongID"] == "1"
+    assert match["Score"] >= 30
+    assert 0 < match["Confidence"] < 1.0  # Relative to all 200 query hashes, not only those looked up
+    assert looked_up < 200
+
+
+def test_save_appends_to_delta(index_path):
+    """Small saves append to the delta file, and writers sharing the file keep each other's postings."""
+    rng = np.random.default_rng(4)
+    first, second = FingerprintIndex(index_path), FingerprintIndex(index_path)
+    first.add(1, *random_song(rng))
+    first.save()  # The first save creates the base file
+    base_stamp = os.stat(index_path).st_mtime_ns
+
+    keys_2, offsets_2 = random_song(rng, 100)
+    keys_3, offsets_3 = random_song(rng, 100)
+    second.add(2, keys_2, offsets_2)
+    first.add(3, keys_3, offsets_3)
+    second.save()
+    first.save()
+
+    assert os.stat(index_path).st_mtime_ns == base_stamp  # The base file was not rewritten
+    reader = FingerprintIndex(index_path)
+    assert len(reader) == 2200
+    assert set(reader.lookup(keys_2)[1]) == {2} and set(reader.lookup(keys_3)[1]) == {3}
+
+    reader.compact()
+    assert not os.path.exists(first.delta_path)
+    assert len(FingerprintIndex(index_path).song_ids) == 2200
+    assert set(first.lookup(keys_2)[1]) == {2}  # Other instances pick up the new base file
+
+
+def test_merge_waits_while_base_file_is_mapped_elsewhere(index_path, monkeypatch):
+    """If the base file cannot be replaced (mapped by another process on Windows), postings stay in the delta."""
+    rng = np.random.default_rng(5)
+    index = FingerprintIndex(index_path)
+    index.add(1, *random_song(rng))
+    index.save()
+    keys, offsets = random_song(rng, 100)
+    index.add(2, keys, offsets)
+
+    def mapped_elsewhere(source, target):
+        raise PermissionError("The process cannot access the file")
+
+    replace = os.replace
+    monkeypatch.setattr(os, "replace", mapped_elsewhere)
+    index.compact()
+    assert isinstance(index.song_ids, np.memmap) and len(index) == 2100
+    assert not any(name.endswith(".tmp") for name in os.listdir(os.path.dirname(index_path)))
+    assert set(FingerprintIndex(index_path).lookup(keys)[1]) == {2}
+
+    monkeypatch.setattr(os, "replace", replace)
+    index.compact()
+    assert len(index.song_ids) == 2100 and not os.path.exists(index.delta_path)
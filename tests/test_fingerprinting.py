@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pytest
+
+from pipeline import settings
+from pipeline.hash_format import get_format
+from pipeline.fingerprinting import (
+    StreamingFingerprinter, compute_spectrogram, compute_target_zone, convert_to_tf_pairs,
+    fingerprint_audio_stream, fingerprint_file, fingerprint_file_stream, find_spectrogram_peaks, generate_hash,
+    generate_hashes, pair_peaks
+)
+
+RECORDING = os.path.join(os.path.dirname(__file__), os.pardir, "recorded.wav")
+
+
+@pytest.fixture
+def audio():
+    """30 seconds of synthetic noise with a few tones."""
+    rng = np.random.default_rng(0)
+    time = np.arange(settings.SAMPLE_RATE * 30) / settings.SAMPLE_RATE
+    audio = rng.normal(0, 2000, len(time))
+    for frequency in rng.uniform(100, 8000, 12):
+        audio += 3000 * np.sin(2 * np.pi * frequency * time)
+    return audio.astype(np.int16)
+
+
+@pytest.fixture
+def peak_points(audio):
+    """Peaks of the synthetic audio."""
+    f, t, Sxx = compute_spectrogram(audio)
+    return convert_to_tf_pairs(find_spectrogram_peaks(Sxx), t, f)
+
+
+def test_pairing_matches_target_zone_scan(peak_points):
+    """The vectorized pairing produces exactly the hashes of the per-anchor scan."""
+    expected = []
+    for anchor in peak_points:
+        for target in compute_target_zone(
+                anchor, peak_points, settings.TARGET_T, settings.TARGET_F, settings.TARGET_START):
+            expected.append((generate_hash(anchor, target), int(get_format().encode_offsets(anchor[1]))))
+
+    hashes = generate_hashes(peak_points)
+
+    assert len(expected) > 0
+    assert sorted(expected) == sorted(hashes)
+
+
+def test_fan_out_limits_targets_per_anchor(peak_points):
+    """No anchor is paired with more targets than the fan-out allows."""
+    anchor_index, target_index = pair_peaks(peak_points, fan_out=2)
+
+    assert np.bincount(anchor_index).max() <= 2
+    assert np.all(peak_points[target_index, 1] > peak_points[anchor_index, 1])
+
+
+def test_hash_format_round_trip():
+    """Packed hashes decode to the quantized frequencies and time delta."""
+    hash_format = get_format()
+    hashes = hash_format.encode([440.0, 12000.0], [880.0, 50.0], [0.35, 1.75])
+    anchor_freqs, target_freqs, time_deltas = hash_format.decode(hashes)
+
+    assert hashes.dtype == np.uint32
+    assert np.allclose(anchor_freqs, [440.0, 12000.0], atol=hash_format.freq_step)
+    assert np.allclose(target_freqs, [880.0, 50.0], atol=hash_format.freq_step)
+    assert np.allclose(time_deltas, [0.35, 1.75], atol=hash_format.time_step / 2)
+
+
+def test_streaming_matches_full_track(audio, monkeypatch):
+    """Block-wise fingerprinting yields the full-track hashes when no peaks are truncated."""
+    monkeypatch.setattr(settings, "POINT_EFFICIENCY", 100)  # Same peaks per block as per track
+    expected = sorted(fingerprint_audio_stream(audio))
+
+    fingerprinter = StreamingFingerprinter(block_seconds=4)
+    hashes = []
+    for start in range(0, len(audio), 12345):
+        hashes += zip(*(array.tolist() for array in fingerprinter.push(audio[start:start + 12345])))
+    hashes += zip(*(array.tolist() for array in fingerprinter.flush()))
+
+    assert sorted(hashes) == expected
+
+
+@pytest.mark.parametrize("block_seconds", [3, 2.5, 20 * StreamingFingerprinter().hop / settings.SAMPLE_RATE])
+def test_file_stream_matches_fingerprint_file(block_seconds):
+    """Streaming a WAV file yields the hashes of fingerprint_file, also for blocks that are not a multiple of the hop."""
+    expected = sorted(fingerprint_file(RECORDING))
+
+    hashes = []
+    for block_hashes, block_offsets in fingerprint_file_stream(RECORDING, block_seconds):
+        hashes += zip(block_hashes.tolist(), block_offsets.tolist())
+
+    assert len(expected) == 555
+    assert sorted(hashes) == expected
+
+
+def test_silence_produces_no_peaks(audio):
+    """Digital silence around a clip yields no peaks, and a dB threshold drops quiet ones."""
+    padded = np.concatenate((np.zeros(settings.SAMPLE_RATE * 10), audio, np.zeros(settings.SAMPLE_RATE * 10)))
+    f, t, Sxx = compute_spectrogram(padded)
+
+    y_peaks, x_peaks = find_spectrogram_peaks(Sxx)
+    assert np.all(Sxx[y_peaks, x_peaks] > 0)
+    assert np.all(np.diff(Sxx[y_peaks, x_peaks]) <= 0)  # Loudest first
+
+    loud_y, loud_x = find_spectrogram_peaks(Sxx, min_db=40)
+    assert 0 < len(loud_y) < len(y_peaks)
+    assert np.all(10 * np.log10(Sxx[loud_y, loud_x]) > 40)
+
+
+def test_float32_spectrogram_finds_the_same_peaks(audio):
+    """Computing the spectrogram in float32 keeps the peak positions."""
+    f, t, Sxx = compute_spectrogram(audio)
+    f32, t32, Sxx32 = compute_spectrogram(audio, dtype="float32")
+
+    assert Sxx32.dtype == np.float32
+    peaks = set(map(tuple, convert_to_tf_pairs(find_spectrogram_peaks(Sxx), t, f).tolist()))
+    peaks32 = set(map(tuple, convert_to_tf_pairs(find_spectrogram_peaks(Sxx32), t32, f32).tolist()))
+    assert len(peaks & peaks32) >= 0.99 * len(peaks)
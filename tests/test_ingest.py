@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+
+from pipeline.ingest import IndexWriter, ingest, load_state
+
+
+def test_load_state_finds_interrupted_tracks(tmp_path):
+    """Tracks recorded as pending but never as done are returned with their Song ID for repair."""
+    state_path = tmp_path / "state.jsonl"
+    records = [
+        {"path": "old.mp3", "song_id": 1, "hashes": 10},  # Written before checkpoints had a status
+        {"path": "a.mp3", "song_id": 2, "hashes": 10, "status": "pending"},
+        {"path": "b.mp3", "song_id": 3, "hashes": 10, "status": "pending"},
+        {"path": "a.mp3", "song_id": 2, "hashes": 10, "status": "done"},
+    ]
+    state_path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+    done, interrupted = load_state(str(state_path))
+
+    assert done == {"old.mp3", "a.mp3"}
+    assert interrupted == {"b.mp3": 3}
+    assert load_state(str(tmp_path / "missing.jsonl")) == (set(), {})
+
+
+def test_resume_does_not_add_completed_songs_twice(tmp_path):
+    """A track whose flush finished before it was recorded as done is not stored again."""
+    writer = IndexWriter(str(tmp_path / "songs.idx"))
+    writer.add(7, "a.wav", np.arange(100, dtype=np.uint32), np.arange(100, dtype=np.uint32))
+    writer.flush()
+    state_path = tmp_path / "state.jsonl"
+    state_path.write_text(json.dumps({"path": "a.wav", "song_id": 7, "status": "pending"}) + "\n",
+                          encoding="utf-8")
+
+    summary = ingest(["a.wav"], writer, str(state_path), num_workers=1)
+
+    assert summary["tracks"] == 0 and summary["failed"] == 0  # Not fingerprinted again
+    assert len(IndexWriter(str(tmp_path / "songs.idx")).index) == 100
+    assert load_state(str(state_path)) == ({"a.wav"}, {})
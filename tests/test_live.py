@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.io import wavfile
+
+from pipeline import settings
+from pipeline.fingerprinting import StreamingFingerprinter
+from pipeline.live import LiveRecognizer, RingBuffer, WavFileStream
+from Databank.Fingerprint_Index import FingerprintIndex
+
+
+def synthetic_song(seed, seconds):
+    """Noise with tones that change every half second."""
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, 1000, settings.SAMPLE_RATE * seconds)
+    step = settings.SAMPLE_RATE // 2
+    time = np.arange(step) / settings.SAMPLE_RATE
+    for start in range(0, len(audio), step):
+        for frequency in rng.uniform(200, 6000, 4):
+            audio[start:start + step] += 4000 * np.sin(2 * np.pi * frequency * time)
+    return audio.astype(np.int16)
+
+
+def test_ring_buffer_wraps_and_drops_overrun():
+    ring = RingBuffer(5)
+    ring.write(np.arange(3))
+    assert ring.read().tolist() == [0, 1, 2]
+    ring.write(np.arange(3, 11))  # Overruns the capacity
+    assert ring.read().tolist() == [6, 7, 8, 9, 10]
+    assert len(ring.read()) == 0
+
+
+def test_live_recognizer_stops_early_on_wav_input(tmp_path):
+    """A clip played from a WAV file is recognized before the clip ends."""
+    index = FingerprintIndex(str(tmp_path / "songs.idx"))
+    for song_id in (1, 2):
+        fingerprinter = StreamingFingerprinter()
+        hashes, offsets = zip(fingerprinter.push(synthetic_song(song_id, 60)), fingerprinter.flush())
+        index.add(song_id, np.concatenate(hashes), np.concatenate(offsets))
+
+    clip_path = str(tmp_path / "clip.wav")
+    wavfile.write(clip_path, settings.SAMPLE_RATE, synthetic_song(2, 60)[30 * settings.SAMPLE_RATE:40 * settings.SAMPLE_RATE])
+
+    recognizer = LiveRecognizer(index)
+    match, seconds = recognizer.listen(lambda callback: WavFileStream(clip_path, callback, speed=4.0))
+
+    assert match["SongID"] == "2"
+    assert seconds < 8
+
+
+def test_live_recognizer_rejects_silence_and_noise(tmp_path):
+    """Silence and noise recorded for the longest allowed time are not matched to any song."""
+    index = FingerprintIndex(str(tmp_path / "songs.idx"))
+    for song_id in range(1, 6):
+        fingerprinter = StreamingFingerprinter()
+        hashes, offsets = zip(fingerprinter.push(synthetic_song(song_id, 60)), fingerprinter.flush())
+        index.add(song_id, np.concatenate(hashes), np.concatenate(offsets))
+
+    samples = settings.SAMPLE_RATE * settings.LIVE_MAX_SECONDS
+    hop = int(settings.SAMPLE_RATE * settings.LIVE_HOP_SECONDS)
+    noise = np.random.default_rng(9).normal(0, 3000, samples).astype(np.int16)
+    for audio in (np.zeros(samples, dtype=np.int16), noise, synthetic_song(7, settings.LIVE_MAX_SECONDS)):
+        recognizer = LiveRecognizer(index)
+        assert all(recognizer.process(audio[start:start + hop]) is None for start in range(0, samples, hop))
@@ -0,0 +1,120 @@
+import io
+
+import numpy as np
+import pytest
+
+from Databank.Local_Storage import LocalFileStore, SQLiteHashStore, SQLiteSongStore
+from Databank.Song_Metadata import SongMetadataService
+from Databank.Storage import UploadProgress, content_key
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / "tunescout.db")
+
+
+def random_song(rng, size=2000):
+    keys = rng.integers(0, 2 ** 32, size, dtype=np.uint64)
+    return list(zip(keys.tolist(), range(size)))
+
+
+def test_store_and_find_song(database):
+    """Songs are stored once; a clip of a stored song is matched and reported as duplicate."""
+    rng = np.random.default_rng(0)
+    songs, hashes = SQLiteSongStore(database), SQLiteHashStore(database)
+    fingerprints = [random_song(rng) for _ in range(4)]
+    for number, song in enumerate(fingerprints):
+        stored, match = songs.store_song({"title": f"Song {number}"}, song, hashes_db=hashes)
+        assert stored and match is None
+
+    clip = [(hash_value, offset - 300) for hash_value, offset in fingerprints[2][300:500]]
+    match = hashes.find_song_by_hashes(clip)
+    assert match["SongID"] == "3" and match["Offset"] == 300
+
+    stored, match = songs.store_song({"title": "Copy"}, fingerprints[2], hashes_db=hashes)
+    assert not stored and match["SongID"] == "3"
+    assert songs.get_latest_song_id() == 4
+
+
+def test_hash_lookup_matches_stored_entries(database):
+    """lookup, document_frequency and match_hashes agree with the stored fingerprints."""
+    hashes = SQLiteHashStore(database)
+    hashes.store_fingerprints_in_hashes_table(1, [(10, 0), (20, 1), (10, 5)])
+    hashes.store_fingerprints_in_hashes_table(2, [(10, 7)])
+
+    query_index, song_ids, offsets = hashes.lookup(np.array([30, 10, 20]))
+    assert query_index.tolist() == [1, 1, 1, 2]
+    assert sorted(zip(song_ids.tolist(), offsets.tolist()))[:3] == [(1, 0), (1, 1), (1, 5)]
+    assert hashes.document_frequency([30, 10, 20]).tolist() == [0, 3, 1]
+
+    song_ids, db_offsets, query_offsets, query_count = hashes.match_hashes([(10, 2), (20, 3), (10, 4)])
+    assert query_count == 2
+    assert len(song_ids) == 7  # Two query offsets of hash 10 times three entries, plus one for hash 20
+
+
+def test_song_pages_and_metadata(database):
+    """Songs are read page by page and through the metadata service."""
+    songs = SQLiteSongStore(database, table_name="songs_pages")
+    for _ in range(5):
+        songs.store_metadata_in_songs_table(songs.song_id_allocator.next_id(), {"title": "x"})
+
+    pages = list(songs.scan_pages(page_size=2))
+    assert [len(items) for items, _ in pages] == [2, 2, 1]
+    assert pages[-1][1] is None
+
+    service = SongMetadataService(songs)
+    assert service.get("4")["title"] == "x"
+    assert sorted(service.get_many(["1", "5", "9"])) == ["1", "5"]
+    page, next_key = service.page(page_size=3)
+    assert [song["SongID"] for song in page] == ["1", "2", "3"] and next_key == {"SongID": "3"}
+
+
+def test_file_store(tmp_path):
+    """Uploaded files can be read back, and paths outside the directory are rejected."""
+    files = LocalFileStore(str(tmp_path / "files"))
+    files.upload_fileobj(io.BytesIO(b"audio"), "songs/a.mp3")
+    path = files.get_presigned_url("songs/a.mp3")
+    with open(path, "rb") as file:
+        assert file.read() == b"audio"
+    assert files.get_presigned_url("songs/missing.mp3") is None
+    assert files.get_presigned_url("../outside.mp3") is None
+
+
+def test_file_store_upload_bytes(tmp_path):
+    """Stored content reports progress, and storing it again under the same name is skipped."""
+    files = LocalFileStore(str(tmp_path / "files"))
+    data = b"audio" * 1000
+    key = content_key(data, "song.wav")
+    progress = UploadProgress(len(data))
+    assert files.upload_bytes(data, key, progress) is True
+    assert progress.fraction == 1.0
+    assert files.upload_bytes(data, key) is False
+    files.delete_file(key)
+    assert not files.object_exists(key)
+
+
+def test_metadata_pages_are_trimmed(database, monkeypatch):
+    """A page never holds more than page_size songs, and failed batch reads are reported, not raised."""
+    songs = SQLiteSongStore(database, table_name="songs_trimmed")
+    for _ in range(6):
+        songs.store_metadata_in_songs_table(songs.song_id_allocator.next_id(), {"title": "x"})
+    scan_pages = songs.scan_pages
+
+    def short_first_page(page_size, start_key=None):
+        # Like a DynamoDB scan page that contained the counter item
+        items, start_key = next(scan_pages(1, start_key))
+        yield items, start_key
+        yield from scan_pages(page_size, start_key)
+
+    monkeypatch.setattr(songs, "scan_pages", short_first_page)
+    service = SongMetadataService(songs)
+    service.invalidate()
+
+    page, next_key = service.page(page_size=3)
+    assert [song["SongID"] for song in page] == ["1", "2", "3"] and next_key == {"SongID": "3"}
+
+    def unprocessed(keys):
+        raise RuntimeError("keys were still unprocessed")
+
+    monkeypatch.setattr(songs, "batch_get_items", unprocessed)
+    assert service.get_many(["5", "6"]) == {}
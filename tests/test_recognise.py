@@ -0,0 +1,40 @@
+import numpy as np
+
+from pipeline.recognise import best_match, score_candidates
+
+
+def test_aligned_votes_beat_random_collisions():
+    """The song whose matches share one offset difference should win."""
+    rng = np.random.default_rng(0)
+
+    # Song "1" matches 40 hashes at a constant offset difference of 12
+    query_offsets = list(range(40))
+    song_ids = ["1"] * 40
+    db_offsets = [offset + 12 for offset in query_offsets]
+
+    # Song "2" matches more hashes, but at random offsets
+    query_offsets += list(rng.integers(0, 40, 60))
+    song_ids += ["2"] * 60
+    db_offsets += list(rng.integers(0, 500, 60))
+
+    match = best_match(song_ids, db_offsets, query_offsets, query_count=100, min_score=10)
+
+    assert match["SongID"] == "1"
+    assert match["Offset"] == 12
+    assert match["Score"] == 40
+    assert match["Confidence"] == 0.4
+
+
+def test_no_match_below_threshold():
+    """Too few aligned votes should not produce a match."""
+    assert best_match(["1"] * 3, [5, 6, 7], [0, 1, 2], query_count=3, min_score=10) is None
+    assert best_match([], [], [], query_count=0) is None
+
+
+def test_candidates_sorted_by_votes():
+    """Candidates are returned with the strongest offset bin first."""
+    songs, deltas, counts = score_candidates(["a", "b", "b", "b"], [3, 9, 9, 4], [0, 0, 0, 0])
+
+    assert songs[0] == "b"
+    assert deltas[0] == 9
+    assert list(counts) == [2, 1, 1]
@@ -0,0 +1,101 @@
+import io
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from Databank.Amazon_S3 import S3Manager
+from Databank.Storage import UploadProgress, content_key
+
+REGION = "eu-central-1"
+BUCKET_NAME = "tunescout-test"
+
+
+@pytest.fixture
+def s3_manager(monkeypatch):
+    """Create a mocked bucket and a manager pointing at it."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        boto3.client("s3", region_name=REGION).create_bucket(
+            Bucket=BUCKET_NAME, CreateBucketConfiguration={"LocationConstraint": REGION})
+        yield S3Manager("testing", "testing", REGION, BUCKET_NAME)
+
+
+def test_upload_bytes_multipart_and_dedup(s3_manager, monkeypatch):
+    """Content is uploaded in parts with progress, and a second upload of the same content is skipped."""
+    monkeypatch.setattr(s3_manager.transfer_config, "multipart_threshold", 5 * 1024 * 1024)
+    monkeypatch.setattr(s3_manager.transfer_config, "multipart_chunksize", 5 * 1024 * 1024)
+    data = bytes(range(256)) * (12 * 1024 * 1024 // 256)
+    key = content_key(data, "Song.MP3")
+    assert key.startswith("songs/") and key.endswith(".mp3")
+
+    progress = UploadProgress(len(data))
+    assert s3_manager.upload_bytes(data, key, progress) is True
+    assert progress.fraction == 1.0
+    body = s3_manager.s3.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+    assert body == data
+
+    assert s3_manager.upload_bytes(data, key) is False
+    s3_manager.delete_file(key)
+    assert not s3_manager.object_exists(key)
+
+
+def test_presigned_urls_are_cached_until_expiry(s3_manager, monkeypatch):
+    """URLs are signed once and reused, until the cache entry expires."""
+    signed = []
+    generate_presigned_url = s3_manager.s3.generate_presigned_url
+    monkeypatch.setattr(s3_manager.s3, "generate_presigned_url",
+                        lambda *args, **kwargs: signed.append(kwargs["Params"]["Key"])
+                        or generate_presigned_url(*args, **kwargs))
+
+    urls = s3_manager.get_presigned_urls(["songs/a.mp3", "songs/b.mp3"])
+    assert s3_manager.get_presigned_url("songs/a.mp3") == urls["songs/a.mp3"]
+    assert sorted(signed) == ["songs/a.mp3", "songs/b.mp3"]
+
+    s3_manager.get_presigned_url("songs/a.mp3", expiry=60)  # Other lifetimes are not cached
+    assert len(signed) == 3
+
+    s3_manager.presigned_urls.ttl = -1  # Entries stored from now on are expired at once
+    s3_manager.presigned_urls.invalidate()
+    s3_manager.get_presigned_url("songs/a.mp3")
+    s3_manager.get_presigned_url("songs/a.mp3")
+    assert len(signed) == 5
+
+
+def test_existing_objects(s3_manager):
+    """Existence is checked with one-key listings; found keys and, for a short time, missing keys are cached."""
+    s3_manager.upload_bytes(b"a", "songs/a.mp3")
+    s3_manager.upload_fileobj(io.BytesIO(b"b"), "songs/b.mp3")
+    s3_manager.upload_bytes(b"c", "songs/c.mp3.part")  # Shares its prefix with a missing key
+    s3_manager.known_objects.invalidate("songs/b.mp3")
+    s3_manager.missing_objects.invalidate()
+
+    calls = []
+    count_call = lambda event_name, **kwargs: calls.append(event_name.rsplit(".", 1)[-1])
+    s3_manager.s3.meta.events.register("before-call.s3", count_call)
+    keys = ["songs/a.mp3", "songs/b.mp3", "songs/c.mp3"]
+    assert s3_manager.existing_objects(keys) == {"songs/a.mp3", "songs/b.mp3"}
+    assert calls == ["ListObjectsV2", "ListObjectsV2"]  # Only the keys not known yet
+    assert s3_manager.existing_objects(keys) == {"songs/a.mp3", "songs/b.mp3"}
+    assert len(calls) == 2  # The missing key is cached as well
+
+    s3_manager.missing_objects.invalidate()  # As after settings.S3_MISSING_TTL seconds
+    assert s3_manager.existing_objects(keys) == {"songs/a.mp3", "songs/b.mp3"}
+    s3_manager.s3.meta.events.unregister("before-call.s3", count_call)
+    assert len(calls) == 3
+
+    s3_manager.delete_file("songs/b.mp3")
+    assert s3_manager.existing_objects(keys) == {"songs/a.mp3"}
+    s3_manager.upload_bytes(b"c", "songs/c.mp3")
+    assert s3_manager.existing_objects(keys) == {"songs/a.mp3", "songs/c.mp3"}
+
+
+def test_upload_bytes_reports_failed_checks(s3_manager, monkeypatch):
+    """An error while checking for the object counts as a failed upload."""
+    def forbidden(**kwargs):
+        raise ClientError({"Error": {"Code": "403", "Message": "Forbidden"}}, "ListObjectsV2")
+
+    monkeypatch.setattr(s3_manager.s3, "list_objects_v2", forbidden)
+    assert s3_manager.upload_bytes(b"a", "songs/a.mp3") is None
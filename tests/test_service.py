@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from Databank.Fingerprint_Index import FingerprintIndex
+from pipeline.service import RecognitionClient, RecognitionService
+
+
+@pytest.fixture
+def service(tmp_path):
+    """A recognition service on a free port, serving an index with two songs."""
+    index = FingerprintIndex(str(tmp_path / "songs.idx"))
+    rng = np.random.default_rng(0)
+    for song_id in (1, 2):
+        index.add(song_id, rng.integers(0, 2 ** 32, 5000, dtype=np.uint32), np.arange(5000, dtype=np.uint32))
+    index.save()
+    service = RecognitionService(index, num_workers=1)
+    service.batcher.window = 0.05  # Long enough for the concurrent test requests to share a batch
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    task = loop.create_task(service.serve(port=0, ready=ready))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait(5)
+    yield service, index
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+
+
+def clip_of(index, song_id, start, count, shift):
+    """(hash, offset) pairs of part of a stored song, as heard ``shift`` frames into the clip."""
+    song = index.song_ids == song_id
+    order = np.argsort(index.offsets[song])[start:start + count]
+    keys = np.repeat(index.keys, np.diff(index.indptr).astype(np.int64))[song][order]
+    offsets = index.offsets[song][order].astype(np.int64) - start + shift
+    return list(zip(keys.tolist(), offsets.tolist()))
+
+
+def test_concurrent_queries_are_coalesced(service):
+    """Concurrent clients get their own matches from a shared lookup batch."""
+    service, index = service
+    client = RecognitionClient(f"http://127.0.0.1:{service.port}")
+    queries = [clip_of(index, song_id, 1000 * song_id, 200, 7) for song_id in (1, 2, 1, 2)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        votes = list(executor.map(client.match_hashes, queries))
+
+    for song_id, (song_ids, db_offsets, query_offsets, query_count) in zip((1, 2, 1, 2), votes):
+        assert query_count == 200
+        aligned = (song_ids == str(song_id)) & (db_offsets - query_offsets == 1000 * song_id - 7)
+        assert aligned.sum() == 200
+    assert service.batcher.batches < len(queries)
+
+
+def test_overload_and_deadline(service):
+    """Requests beyond the pending limit get 503 and requests past their deadline get 504."""
+    service, index = service
+    body = np.zeros(20, dtype="<u4").tobytes()
+    url = f"http://127.0.0.1:{service.port}/match"
+
+    request = urllib.request.Request(url, data=body, method="POST", headers={"X-Timeout": "0.000001"})
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=5)
+    assert error.value.code == 504
+
+    service.max_pending = 0
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(urllib.request.Request(url, data=body, method="POST"), timeout=5)
+    assert error.value.code == 503
+    assert json.loads(error.value.read())["error"]
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Databank.Song_Id_Allocator import LocalSongIdAllocator, SongIdAllocator
+
+
+def test_local_allocator_hands_out_unique_ids(tmp_path):
+    """Allocators sharing one counter file never return the same ID."""
+    path = str(tmp_path / "songs.ids")
+    allocators = [LocalSongIdAllocator(path, block_size=7, seed=lambda: 41) for _ in range(4)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        ids = list(executor.map(lambda i: allocators[i % 4].next_id(), range(200)))
+
+    assert len(set(ids)) == 200
+    assert min(ids) == 42
+
+
+def test_allocator_without_allocate_block_cannot_be_created():
+    """Subclasses must implement allocate_block."""
+    class Incomplete(SongIdAllocator):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from scipy.signal import spectrogram
+
+from pipeline import settings
+from pipeline.spectrogram import SpectrogramEngine, get_spectrogram_engine
+
+
+@pytest.mark.parametrize("nperseg, dtype, rtol", [(8820, "float64", 1e-10), (8820, "float32", 1e-4), (1001, "float64", 1e-10)])
+def test_engine_matches_scipy(nperseg, dtype, rtol):
+    """The engine reproduces scipy.signal.spectrogram with its default parameters."""
+    audio = np.random.default_rng(1).normal(0, 3000, settings.SAMPLE_RATE * 5 + 123).astype(np.int16)
+    engine = SpectrogramEngine(nperseg, dtype=dtype, block_frames=7)
+
+    f, t, Sxx = engine.compute(audio)
+    f_ref, t_ref, Sxx_ref = spectrogram(audio.astype(dtype), settings.SAMPLE_RATE, nperseg=nperseg)
+
+    assert Sxx.dtype == np.dtype(dtype)
+    np.testing.assert_allclose(f, f_ref)
+    np.testing.assert_allclose(t, t_ref)
+    np.testing.assert_allclose(Sxx, Sxx_ref, rtol=rtol, atol=rtol * Sxx_ref.max())
+
+
+def test_engine_is_reused_per_thread():
+    """Repeated calls with the same settings share one engine and its buffers."""
+    engine = get_spectrogram_engine(8820, dtype="float32")
+    assert get_spectrogram_engine(8820, dtype=np.float32) is engine
+    assert get_spectrogram_engine(8820, dtype="float64") is not engine
+
+    f, t, Sxx = engine.compute(np.zeros(settings.SAMPLE_RATE))
+    assert Sxx.shape == (len(f), len(t)) and not Sxx.any()
+
+
+def test_long_inputs_are_not_retained(monkeypatch):
+    """Spectrograms larger than the retention limit get their own array, and the buffer stays small."""
+    engine = SpectrogramEngine(1001)
+    short_bytes = engine.frame_count(settings.SAMPLE_RATE) * len(engine.freqs) * engine.dtype.itemsize
+    monkeypatch.setattr(settings, "SPECTROGRAM_MAX_RETAINED_BYTES", short_bytes)
+
+    _, _, short = engine.compute(np.ones(settings.SAMPLE_RATE))
+    _, _, long = engine.compute(np.ones(settings.SAMPLE_RATE * 3))
+
+    assert np.shares_memory(short, engine._output)
+    assert not np.shares_memory(long, engine._output)
+    assert engine._output.nbytes == short_bytes